@@ -0,0 +1,239 @@
+"""asyncio front end for BFFHandler.
+
+Connections are parsed on the event loop, so an idle keep-alive socket costs a
+coroutine instead of an OS thread. Each request is replayed against the normal
+BFFHandler methods on a bounded thread pool; the route modules still see the
+usual self.headers / self.send_response / self.wfile interface. Long-poll
+routes park on the event loop while they wait (see events.wait_then).
+"""
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import parse_headers
+
+from bff.db import begin_query_trace, end_query_trace
+from bff.services.events import add_waiter, remove_waiter
+from bff.services.metrics import observe
+
+KEEPALIVE_TIMEOUT = float(os.environ.get('BFF_KEEPALIVE_TIMEOUT', 75))
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = int(os.environ.get('BFF_MAX_BODY_BYTES', 20 * 1024 * 1024))
+
+class ResponseWriter(io.BytesIO):
+    """Handler wfile that buffers the response; flush() sends what is buffered so far.
+
+    Ordinary routes never flush, so their response is framed once complete.
+    Streaming routes (Server-Sent Events) flush after each event.
+    """
+
+    def __init__(self, loop, writer):
+        super().__init__()
+        self.loop = loop
+        self.writer = writer
+        self.streamed = False
+        self.sent = 0  # bytes flushed to the connection so far
+
+    def flush(self):
+        data = self.getvalue()
+        if not data:
+            return
+        self.seek(0)
+        self.truncate()
+        self.streamed = True
+        self.sent += len(data)
+        asyncio.run_coroutine_threadsafe(self.send(data), self.loop).result()
+
+    async def send(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+class BufferedRequestMixin:
+    """Replaces the socket-bound parts of BaseHTTPRequestHandler with buffers."""
+    protocol_version = 'HTTP/1.1'
+
+    def __init__(self, command, path, request_version, headers, body, client_address, wfile):
+        self.command = command
+        self.path = path
+        self.request_version = request_version
+        self.requestline = f"{command} {path} {request_version}"
+        self.headers = headers
+        self.rfile = io.BytesIO(body)
+        self.wfile = wfile
+        self.client_address = client_address
+        self.server = None
+        self.close_connection = False
+        self.parked = None
+
+    def park_until_event(self, channel, after_id, timeout, resume):
+        """Finish this request later from the event loop instead of blocking a worker."""
+        self.parked = (channel, after_id, timeout, resume)
+
+    def resume(self):
+        """Run the parked request's continuation and return the response bytes."""
+        resume = self.parked[3]
+        self.parked = None
+        # Keep counting into the trace dispatch() started before the request parked
+        begin_query_trace(self.route_name, self.query_trace)
+        try:
+            resume()
+        finally:
+            self.query_trace = end_query_trace()
+            if self.query_trace is not None:
+                self.query_trace.report()
+        return self.wfile.getvalue()
+
+    def run(self):
+        """Dispatch to do_<METHOD> and return the response bytes not yet flushed."""
+        method = getattr(self, 'do_' + self.command, None)
+        if method is None:
+            self.send_error(501, f"Unsupported method ({self.command!r})")
+        else:
+            method()
+        return self.wfile.getvalue()
+
+async def wait_for_event(channel, after_id, timeout):
+    """Sleep until channel has an event newer than after_id or timeout passes."""
+    loop = asyncio.get_running_loop()
+    woken = loop.create_future()
+
+    def wake():
+        loop.call_soon_threadsafe(lambda: woken.done() or woken.set_result(None))
+
+    if not add_waiter(channel, after_id, wake):
+        return
+    try:
+        await asyncio.wait_for(woken, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        remove_waiter(channel, wake)
+
+def simple_response(code, reason):
+    """Build a bodyless response for protocol errors raised before dispatch."""
+    return f"HTTP/1.1 {code} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode('latin-1')
+
+def frame_response(raw, keep_alive):
+    """Add the Content-Length and Connection headers keep-alive needs."""
+    head, sep, body = raw.partition(b'\r\n\r\n')
+    if not sep:
+        return simple_response(500, 'Internal Server Error')
+
+    lines = head.split(b'\r\n')
+    names = {line.split(b':', 1)[0].strip().lower() for line in lines[1:]}
+    if b'content-length' not in names:
+        lines.append(b'Content-Length: %d' % len(body))
+    if b'connection' not in names:
+        lines.append(b'Connection: keep-alive' if keep_alive else b'Connection: close')
+    return b'\r\n'.join(lines) + b'\r\n\r\n' + body
+
+class AsyncBFFServer:
+    """HTTP/1.1 server on asyncio streams that runs handlers in a thread pool."""
+
+    def __init__(self, handler_class, workers):
+        self.handler_class = type('Async' + handler_class.__name__, (BufferedRequestMixin, handler_class), {})
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bff-async')
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one connection until it closes or goes idle."""
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info('peername') or ('', 0)
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT)
+                except asyncio.LimitOverrunError:
+                    writer.write(simple_response(431, 'Request Header Fields Too Large'))
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                request_line, _, header_block = head.partition(b'\r\n')
+                try:
+                    command, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    writer.write(simple_response(400, 'Bad Request'))
+                    break
+                headers = parse_headers(io.BytesIO(header_block))
+
+                # Bodies are framed by Content-Length only; a chunked body would be read
+                # as the next request, so refuse it (and the ambiguous pair) and close.
+                if 'Transfer-Encoding' in headers:
+                    if 'Content-Length' in headers:
+                        writer.write(simple_response(400, 'Bad Request'))
+                    else:
+                        writer.write(simple_response(501, 'Not Implemented'))
+                    break
+                if len(headers.get_all('Content-Length', [])) > 1:
+                    writer.write(simple_response(400, 'Bad Request'))
+                    break
+
+                try:
+                    content_length = int(headers.get('Content-Length', 0))
+                except ValueError:
+                    content_length = -1
+                if content_length < 0 or content_length > MAX_BODY_BYTES:
+                    writer.write(simple_response(413, 'Payload Too Large'))
+                    break
+                try:
+                    body = await reader.readexactly(content_length) if content_length else b''
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                connection = headers.get('Connection', '').lower()
+                if version == 'HTTP/1.1':
+                    keep_alive = connection != 'close'
+                else:
+                    keep_alive = connection == 'keep-alive'
+
+                wfile = ResponseWriter(loop, writer)
+                handler = self.handler_class(command, path, version, headers, body, peer, wfile)
+                handler.request_started = time.perf_counter()
+                try:
+                    raw = await loop.run_in_executor(self.executor, handler.run)
+                    if handler.parked:
+                        await wait_for_event(*handler.parked[:3])
+                        raw = await loop.run_in_executor(self.executor, handler.resume)
+                except Exception as e:
+                    print(f"Error in async handler: {str(e)}", file=sys.stderr)
+                    raw = b''
+                if wfile.streamed:
+                    # Headers went out with the first flush; the stream owns the connection
+                    writer.write(raw)
+                    handler.record_metrics(headers, wfile.sent + len(raw))
+                    await writer.drain()
+                    break
+                if handler.close_connection:
+                    keep_alive = False
+
+                raw = frame_response(handler.finalize_response(raw, headers.get('Accept-Encoding')), keep_alive)
+                writer.write(raw)
+                if handler.status_code is not None:
+                    handler.record_metrics(headers, len(raw))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, port):
+        server = await asyncio.start_server(
+            self.handle_connection, None, port, limit=MAX_HEADER_BYTES, backlog=1024
+        )
+        async with server:
+            await server.serve_forever()
+
+def run_async_server(handler_class, port=3001, workers=16):
+    """Run handler_class behind the asyncio front end until interrupted."""
+    server = AsyncBFFServer(handler_class, workers)
+    print(f"Bottle Amigo BFF Server running on port {port} (async, {workers} workers)")
+    try:
+        asyncio.run(server.serve(port))
+    except KeyboardInterrupt:
+        print("\nShutting down server...")
+    finally:
+        server.executor.shutdown(wait=False)
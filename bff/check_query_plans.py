@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""Query-plan regression check.
+
+Builds a fresh schema with init_db()/migrate_db(), pulls every SQL statement
+passed to execute() in bff/routes and bff/services, runs EXPLAIN QUERY PLAN
+on it and fails if any statement full-scans a table that grows with usage.
+
+SQL built at run time is checked too: f-string {expressions} and pieces
+joined with + are rendered from SQL_TEMPLATES, and a variable is followed to
+its single assignment in the same function. Every execute() call whose SQL
+cannot be rendered that way, or whose plan cannot be explained, is a
+failure, so no query goes unchecked.
+
+    python3 bff/check_query_plans.py
+"""
+import ast
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bff.db
+from bff.services.search import fold_search_text
+
+BFF_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIRS = ['routes', 'services']
+
+# Tables that grow with users, visits or posts; a full scan of these is a bug
+LARGE_TABLES = {
+    'users', 'bottles', 'bottle_shares', 'bottle_gifts', 'amigos', 'check_ins',
+    'customer_memos', 'store_posts', 'notifications', 'bottle_history', 'amigo_qr_tokens',
+}
+
+# (file, function) pairs whose scan is known and accepted for now
+KNOWN_SCANS = set()
+
+# Stand-in SQL for the {expressions} of f-string statements, keyed by their source
+SQL_TEMPLATES = {
+    'placeholders(chunk)': '?',          # loaders: IN (...) over one chunk of IDs
+    "', '.join(updates)": 'name = ?',    # UPDATE ... SET of the changed columns (every such table has name)
+}
+
+TABLE_REF = re.compile(r'\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+SCAN_DETAIL = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?')
+
+def local_assignments(func):
+    """{name: [assigned value nodes]} for plain name assignments anywhere in func."""
+    assigned = {}
+    for node in ast.walk(func):
+        if isinstance(node, ast.Assign):
+            targets, value = node.targets, node.value
+        elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+            targets, value = [node.target], None
+        else:
+            continue
+        for target in targets:
+            if isinstance(target, ast.Name):
+                assigned.setdefault(target.id, []).append(value)
+    return assigned
+
+def render_sql(node, assigned):
+    """(SQL text of node, None), or (None, why it cannot be rendered)."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value, None
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            else:
+                sql, problem = render_sql(value.value, assigned)
+                if sql is None:
+                    return None, problem
+                parts.append(sql)
+        return ''.join(parts), None
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left, problem = render_sql(node.left, assigned)
+        if left is None:
+            return None, problem
+        right, problem = render_sql(node.right, assigned)
+        if right is None:
+            return None, problem
+        return left + right, None
+    expression = ast.unparse(node)
+    if expression in SQL_TEMPLATES:
+        return SQL_TEMPLATES[expression], None
+    values = assigned.get(expression) if isinstance(node, ast.Name) else None
+    if values and len(values) == 1 and values[0] is not None:
+        return render_sql(values[0], assigned)
+    return None, f'cannot render {expression} (add it to SQL_TEMPLATES)'
+
+class StatementCollector(ast.NodeVisitor):
+    """Finds every execute()/executemany() call, noting the function it is in."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.func_name = '<module>'
+        self.assigned = {}
+        self.statements = []
+
+    def visit_FunctionDef(self, node):
+        outer = self.func_name, self.assigned
+        self.func_name, self.assigned = node.name, local_assignments(node)
+        self.generic_visit(node)
+        self.func_name, self.assigned = outer
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        if (isinstance(node.func, ast.Attribute)
+                and node.func.attr in ('execute', 'executemany')
+                and node.args):
+            sql, problem = render_sql(node.args[0], self.assigned)
+            self.statements.append((self.file_name, node.lineno, self.func_name, sql, problem))
+        self.generic_visit(node)
+
+def collect_statements():
+    """Yield (file, line, function, sql or None, problem) for each execute() call."""
+    for sub in SOURCE_DIRS:
+        folder = os.path.join(BFF_DIR, sub)
+        for name in sorted(os.listdir(folder)):
+            if not name.endswith('.py'):
+                continue
+            with open(os.path.join(folder, name), encoding='utf-8') as f:
+                collector = StatementCollector(name)
+                collector.visit(ast.parse(f.read()))
+            yield from collector.statements
+
+def scanned_tables(sql, plan_rows):
+    """Return the real table names that the plan reads with a full SCAN."""
+    aliases = {}
+    for table, alias in TABLE_REF.findall(sql):
+        aliases[table] = table
+        if alias and alias.upper() not in ('WHERE', 'ON', 'SET', 'ORDER', 'GROUP', 'LIMIT', 'VALUES', 'LEFT', 'JOIN'):
+            aliases[alias] = table
+    tables = set()
+    for row in plan_rows:
+        match = SCAN_DETAIL.match(row[3])
+        if match:
+            name = match.group(2) or match.group(1)
+            tables.add(aliases.get(name, name))
+    return tables
+
+def main():
+    tmp_dir = tempfile.mkdtemp()
+    bff.db.DB_PATH = os.path.join(tmp_dir, 'plan_check.db')
+    bff.db.init_db()
+    bff.db.migrate_db()
+
+    conn = sqlite3.connect(bff.db.DB_PATH)
+    conn.create_function('bff_search_fold', 1, fold_search_text, deterministic=True)
+    failures = []
+    errors = []
+    checked = 0
+    for file_name, line, func_name, sql, problem in collect_statements():
+        if sql is None:
+            errors.append((file_name, line, func_name, problem))
+            continue
+        keyword = sql.strip().split(None, 1)[0].upper()
+        if keyword not in ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'WITH'):
+            continue
+        try:
+            plan = conn.execute('EXPLAIN QUERY PLAN ' + sql, [None] * sql.count('?')).fetchall()
+        except sqlite3.Error as e:
+            errors.append((file_name, line, func_name, e))
+            continue
+        checked += 1
+        large = scanned_tables(sql, plan) & LARGE_TABLES
+        if large and (file_name, func_name) not in KNOWN_SCANS:
+            failures.append((file_name, line, func_name, sorted(large), plan))
+
+    conn.close()
+
+    for file_name, line, func_name, error in errors:
+        print(f"  ? {file_name}:{line} {func_name} - {error}")
+    for file_name, line, func_name, tables, plan in failures:
+        print(f"  ✗ {file_name}:{line} {func_name} scans {', '.join(tables)}")
+        for row in plan:
+            print(f"      {row[3]}")
+    print(f"{checked} statements checked, {len(failures)} full scans of large tables, "
+          f"{len(errors)} not checked")
+    return 1 if failures or errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,319 @@
+import collections
+import functools
+import re
 import sqlite3
 import os
+import sys
+import threading
+import time
+from bff.services.search import fold_search_text
 
 # Use app directory for database
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'bottle_amigo.db')
 
-def get_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DB_PATH)
+# Reuse one connection per thread instead of reconnecting on every call
+DB_POOL_ENABLED = os.environ.get('BFF_DB_POOL', '1') != '0'
+
+# PRAGMAs applied to every new connection
+DB_PRAGMAS = {
+    'journal_mode': os.environ.get('BFF_DB_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('BFF_DB_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('BFF_DB_MMAP_SIZE', 128 * 1024 * 1024)),
+    'cache_size': int(os.environ.get('BFF_DB_CACHE_SIZE', -8000)),  # negative = KiB
+    'busy_timeout': int(os.environ.get('BFF_DB_BUSY_TIMEOUT', 5000)),  # ms
+}
+
+# Per-request statement tracing (see begin_query_trace)
+QUERY_TRACE_ENABLED = os.environ.get('BFF_QUERY_TRACE', '1') != '0'
+# Flag a request that runs the same normalized statement more than this many times
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('BFF_N_PLUS_ONE_THRESHOLD', 10))
+# Raise RepeatedQueryError instead of logging (for CI runs)
+QUERY_STRICT = os.environ.get('BFF_QUERY_STRICT', '0') == '1'
+# Statements slower than this (ms, including fetching rows) go to the slow log; 0 turns it off
+SLOW_QUERY_MS = float(os.environ.get('BFF_SLOW_QUERY_MS', 200))
+# Number of slow statements kept for GET /admin/slow-queries
+SLOW_QUERY_LOG_SIZE = int(os.environ.get('BFF_SLOW_QUERY_LOG_SIZE', 200))
+
+_local = threading.local()
+_trace_local = threading.local()
+_slow_lock = threading.Lock()
+_slow_queries = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SQL_SPACE = re.compile(r'\s+')
+
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Statement text with literals and placeholder lists folded, for grouping."""
+    sql = _SQL_SPACE.sub(' ', sql).strip()
+    sql = _SQL_LITERAL.sub('?', sql)
+    return _SQL_PLACEHOLDER_LIST.sub('(?)', sql)
+
+class RepeatedQueryError(RuntimeError):
+    """Raised in strict mode when a request repeats a statement past N_PLUS_ONE_THRESHOLD."""
+
+class QueryTrace:
+    """Statements run on this thread during one request."""
+
+    def __init__(self, label):
+        self.label = label
+        self.statements = {}  # normalized sql -> [count, seconds]
+        self.count = 0
+        self.seconds = 0.0
+        self.repeated = []  # normalized statements that went past the threshold
+
+    def record(self, sql, seconds):
+        key = normalize_sql(sql)
+        entry = self.statements.get(key)
+        if entry is None:
+            entry = self.statements[key] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        self.count += 1
+        self.seconds += seconds
+        if entry[0] == N_PLUS_ONE_THRESHOLD + 1:
+            self.repeated.append(key)
+            if QUERY_STRICT:
+                raise RepeatedQueryError(f"{self.label}: statement repeated over {N_PLUS_ONE_THRESHOLD} times: {key}")
+
+    def add_time(self, seconds):
+        """Count time spent fetching rows of the last statement."""
+        self.seconds += seconds
+
+    def report(self):
+        """Log repeated statements (likely N+1 loops) not reported yet to stderr."""
+        while self.repeated:
+            key = self.repeated.pop(0)
+            count, seconds = self.statements[key]
+            print(f"[QUERY] {self.label}: {count}x ({seconds * 1000:.1f} ms) {key}", file=sys.stderr)
+
+def begin_query_trace(label, trace=None):
+    """Start recording this thread's statements for one request (or carry on with trace)."""
+    if QUERY_TRACE_ENABLED:
+        _trace_local.trace = trace or QueryTrace(label)
+
+def end_query_trace():
+    """Stop recording and return the QueryTrace (None when tracing is off)."""
+    trace = getattr(_trace_local, 'trace', None)
+    _trace_local.trace = None
+    return trace
+
+def _redact(value):
+    """Describe a bound parameter without its value."""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, memoryview)):
+        return f'<blob {len(value)}>'
+    if isinstance(value, str):
+        return f'<text {len(value)}>'
+    return f'<{type(value).__name__}>'
+
+def _query_plan(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN detail lines for sql, run on conn outside the trace."""
+    if parameters is None:
+        return []
+    try:
+        # sqlite3.Connection.execute uses a plain cursor, so this is not traced itself
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error as e:
+        return [f'unavailable: {e}']
+    return [row[3] for row in rows]
+
+def _log_slow_query(conn, statement):
+    """Capture a statement that went over SLOW_QUERY_MS; returns its ring-buffer entry."""
+    trace = getattr(_trace_local, 'trace', None)
+    parameters = statement.parameters
+    if isinstance(parameters, dict):
+        redacted = {key: _redact(value) for key, value in parameters.items()}
+    elif parameters is None:
+        redacted = None
+    else:
+        redacted = [_redact(value) for value in parameters]
+    entry = {
+        'at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'route': trace.label if trace is not None else threading.current_thread().name,
+        'ms': round(statement.seconds * 1000, 2),
+        'rows': statement.rows,
+        'sql': normalize_sql(statement.sql),
+        'params': redacted,
+        'plan': _query_plan(conn, statement.sql, parameters),
+    }
+    with _slow_lock:
+        _slow_queries.append(entry)
+    print(f"[SLOW] {entry['route']}: {entry['ms']} ms {entry['sql']}", file=sys.stderr)
+    return entry
+
+def slow_queries():
+    """Captured slow statements, newest first."""
+    with _slow_lock:
+        return list(reversed(_slow_queries))
+
+class _Statement:
+    """The statement a TracedCursor last ran, with time and rows so far."""
+    __slots__ = ('sql', 'parameters', 'seconds', 'rows', 'entry')
+
+    def __init__(self, sql, parameters, seconds, rows):
+        self.sql = sql
+        self.parameters = parameters
+        self.seconds = seconds
+        self.rows = rows
+        self.entry = None  # slow-log entry once over the threshold
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times its statements into the current request's QueryTrace.
+
+    Time spent fetching rows counts towards the statement too, since SQLite
+    does most of a SELECT's work while stepping through its results. A
+    statement whose total goes over SLOW_QUERY_MS is captured in the slow
+    log; its entry keeps updating as further rows are fetched.
+    """
+    statement = None
+
+    def _ran(self, sql, parameters, seconds):
+        trace = getattr(_trace_local, 'trace', None)
+        if trace is not None:
+            trace.record(sql, seconds)
+        self.statement = _Statement(sql, parameters, seconds, max(self.rowcount, 0))
+        self._check_slow()
+
+    def _fetched(self, rows, seconds):
+        trace = getattr(_trace_local, 'trace', None)
+        if trace is not None:
+            trace.add_time(seconds)
+        statement = self.statement
+        if statement is not None:
+            statement.seconds += seconds
+            statement.rows += rows
+            self._check_slow()
+
+    def _check_slow(self):
+        statement = self.statement
+        if not SLOW_QUERY_MS or statement.seconds * 1000 < SLOW_QUERY_MS:
+            return
+        if statement.entry is None:
+            statement.entry = _log_slow_query(self.connection, statement)
+        else:
+            statement.entry['ms'] = round(statement.seconds * 1000, 2)
+            statement.entry['rows'] = statement.rows
+
+    def _timed(self):
+        return SLOW_QUERY_MS or getattr(_trace_local, 'trace', None) is not None
+
+    def execute(self, sql, parameters=()):
+        if not self._timed():
+            return super().execute(sql, parameters)
+        start = time.perf_counter()
+        result = super().execute(sql, parameters)
+        self._ran(sql, parameters, time.perf_counter() - start)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        if not self._timed():
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        self._ran(sql, None, time.perf_counter() - start)
+        return result
+
+    def fetchone(self):
+        if not self._timed():
+            return super().fetchone()
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(row is not None, time.perf_counter() - start)
+        return row
+
+    def fetchall(self):
+        if not self._timed():
+            return super().fetchall()
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), time.perf_counter() - start)
+        return rows
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose cursors (including conn.execute shortcuts) are TracedCursors."""
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def _connect():
+    """Open and tune a new connection."""
+    conn = sqlite3.connect(DB_PATH, factory=TracedConnection)
     conn.row_factory = sqlite3.Row
     conn.isolation_level = None  # Autocommit mode
+    for name, value in DB_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    # Used by the user search triggers (migration 8)
+    conn.create_function('bff_search_fold', 1, fold_search_text, deterministic=True)
     return conn
 
+class PooledConnection:
+    """Handle to the calling thread's connection; close() releases it instead of closing."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        # Never leave a half-finished transaction on a shared connection
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+def reset_pool():
+    """Forget this process's pooled connections (used after fork)."""
+    global _local
+    _local = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reset_pool)
+
+def get_connection():
+    """Get a database connection (reused per thread when pooling is enabled)."""
+    if not DB_POOL_ENABLED:
+        return _connect()
+
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_PATH:
+        conn = _connect()
+        _local.conn = conn
+        _local.path = DB_PATH
+    elif conn.in_transaction:
+        # A request that raised before close() left its transaction open
+        conn.rollback()
+    return PooledConnection(conn)
+
+# Secondary indexes for the WHERE / ORDER BY clauses used by bff/routes and
+# bff/services. Verify with: python3 bff/check_query_plans.py
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_check_ins_store_status ON check_ins(store_id, status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_check_ins_store_user ON check_ins(store_id, user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_check_ins_user_status ON check_ins(user_id, status, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bottles_owner ON bottles(owner_user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bottles_store_owner ON bottles(store_id, owner_user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bottle_shares_bottle ON bottle_shares(bottle_id, active, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bottle_shares_shared_to ON bottle_shares(shared_to_user_id, active, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bottle_shares_store_owner ON bottle_shares(store_id, owner_user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_amigos_requester ON amigos(requester_user_id, store_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_amigos_target ON amigos(target_user_id, store_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_customer_memos_store_user ON customer_memos(store_id, user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_store_posts_store ON store_posts(store_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bottle_history_bottle ON bottle_history(bottle_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_bottle_masters_store ON bottle_masters(store_id, name)",
+    "CREATE INDEX IF NOT EXISTS idx_staff_accounts_store_pin ON staff_accounts(store_id, pin)",
+    "CREATE INDEX IF NOT EXISTS idx_store_staff_shifts_store_date ON store_staff_shifts(store_id, date)",
+]
+
 def init_db():
     """Initialize the database with schema (creates tables if missing)."""
     conn = get_connection()
@@ -137,96 +440,14 @@ def init_db():
     conn.commit()
     conn.close()
 
-def migrate_db():
-    """Migrate existing database with new columns and tables."""
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Add new columns to users table
-    new_user_columns = [
-        ('nickname', 'TEXT'),
-        ('avatar_base64', 'TEXT'),
-        ('birthday_month', 'INTEGER'),
-        ('birthday_day', 'INTEGER'),
-        ('birthday_public', 'INTEGER DEFAULT 0'),
-        ('bio', 'TEXT')
-    ]
-
-    for col_name, col_type in new_user_columns:
-        try:
-            cursor.execute(f"ALTER TABLE users ADD COLUMN {col_name} {col_type}")
-        except sqlite3.OperationalError:
-            # Column already exists
-            pass
-
-    # Add new columns to stores table
-    try:
-        cursor.execute("ALTER TABLE stores ADD COLUMN logo_base64 TEXT")
-    except sqlite3.OperationalError:
-        # Column already exists
-        pass
-
-    # Add capacity_ml and remaining_ml columns to bottles table
-    bottle_ml_columns = [
-        ('capacity_ml', 'INTEGER DEFAULT 750'),
-        ('remaining_ml', 'INTEGER DEFAULT 750'),
-    ]
-    for col_name, col_type in bottle_ml_columns:
-        try:
-            cursor.execute(f"ALTER TABLE bottles ADD COLUMN {col_name} {col_type}")
-        except sqlite3.OperationalError:
-            pass
-
-    # Migrate existing bottles: set remaining_ml based on remaining_pct if remaining_ml is still default
-    try:
-        cursor.execute("""
-            UPDATE bottles
-            SET remaining_ml = CAST(remaining_pct * capacity_ml / 100.0 AS INTEGER)
-            WHERE remaining_ml = capacity_ml AND remaining_pct < 100
-        """)
-    except sqlite3.OperationalError:
-        pass
-
-    # Add capacity_ml to bottle_history
-    bottle_history_columns = [
-        ('previous_ml', 'INTEGER'),
-        ('new_ml', 'INTEGER'),
-    ]
-    for col_name, col_type in bottle_history_columns:
-        try:
-            cursor.execute(f"ALTER TABLE bottle_history ADD COLUMN {col_name} {col_type}")
-        except sqlite3.OperationalError:
-            pass
-
-    # Add add_ml to bottle_gifts
-    try:
-        cursor.execute("ALTER TABLE bottle_gifts ADD COLUMN add_ml INTEGER")
-    except sqlite3.OperationalError:
-        pass
-
-    # Add new columns to staff_accounts table
-    staff_columns = [
-        ('last_login_at', 'TEXT'),
-        ('is_active', 'INTEGER DEFAULT 1'),
-    ]
-    for col_name, col_type in staff_columns:
-        try:
-            cursor.execute(f"ALTER TABLE staff_accounts ADD COLUMN {col_name} {col_type}")
-        except sqlite3.OperationalError:
-            pass
-
-    # Add bottle_master_id to bottles table
-    try:
-        cursor.execute("ALTER TABLE bottles ADD COLUMN bottle_master_id TEXT")
-    except sqlite3.OperationalError:
-        pass
-
-    # Add image_base64 to bottles table (for individual bottle image override)
-    try:
-        cursor.execute("ALTER TABLE bottles ADD COLUMN image_base64 TEXT")
-    except sqlite3.OperationalError:
-        pass
+def add_column(cursor, table, column, column_type):
+    """Add a column unless the table already has it."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row['name'] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
 
+def migrate_001_legacy_schema(cursor):
+    """Columns and tables that used to be re-applied on every boot."""
     # Create new tables
     tables = [
         """CREATE TABLE IF NOT EXISTS user_notification_settings (
@@ -253,16 +474,302 @@ def migrate_db():
           capacity_ml INTEGER NOT NULL DEFAULT 750,
           image_base64 TEXT,
           created_at TEXT DEFAULT (datetime('now'))
-        )"""
+        )""",
+        """CREATE TABLE IF NOT EXISTS amigo_qr_tokens (
+          token TEXT PRIMARY KEY,
+          user_id TEXT NOT NULL,
+          store_id TEXT NOT NULL DEFAULT '',
+          created_at INTEGER NOT NULL,
+          used INTEGER DEFAULT 0
+        )""",
     ]
-
     for table_sql in tables:
+        cursor.execute(table_sql)
+
+    # Add new columns to users table
+    add_column(cursor, 'users', 'nickname', 'TEXT')
+    add_column(cursor, 'users', 'avatar_base64', 'TEXT')
+    add_column(cursor, 'users', 'birthday_month', 'INTEGER')
+    add_column(cursor, 'users', 'birthday_day', 'INTEGER')
+    add_column(cursor, 'users', 'birthday_public', 'INTEGER DEFAULT 0')
+    add_column(cursor, 'users', 'bio', 'TEXT')
+
+    # Add new columns to stores table
+    add_column(cursor, 'stores', 'logo_base64', 'TEXT')
+
+    # Add capacity_ml and remaining_ml columns to bottles table
+    add_column(cursor, 'bottles', 'capacity_ml', 'INTEGER DEFAULT 750')
+    add_column(cursor, 'bottles', 'remaining_ml', 'INTEGER DEFAULT 750')
+
+    # Migrate existing bottles: set remaining_ml based on remaining_pct if remaining_ml is still default
+    cursor.execute("""
+        UPDATE bottles
+        SET remaining_ml = CAST(remaining_pct * capacity_ml / 100.0 AS INTEGER)
+        WHERE remaining_ml = capacity_ml AND remaining_pct < 100
+    """)
+
+    # Add ml columns to bottle_history
+    add_column(cursor, 'bottle_history', 'previous_ml', 'INTEGER')
+    add_column(cursor, 'bottle_history', 'new_ml', 'INTEGER')
+
+    # Add add_ml to bottle_gifts
+    add_column(cursor, 'bottle_gifts', 'add_ml', 'INTEGER')
+
+    # Add new columns to staff_accounts table
+    add_column(cursor, 'staff_accounts', 'last_login_at', 'TEXT')
+    add_column(cursor, 'staff_accounts', 'is_active', 'INTEGER DEFAULT 1')
+
+    # Add bottle_master_id and image_base64 (individual bottle image override) to bottles table
+    add_column(cursor, 'bottles', 'bottle_master_id', 'TEXT')
+    add_column(cursor, 'bottles', 'image_base64', 'TEXT')
+
+    # Add store_id to amigo_qr_tokens created by older request handlers
+    add_column(cursor, 'amigo_qr_tokens', 'store_id', "TEXT NOT NULL DEFAULT ''")
+
+def migrate_002_indexes(cursor):
+    """Secondary indexes for hot lookups."""
+    for index_sql in INDEXES:
+        cursor.execute(index_sql)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_amigo_qr_tokens_created ON amigo_qr_tokens(created_at)")
+
+def migrate_003_notification_payloads(cursor):
+    """Backfill store_id, storeName and userName into notification payloads.
+
+    New notifications are written fully resolved (see services/notification.py);
+    this brings older rows to the same shape so reads need no lookups.
+    """
+    cursor.execute("""
+        UPDATE notifications
+        SET payload_json = json_set(payload_json, '$.store_id',
+            (SELECT store_id FROM bottles WHERE id = json_extract(payload_json, '$.bottle_id')))
+        WHERE json_type(payload_json, '$.store_id') IS NULL
+          AND EXISTS (SELECT 1 FROM bottles WHERE id = json_extract(payload_json, '$.bottle_id'))
+    """)
+    cursor.execute("""
+        UPDATE notifications
+        SET payload_json = json_set(payload_json, '$.storeName',
+            (SELECT name FROM stores WHERE id = json_extract(payload_json, '$.store_id')))
+        WHERE json_type(payload_json, '$.storeName') IS NULL
+          AND EXISTS (SELECT 1 FROM stores WHERE id = json_extract(payload_json, '$.store_id'))
+    """)
+    cursor.execute("""
+        UPDATE notifications
+        SET payload_json = json_set(payload_json, '$.userName',
+            (SELECT COALESCE(NULLIF(nickname, ''), name) FROM users WHERE id = json_extract(payload_json, '$.user_id')))
+        WHERE json_type(payload_json, '$.userName') IS NULL
+          AND EXISTS (SELECT 1 FROM users WHERE id = json_extract(payload_json, '$.user_id'))
+    """)
+
+def migrate_004_outbox(cursor):
+    """Durable job queue for background work (services/outbox.py)."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          kind TEXT NOT NULL,
+          args_json TEXT NOT NULL DEFAULT '{}',
+          attempts INTEGER NOT NULL DEFAULT 0,
+          last_error TEXT,
+          available_at TEXT DEFAULT (datetime('now')),
+          created_at TEXT DEFAULT (datetime('now'))
+        )
+    """)
+
+def migrate_005_notification_read_cursors(cursor):
+    """Per-user "read up to" time for timelines merged at read time."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS notification_read_cursors (
+          user_id TEXT PRIMARY KEY REFERENCES users(id),
+          read_at TEXT NOT NULL
+        )
+    """)
+
+# Image columns that hold a '/media/<hash>' URL from version 6 on
+MEDIA_COLUMNS = [
+    ('users', 'avatar_base64'),
+    ('stores', 'logo_base64'),
+    ('bottle_masters', 'image_base64'),
+    ('bottles', 'image_base64'),
+]
+
+def migrate_006_media(cursor):
+    """Move inline base64 images into the content-addressed media table.
+
+    Each column keeps its name but now holds the image's /media/<hash> URL
+    (see services/media.py). Values that do not decode are left as they were.
+    """
+    from bff.services.media import decode_image, put_media, media_url
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS media (
+          hash TEXT PRIMARY KEY,
+          content_type TEXT NOT NULL,
+          size INTEGER NOT NULL,
+          data BLOB NOT NULL,
+          created_at TEXT DEFAULT (datetime('now'))
+        )
+    """)
+    for table, column in MEDIA_COLUMNS:
+        cursor.execute(f"""
+            SELECT DISTINCT {column} AS value FROM {table}
+            WHERE {column} IS NOT NULL AND {column} != '' AND {column} NOT LIKE '/media/%'
+        """)
+        for row in cursor.fetchall():
+            try:
+                url = media_url(put_media(cursor, *decode_image(row['value'])))
+            except ValueError:
+                continue
+            cursor.execute(f"UPDATE {table} SET {column} = ? WHERE {column} = ?", (url, row['value']))
+
+def migrate_007_media_variants(cursor):
+    """Thumbnails and other resized copies of media, themselves stored in media."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS media_variants (
+          hash TEXT NOT NULL REFERENCES media(hash),
+          variant TEXT NOT NULL,
+          variant_hash TEXT NOT NULL REFERENCES media(hash),
+          PRIMARY KEY (hash, variant)
+        )
+    """)
+
+def migrate_008_user_search(cursor):
+    """FTS5 trigram index over folded user names, nicknames and emails.
+
+    user_search_keys gives each user a stable integer key (users has no
+    INTEGER PRIMARY KEY, so its rowid may change on VACUUM) plus the folded
+    text, indexed for prefix matches too short for trigrams. users_search is
+    an external-content FTS5 table over it. Triggers keep both in step with
+    users; they call bff_search_fold(), so users can only be written through
+    connections from _connect().
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_search_keys (
+          search_id INTEGER PRIMARY KEY,
+          user_id TEXT NOT NULL UNIQUE,
+          name_key TEXT,
+          nickname_key TEXT,
+          email_key TEXT
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_search_keys_name ON user_search_keys(name_key)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_search_keys_nickname ON user_search_keys(nickname_key)")
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_search USING fts5(
+          name_key, nickname_key, email_key,
+          content='user_search_keys', content_rowid='search_id', tokenize='trigram'
+        )
+    """)
+
+    # users -> user_search_keys
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_search_insert AFTER INSERT ON users BEGIN
+          INSERT INTO user_search_keys (user_id, name_key, nickname_key, email_key)
+          VALUES (new.id, bff_search_fold(new.name), bff_search_fold(new.nickname), bff_search_fold(new.email));
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_search_update AFTER UPDATE OF name, nickname, email ON users BEGIN
+          UPDATE user_search_keys
+          SET name_key = bff_search_fold(new.name), nickname_key = bff_search_fold(new.nickname),
+              email_key = bff_search_fold(new.email)
+          WHERE user_id = old.id;
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS users_search_delete AFTER DELETE ON users BEGIN
+          DELETE FROM user_search_keys WHERE user_id = old.id;
+        END
+    """)
+
+    # user_search_keys -> users_search (the usual external-content triggers)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_search_keys_insert AFTER INSERT ON user_search_keys BEGIN
+          INSERT INTO users_search (rowid, name_key, nickname_key, email_key)
+          VALUES (new.search_id, new.name_key, new.nickname_key, new.email_key);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_search_keys_update AFTER UPDATE ON user_search_keys BEGIN
+          INSERT INTO users_search (users_search, rowid, name_key, nickname_key, email_key)
+          VALUES ('delete', old.search_id, old.name_key, old.nickname_key, old.email_key);
+          INSERT INTO users_search (rowid, name_key, nickname_key, email_key)
+          VALUES (new.search_id, new.name_key, new.nickname_key, new.email_key);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS user_search_keys_delete AFTER DELETE ON user_search_keys BEGIN
+          INSERT INTO users_search (users_search, rowid, name_key, nickname_key, email_key)
+          VALUES ('delete', old.search_id, old.name_key, old.nickname_key, old.email_key);
+        END
+    """)
+
+    cursor.execute("""
+        INSERT OR IGNORE INTO user_search_keys (user_id, name_key, nickname_key, email_key)
+        SELECT id, bff_search_fold(name), bff_search_fold(nickname), bff_search_fold(email) FROM users
+    """)
+
+# Ordered schema migrations: (version, description, function).
+# Append new entries; never edit or reorder an applied one.
+MIGRATIONS = [
+    (1, 'legacy columns and tables', migrate_001_legacy_schema),
+    (2, 'secondary indexes', migrate_002_indexes),
+    (3, 'resolved notification payloads', migrate_003_notification_payloads),
+    (4, 'outbox table', migrate_004_outbox),
+    (5, 'notification read cursors', migrate_005_notification_read_cursors),
+    (6, 'content-addressed media', migrate_006_media),
+    (7, 'media variants', migrate_007_media_variants),
+    (8, 'user search index', migrate_008_user_search),
+]
+
+def get_schema_version(cursor):
+    """Return the applied schema version, or None if schema_version is missing."""
+    try:
+        cursor.execute("SELECT MAX(version) AS version FROM schema_version")
+    except sqlite3.OperationalError:
+        return None
+    return cursor.fetchone()['version'] or 0
+
+def migrate_db():
+    """Apply pending migrations from MIGRATIONS (one read when already current)."""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    latest = MIGRATIONS[-1][0]
+    current = get_schema_version(cursor)
+    if current == latest:
+        conn.close()
+        return
+
+    if current is None:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+              version INTEGER PRIMARY KEY,
+              description TEXT,
+              applied_at TEXT DEFAULT (datetime('now'))
+            )
+        """)
+
+    for version, description, migration in MIGRATIONS:
+        cursor.execute("BEGIN IMMEDIATE")
         try:
-            cursor.execute(table_sql)
-        except sqlite3.OperationalError:
-            pass
+            # Re-check under the write lock in case another process got here first
+            if get_schema_version(cursor) >= version:
+                cursor.execute("COMMIT")
+                continue
+            migration(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            conn.close()
+            raise
+        print(f"[MIGRATE] applied {version}: {description}")
+
+    # Refresh planner statistics after schema changes
+    cursor.execute("PRAGMA optimize")
 
-    conn.commit()
     conn.close()
 
 if __name__ == '__main__':
@@ -2,27 +2,46 @@ import hmac
 import hashlib
 import json
 import base64
+import os
+import threading
 import time
+from collections import OrderedDict
 
 SECRET_KEY = 'bottle-amigo-secret-key-2024'
 
+# When set, "Authorization: Bearer <token>" also opens the /admin routes
+OPS_TOKEN = os.environ.get('BFF_OPS_TOKEN', '')
+
+# Verified tokens remembered per process, so polling clients skip HMAC and JSON work; 0 turns it off
+TOKEN_CACHE_SIZE = int(os.environ.get('BFF_TOKEN_CACHE_SIZE', 4096))
+
+# Keyed HMAC state built once; each signature starts from a copy of it
+_signer = hmac.new(SECRET_KEY.encode(), digestmod=hashlib.sha256)
+
+_token_cache = OrderedDict()  # token -> decoded payload, least recently used first
+_token_cache_lock = threading.Lock()
+
+def sign(payload_b64):
+    """Hex HMAC-SHA256 signature of an encoded payload."""
+    mac = _signer.copy()
+    mac.update(payload_b64.encode())
+    return mac.hexdigest()
+
 def generate_token(payload):
     """Generate a token using HMAC-based approach."""
     payload['exp'] = int(time.time()) + 86400  # 24h
     payload_json = json.dumps(payload, separators=(',', ':'))
     payload_b64 = base64.urlsafe_b64encode(payload_json.encode()).decode()
-    signature = hmac.new(SECRET_KEY.encode(), payload_b64.encode(), hashlib.sha256).hexdigest()
-    return f"{payload_b64}.{signature}"
+    return f"{payload_b64}.{sign(payload_b64)}"
 
-def verify_token(token):
-    """Verify and decode a token."""
+def decode_token(token):
+    """Check a token's signature and decode its payload, without the cache."""
     try:
         parts = token.split('.')
         if len(parts) != 2:
             return None
         payload_b64, signature = parts
-        expected_sig = hmac.new(SECRET_KEY.encode(), payload_b64.encode(), hashlib.sha256).hexdigest()
-        if not hmac.compare_digest(signature, expected_sig):
+        if not hmac.compare_digest(signature, sign(payload_b64)):
             return None
         payload_json = base64.urlsafe_b64decode(payload_b64.encode()).decode()
         payload = json.loads(payload_json)
@@ -32,6 +51,34 @@ def verify_token(token):
     except Exception:
         return None
 
+def verify_token(token):
+    """Verify and decode a token; the payload must be treated as read-only.
+
+    Tokens cannot be revoked: a signed token is accepted until its exp, so a
+    changed role or a removed staff account only stops an existing token when
+    it expires. Cached entries expire at the same exp, so the cache does not
+    extend that window.
+    """
+    if not TOKEN_CACHE_SIZE:
+        return decode_token(token)
+    with _token_cache_lock:
+        payload = _token_cache.get(token)
+        if payload is not None:
+            if payload.get('exp', 0) < time.time():
+                del _token_cache[token]
+                return None
+            _token_cache.move_to_end(token)
+            return payload
+
+    # Only tokens that verify are cached, so garbage tokens cannot evict real ones
+    payload = decode_token(token)
+    if payload is not None:
+        with _token_cache_lock:
+            _token_cache[token] = payload
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return payload
+
 def require_user_auth(handler):
     """Decorator to require user authentication."""
     def wrapper(self, *args, **kwargs):
@@ -97,3 +144,28 @@ def require_mama_only(handler):
         return handler(self, *args, **kwargs)
 
     return wrapper
+
+def require_admin(handler):
+    """Decorator for /admin routes: the ops token, or a staff token with the mama role."""
+    def wrapper(self, *args, **kwargs):
+        auth_header = self.headers.get('Authorization', '')
+        if OPS_TOKEN and hmac.compare_digest(auth_header, f'Bearer {OPS_TOKEN}'):
+            return handler(self, *args, **kwargs)
+
+        payload = verify_token(auth_header[7:]) if auth_header.startswith('Bearer ') else None
+        if not payload or payload.get('type') != 'staff':
+            self.send_response(401)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': 'Invalid token'}).encode())
+            return
+        if payload.get('role') != 'mama':
+            self.send_response(403)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': 'Only mama can perform this action'}).encode())
+            return
+
+        return handler(self, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,69 @@
+"""gzip / deflate negotiation for API responses and static assets.
+
+compress_response() rewrites a complete raw HTTP response (status line,
+headers, body) so both server front ends can apply it after the route has
+written its reply. Only JSON bodies of at least GZIP_MIN_BYTES are encoded;
+streams and responses that already carry a Content-Encoding pass through.
+"""
+import gzip
+import os
+import zlib
+
+GZIP_MIN_BYTES = int(os.environ.get('BFF_GZIP_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.environ.get('BFF_GZIP_LEVEL', 6))
+
+COMPRESSIBLE_TYPES = ('application/json',)
+
+def choose_encoding(accept_encoding):
+    """Pick 'gzip' or 'deflate' from an Accept-Encoding header, or None."""
+    accepted = {}
+    for part in (accept_encoding or '').lower().split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name:
+            accepted[name] = q
+    for encoding in ('gzip', 'deflate'):
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+def encode_body(body, encoding):
+    if encoding == 'gzip':
+        return gzip.compress(body, GZIP_LEVEL, mtime=0)
+    # HTTP "deflate" is the zlib format, not raw deflate
+    return zlib.compress(body, GZIP_LEVEL)
+
+def compress_response(raw, accept_encoding):
+    """Return raw with its body compressed when the client and content allow it."""
+    head, sep, body = raw.partition(b'\r\n\r\n')
+    if not sep or len(body) < GZIP_MIN_BYTES:
+        return raw
+    encoding = choose_encoding(accept_encoding)
+    if encoding is None:
+        return raw
+
+    lines = head.split(b'\r\n')
+    content_type = b''
+    for line in lines[1:]:
+        name, _, value = line.partition(b':')
+        name = name.strip().lower()
+        if name == b'content-encoding':
+            return raw
+        if name == b'content-type':
+            content_type = value.strip().lower()
+    if not content_type.startswith(tuple(t.encode() for t in COMPRESSIBLE_TYPES)):
+        return raw
+
+    body = encode_body(body, encoding)
+    lines = [line for line in lines if not line.lower().startswith(b'content-length:')]
+    lines.append(b'Content-Encoding: ' + encoding.encode())
+    lines.append(b'Content-Length: %d' % len(body))
+    lines.append(b'Vary: Accept-Encoding')
+    return b'\r\n'.join(lines) + b'\r\n\r\n' + body
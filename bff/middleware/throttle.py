@@ -0,0 +1,159 @@
+"""Throttling of failed logins with per-key token buckets.
+
+Each key ('ip:<address>', 'email:<address>', 'store:<id>:<address>') owns a
+bucket of tokens refilled at one per LOGIN_REFILL_SECONDS. A failed attempt
+takes a token from every key involved, and an attempt is refused, before any
+SQL or password hashing runs, while any of its buckets is empty. A bucket
+that has refilled completely carries no information and is dropped by the
+periodic sweep, so memory stays proportional to recent failures.
+
+Staff PIN logins are keyed on the store and the caller's address, so a
+failing caller is slowed down without locking the store's staff out. The
+caller's address is the peer, or the X-Forwarded-For client when the peer
+is one of TRUSTED_PROXIES; when it cannot be known the address bucket is
+skipped rather than shared by every client.
+
+Buckets are per process. With BFF_LOGIN_THROTTLE_FILE set they are written
+to that file on each sweep and read back on first use after a restart.
+"""
+import ipaddress
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+# Failed attempts allowed in a burst per email or per caller at a store, and per client address
+LOGIN_BURST = int(os.environ.get('BFF_LOGIN_BURST', 5))
+LOGIN_IP_BURST = int(os.environ.get('BFF_LOGIN_IP_BURST', 20))
+# Seconds for one attempt to be given back
+LOGIN_REFILL_SECONDS = float(os.environ.get('BFF_LOGIN_REFILL_SECONDS', 60))
+THROTTLE_FILE = os.environ.get('BFF_LOGIN_THROTTLE_FILE', '')
+# Comma-separated addresses or networks of reverse proxies whose X-Forwarded-For is believed
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(entry.strip(), strict=False)
+    for entry in os.environ.get('BFF_TRUSTED_PROXIES', '').split(',') if entry.strip()
+]
+SWEEP_INTERVAL = 60
+
+_buckets = {}  # key -> (tokens, updated at)
+_lock = threading.Lock()
+_next_sweep = 0.0
+_loaded = False
+
+def _trusted(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_ip(handler):
+    """The caller's address, or None when a trusted proxy did not say who it is."""
+    peer = handler.client_address[0]
+    if not _trusted(peer):
+        return peer
+    # Proxies append, so the nearest untrusted hop is the last one that can be believed
+    hops = [hop.strip() for hop in handler.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop):
+            try:
+                return str(ipaddress.ip_address(hop))
+            except ValueError:
+                return None
+    return None
+
+def _account(value):
+    return str(value)[:254].lower()
+
+def user_login_keys(handler, email):
+    """Bucket keys for a user login: the account and, when known, the caller's address."""
+    ip = client_ip(handler)
+    keys = [f'email:{_account(email)}']
+    if ip:
+        keys.append(f'ip:{ip}')
+    return keys
+
+def staff_login_keys(handler, store_id):
+    """Bucket keys for a staff PIN login: this caller at the store and, when known, its address."""
+    ip = client_ip(handler)
+    keys = [f'store:{_account(store_id)}:{ip or "unknown"}']
+    if ip:
+        keys.append(f'ip:{ip}')
+    return keys
+
+def _burst(key):
+    return LOGIN_IP_BURST if key.startswith('ip:') else LOGIN_BURST
+
+def _level(key, now):
+    """Tokens in key's bucket at time now."""
+    entry = _buckets.get(key)
+    if entry is None:
+        return _burst(key)
+    tokens, updated = entry
+    return min(_burst(key), tokens + (now - updated) / LOGIN_REFILL_SECONDS)
+
+def retry_after(keys):
+    """Seconds until an attempt for keys is allowed (0 when it is allowed now)."""
+    now = time.time()
+    with _lock:
+        _maintain(now)
+        wait = 0.0
+        for key in keys:
+            tokens = _level(key, now)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) * LOGIN_REFILL_SECONDS)
+    return math.ceil(wait)
+
+def record_failure(keys):
+    """Take a token from each key's bucket."""
+    now = time.time()
+    with _lock:
+        for key in keys:
+            _buckets[key] = (max(_level(key, now) - 1, 0.0), now)
+
+def reset(keys):
+    """Forget the failures recorded for keys."""
+    with _lock:
+        for key in keys:
+            _buckets.pop(key, None)
+
+def login_succeeded(keys):
+    """Forget failures against the account; the caller's address keeps its own."""
+    reset([key for key in keys if not key.startswith('ip:')])
+
+def _maintain(now):
+    """Load saved buckets once, then sweep full ones (and save) every SWEEP_INTERVAL."""
+    global _next_sweep, _loaded
+    if not _loaded:
+        _loaded = True
+        if THROTTLE_FILE:
+            _load()
+    if now < _next_sweep:
+        return
+    _next_sweep = now + SWEEP_INTERVAL
+    for key in [key for key in _buckets if _level(key, now) >= _burst(key)]:
+        del _buckets[key]
+    if THROTTLE_FILE:
+        _save()
+
+def _load():
+    try:
+        with open(THROTTLE_FILE) as f:
+            saved = json.load(f)
+        for key, (tokens, updated) in saved.items():
+            _buckets[key] = (float(tokens), float(updated))
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        print(f"[THROTTLE] Could not read {THROTTLE_FILE}: {e}", file=sys.stderr)
+
+def _save():
+    tmp_path = f'{THROTTLE_FILE}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(_buckets, f, separators=(',', ':'))
+        os.replace(tmp_path, THROTTLE_FILE)
+    except OSError as e:
+        print(f"[THROTTLE] Could not write {THROTTLE_FILE}: {e}", file=sys.stderr)
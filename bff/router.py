@@ -0,0 +1,100 @@
+"""Segment-trie request router.
+
+Routes are registered once with a pattern such as
+'/store/bottles/{bottle_id}/refillToFull'. Each '/'-separated segment is a
+node in a trie, so a lookup walks the path once whatever the number of
+routes. A literal segment always wins over a parameter at the same position
+('/consumer/users/search' before '/consumer/users/{user_id}'), so the order
+routes are added in does not matter.
+
+Parameters may name a type, e.g. '{page:int}'; see CONVERTERS.
+"""
+import re
+
+_HEX = re.compile(r'^[0-9a-f]+$')
+
+def _convert_int(segment):
+    return int(segment) if segment.isdigit() else None
+
+def _convert_hex(segment):
+    return segment if _HEX.match(segment) else None
+
+# Parameter type -> function(segment) returning the value, or None if it does not match
+CONVERTERS = {
+    'str': lambda segment: segment,
+    'int': _convert_int,
+    'hex': _convert_hex,
+}
+
+class Route:
+    """A registered handler: handler(request, *path params, *extra args)."""
+
+    def __init__(self, method, pattern, handler, extra):
+        self.method = method
+        self.pattern = pattern
+        self.handler = handler
+        # Which request parts follow the path parameters: 'query' and/or 'body'
+        self.extra = extra
+        # Stable label for logs and metrics
+        self.name = f'{method} {pattern}'
+
+class _Node:
+    __slots__ = ('children', 'param', 'routes')
+
+    def __init__(self):
+        self.children = {}  # literal segment -> _Node
+        self.param = None  # (converter, _Node) for a parameter segment
+        self.routes = {}  # method -> Route
+
+class Router:
+    def __init__(self):
+        self.root = _Node()
+
+    def add(self, method, pattern, handler, *extra):
+        """Register handler for method and pattern; extra is ('query',), ('body',) or both."""
+        node = self.root
+        for segment in pattern.split('/')[1:]:
+            if segment.startswith('{') and segment.endswith('}'):
+                _, _, type_name = segment[1:-1].partition(':')
+                converter = CONVERTERS[type_name or 'str']
+                if node.param is None:
+                    node.param = (converter, _Node())
+                elif node.param[0] is not converter:
+                    raise ValueError(f'Conflicting parameter types at {pattern}')
+                node = node.param[1]
+            else:
+                node = node.children.setdefault(segment, _Node())
+        if method in node.routes:
+            raise ValueError(f'Duplicate route {method} {pattern}')
+        node.routes[method] = Route(method, pattern, handler, extra)
+
+    def match(self, method, path):
+        """Return (route, path params, allowed methods) for a request path.
+
+        route is None when nothing matches; allowed then lists the methods
+        registered for the path (empty if the path itself is unknown).
+        """
+        found = self._find(self.root, path.split('/')[1:], 0, [])
+        if found is None:
+            return None, [], []
+        node, params = found
+        route = node.routes.get(method)
+        if route is None:
+            return None, [], sorted(node.routes)
+        return route, params, []
+
+    def _find(self, node, segments, i, params):
+        if i == len(segments):
+            return (node, params) if node.routes else None
+        segment = segments[i]
+        child = node.children.get(segment)
+        if child is not None:
+            found = self._find(child, segments, i + 1, params)
+            if found is not None:
+                return found
+        if node.param is not None and segment:
+            converter, child = node.param
+            value = converter(segment)
+            if value is not None:
+                return self._find(child, segments, i + 1, params + [value])
+        return None
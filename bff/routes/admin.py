@@ -0,0 +1,51 @@
+import json
+from bff.db import SLOW_QUERY_MS, slow_queries
+from bff.middleware.auth import require_admin
+from bff.services.profiler import PROFILE_MAX_SECONDS, ProfilerBusy, collapsed, sample
+
+@require_admin
+def get_slow_queries(self):
+    """GET /admin/slow-queries - Recent statements over the slow-query threshold (newest first)."""
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Cache-Control', 'no-store')
+    self.end_headers()
+    self.wfile.write(json.dumps({
+        'thresholdMs': SLOW_QUERY_MS,
+        'queries': slow_queries(),
+    }).encode())
+
+@require_admin
+def get_profile(self, params):
+    """GET /admin/profile?seconds=N - Sample worker thread stacks for N seconds (collapsed format).
+
+    Pass idle=1 to keep threads that are waiting for work. The request holds
+    its worker for the whole run; in prefork mode it profiles one worker.
+    """
+    try:
+        seconds = float(params.get('seconds', 10))
+    except ValueError:
+        seconds = 0
+    if not 0 < seconds <= PROFILE_MAX_SECONDS:
+        self.send_response(400)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': f'seconds must be between 0 and {PROFILE_MAX_SECONDS:g}'}).encode())
+        return
+
+    try:
+        stacks = sample(seconds, include_idle=params.get('idle') == '1')
+    except ProfilerBusy as e:
+        self.send_response(409)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': str(e)}).encode())
+        return
+
+    body = collapsed(stacks).encode()
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/plain; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('Cache-Control', 'no-store')
+    self.end_headers()
+    self.wfile.write(body)
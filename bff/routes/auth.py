@@ -1,23 +1,26 @@
 import uuid
 import json
-import hashlib
-import os
 from bff.db import get_connection
+from bff.middleware import throttle
 from bff.middleware.auth import generate_token
+from bff.services.media import store_image
+from bff.services.passwords import PasswordQueueFull, hash_password, needs_rehash, verify_password
 
-def hash_password(password):
-    """Hash a password using hashlib with salt."""
-    salt = os.urandom(16).hex()
-    hashed = hashlib.sha256((salt + password).encode()).hexdigest()
-    return f"{salt}:{hashed}"
+def send_busy(self):
+    """503 for a login or registration turned away because the hashing pool is full."""
+    self.send_response(503)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Retry-After', '1')
+    self.end_headers()
+    self.wfile.write(json.dumps({'error': 'Server busy, please try again shortly'}).encode())
 
-def verify_password(password, stored):
-    """Verify a password against its hash."""
-    try:
-        salt, hashed = stored.split(':')
-        return hashlib.sha256((salt + password).encode()).hexdigest() == hashed
-    except (ValueError, AttributeError):
-        return False
+def send_throttled(self, retry_after):
+    """429 for a login refused after too many failed attempts."""
+    self.send_response(429)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Retry-After', str(retry_after))
+    self.end_headers()
+    self.wfile.write(json.dumps({'error': 'Too many failed attempts, please try again later'}).encode())
 
 def user_register(self, body):
     """POST /auth/user/register - Register a new user."""
@@ -54,10 +57,29 @@ def user_register(self, body):
         self.wfile.write(json.dumps({'error': 'Email already exists'}).encode())
         return
 
+    # Hash before writing anything: the pool may turn the request away
+    try:
+        hashed_password = hash_password(password)
+    except PasswordQueueFull:
+        conn.close()
+        send_busy(self)
+        return
+
+    # Keep the avatar in the media store; the column holds its URL. The media
+    # row commits with the user, so a failed registration leaves none behind.
+    cursor.execute("BEGIN")
+    try:
+        avatar_base64 = store_image(cursor, avatar_base64)
+    except ValueError as e:
+        conn.close()
+        self.send_response(400)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': str(e)}).encode())
+        return
+
     # Create new user
     user_id = str(uuid.uuid4())
-    hashed_password = hash_password(password)
-
     cursor.execute("""
         INSERT INTO users (id, name, email, password, nickname, avatar_base64, birthday_month, birthday_day, birthday_public, bio)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -113,20 +135,44 @@ def user_login(self, body):
     email = body['email']
     password = body['password']
 
+    throttle_keys = throttle.user_login_keys(self, email)
+    retry_after = throttle.retry_after(throttle_keys)
+    if retry_after:
+        send_throttled(self, retry_after)
+        return
+
     conn = get_connection()
     cursor = conn.cursor()
 
     cursor.execute("SELECT id, name, email, password FROM users WHERE email = ?", (email,))
     user_row = cursor.fetchone()
 
-    if not user_row or not verify_password(password, user_row['password']):
+    try:
+        valid = verify_password(password, user_row['password'] if user_row else None)
+    except PasswordQueueFull:
+        conn.close()
+        send_busy(self)
+        return
+
+    if not valid:
         conn.close()
+        throttle.record_failure(throttle_keys)
         self.send_response(401)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
         self.wfile.write(json.dumps({'error': 'Invalid email or password'}).encode())
         return
 
+    # Upgrade legacy or weaker hashes now that the password is known
+    if needs_rehash(user_row['password']):
+        try:
+            cursor.execute("UPDATE users SET password = ? WHERE id = ?", (hash_password(password), user_row['id']))
+            conn.commit()
+        except PasswordQueueFull:
+            pass  # upgraded on a later login
+
+    throttle.login_succeeded(throttle_keys)
+
     # Generate token
     token = generate_token({'userId': user_row['id'], 'type': 'user'})
 
@@ -159,6 +205,12 @@ def staff_login(self, body):
     store_id = body['storeId']
     pin = body['pin']
 
+    throttle_keys = throttle.staff_login_keys(self, store_id)
+    retry_after = throttle.retry_after(throttle_keys)
+    if retry_after:
+        send_throttled(self, retry_after)
+        return
+
     conn = get_connection()
     cursor = conn.cursor()
 
@@ -170,6 +222,7 @@ def staff_login(self, body):
 
     if not staff_row:
         conn.close()
+        throttle.record_failure(throttle_keys)
         self.send_response(401)
         self.send_header('Content-Type', 'application/json')
         self.end_headers()
@@ -185,6 +238,8 @@ def staff_login(self, body):
         self.wfile.write(json.dumps({'error': 'このアカウントは無効化されています'}).encode())
         return
 
+    throttle.login_succeeded(throttle_keys)
+
     # Update last login time
     cursor.execute("""
         UPDATE staff_accounts SET last_login_at = datetime('now') WHERE id = ?
@@ -4,10 +4,24 @@ import time
 from datetime import datetime
 from bff.db import get_connection
 from bff.middleware.auth import require_user_auth
+from bff.services.media import store_image, thumbnail_url
 from bff.services.notification import (
     create_amigo_checkin_notification,
-    create_bottle_share_notification
+    create_bottle_share_notification,
+    load_notifications,
+    mark_notifications_read,
+    notification_channel
 )
+from bff.services.events import LONG_POLL_TIMEOUT, POLL_INTERVAL, can_park, wait_then, watch
+from bff.services.home_cache import (
+    get_home_cache,
+    get_home_generation,
+    set_home_cache,
+    invalidate_home,
+    invalidate_home_with_amigos
+)
+from bff.services.dashboard import publish_checkin, publish_checkout
+from bff.services.search import find_users
 
 @require_user_auth
 def get_bottles(self):
@@ -226,7 +240,7 @@ def get_store_detail(self, store_id):
         amigos.append({
             'id': a['id'],
             'name': a.get('nickname') or a['name'],
-            'avatarBase64': a.get('avatar_base64'),
+            'avatarBase64': thumbnail_url(a.get('avatar_base64')),
             'isCheckedIn': is_checked_in,
         })
     store['amigos'] = amigos
@@ -296,6 +310,11 @@ def create_checkin(self, body):
 
     # Close any existing active checkins for this user at ALL stores
     # (user can only be checked in at one store at a time)
+    cursor.execute("""
+        SELECT id, store_id FROM check_ins
+        WHERE user_id = ? AND status = 'active'
+    """, (self.user_id,))
+    closed_checkins = [dict(row) for row in cursor.fetchall()]
     cursor.execute("""
         UPDATE check_ins SET status = 'completed'
         WHERE user_id = ? AND status = 'active'
@@ -333,8 +352,15 @@ def create_checkin(self, body):
     checkin['notify_to_user_ids'] = json.loads(checkin['notify_to_user_ids'])
     checkin['user'] = user
 
+    # Live dashboard updates for the store(s) involved
+    for closed in closed_checkins:
+        publish_checkout(closed['store_id'], closed['id'], self.user_id)
+    publish_checkin(cursor, store_id, checkin_id)
+
     conn.close()
 
+    invalidate_home_with_amigos(self.user_id)
+
     # Create notifications
     create_amigo_checkin_notification(self.user_id, store_id, checkin_id)
 
@@ -380,7 +406,7 @@ def get_amigos(self, params):
         if user_row:
             u = dict(user_row)
             amigo['name'] = u.get('nickname') or u['name']
-            amigo['avatarBase64'] = u.get('avatar_base64')
+            amigo['avatarBase64'] = thumbnail_url(u.get('avatar_base64'))
         else:
             amigo['name'] = '不明'
             amigo['avatarBase64'] = None
@@ -546,6 +572,8 @@ def accept_amigo(self, amigo_id):
 
     conn.close()
 
+    invalidate_home(amigo['requester_user_id'], amigo['target_user_id'])
+
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -612,23 +640,6 @@ def get_amigo_qr_token(self):
     store_id = checkin_row['store_id']
     store_name = checkin_row['store_name']
 
-    # Create amigo_qr_tokens table if not exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS amigo_qr_tokens (
-            token TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            store_id TEXT NOT NULL DEFAULT '',
-            created_at INTEGER NOT NULL,
-            used INTEGER DEFAULT 0
-        )
-    """)
-
-    # Add store_id column if missing (migration)
-    try:
-        cursor.execute("ALTER TABLE amigo_qr_tokens ADD COLUMN store_id TEXT NOT NULL DEFAULT ''")
-    except:
-        pass
-
     # Clean old tokens (older than 10 minutes)
     cursor.execute("DELETE FROM amigo_qr_tokens WHERE created_at < ?", (int(time.time()) - 600,))
 
@@ -685,17 +696,6 @@ def amigo_scan_qr(self, body):
 
     scanner_store_id = scanner_checkin['store_id']
 
-    # Ensure table exists
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS amigo_qr_tokens (
-            token TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            store_id TEXT NOT NULL DEFAULT '',
-            created_at INTEGER NOT NULL,
-            used INTEGER DEFAULT 0
-        )
-    """)
-
     # Find the token
     cursor.execute("SELECT * FROM amigo_qr_tokens WHERE token = ?", (token,))
     row = cursor.fetchone()
@@ -787,6 +787,8 @@ def amigo_scan_qr(self, body):
     store_row = cursor.fetchone()
     conn.close()
 
+    invalidate_home(self.user_id, target_user_id)
+
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -794,7 +796,7 @@ def amigo_scan_qr(self, body):
         'success': True,
         'amigoId': amigo_id,
         'name': target.get('nickname') or target['name'],
-        'avatarBase64': target.get('avatar_base64'),
+        'avatarBase64': thumbnail_url(target.get('avatar_base64')),
         'storeName': store_row['name'] if store_row else '',
     }).encode())
 
@@ -960,51 +962,7 @@ def get_notifications(self):
     conn = get_connection()
     cursor = conn.cursor()
 
-    cursor.execute("""
-        SELECT id, type, payload_json, created_at, read_at
-        FROM notifications
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-        LIMIT 100
-    """, (self.user_id,))
-
-    notifications = []
-    for row in cursor.fetchall():
-        notification = dict(row)
-        notification['data'] = json.loads(notification['payload_json'])
-        del notification['payload_json']
-        notification['createdAt'] = notification.pop('created_at', '')
-        notification['readAt'] = notification.pop('read_at', None)
-
-        # Ensure store_id is present in data for navigation
-        data = notification['data']
-        if 'store_id' not in data and 'bottle_id' in data:
-            bottle_row = cursor.execute(
-                "SELECT store_id FROM bottles WHERE id = ?",
-                (data['bottle_id'],)
-            ).fetchone()
-            if bottle_row:
-                data['store_id'] = bottle_row['store_id']
-
-        # Ensure storeName is present for display
-        if 'storeName' not in data and 'store_id' in data:
-            store_row = cursor.execute(
-                "SELECT name FROM stores WHERE id = ?",
-                (data['store_id'],)
-            ).fetchone()
-            if store_row:
-                data['storeName'] = store_row['name']
-
-        # Ensure userName is present for checkin/share notifications
-        if 'userName' not in data and 'user_id' in data:
-            user_row = cursor.execute(
-                "SELECT name, nickname FROM users WHERE id = ?",
-                (data['user_id'],)
-            ).fetchone()
-            if user_row:
-                data['userName'] = user_row['nickname'] or user_row['name']
-
-        notifications.append(notification)
+    notifications = load_notifications(cursor, self.user_id)
 
     conn.close()
 
@@ -1013,6 +971,73 @@ def get_notifications(self):
     self.end_headers()
     self.wfile.write(json.dumps(notifications).encode())
 
+@require_user_auth
+def read_notifications(self):
+    """POST /consumer/notifications/read - Mark the whole timeline read."""
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    cursor.execute("BEGIN")
+    read_at = mark_notifications_read(cursor, self.user_id)
+    conn.commit()
+    conn.close()
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.end_headers()
+    self.wfile.write(json.dumps({'readAt': read_at}).encode())
+
+@require_user_auth
+def poll_notifications(self, params):
+    """GET /consumer/notifications/poll?since=&timeout= - Long-poll for new notifications.
+
+    Without since, returns the current cursor at once. With it, waits until a
+    notification newer than the cursor arrives (or timeout seconds pass) and
+    returns only those. reset=true means the cursor is too old to replay or
+    was issued by another server process (a restart, another prefork worker)
+    and the client should reload /consumer/notifications. When the server cannot
+    hold the request open (thread modes) it answers at once with pollAfter,
+    the seconds to wait before polling again.
+    """
+    since = params.get('since') or None
+    try:
+        timeout = max(0.0, min(LONG_POLL_TIMEOUT, float(params.get('timeout', LONG_POLL_TIMEOUT))))
+    except ValueError:
+        timeout = LONG_POLL_TIMEOUT
+
+    def respond(events, complete):
+        if events:
+            cursor_id = events[-1][0]
+        elif complete:
+            cursor_id = since
+        else:
+            # The cursor is from before a restart or from another worker: start
+            # again from now, with the channel registered like a first poll
+            cursor_id = watch(channel)
+        body = {
+            # Newest first, like GET /consumer/notifications
+            'notifications': [json.loads(payload) for _, _, payload in reversed(events)],
+            'cursor': cursor_id,
+            'reset': not complete,
+        }
+        if not can_park(self):
+            body['pollAfter'] = POLL_INTERVAL
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(json.dumps(body).encode())
+
+    channel = notification_channel(self.user_id)
+    if since is None:
+        # Register the channel now: notifications are only published to watched
+        # channels, and the client's next poll must see any sent before it arrives
+        since = watch(channel)
+        respond([], True)
+        return
+
+    wait_then(self, channel, since, timeout, respond)
+
 @require_user_auth
 def search_users(self, params):
     """GET /consumer/users/search?q= - Search users."""
@@ -1029,21 +1054,13 @@ def search_users(self, params):
     cursor = conn.cursor()
 
     # Search users by name, nickname, or email, excluding self
-    search_term = f"%{query}%"
-    cursor.execute("""
-        SELECT DISTINCT u.id, u.name, u.nickname, u.avatar_base64
-        FROM users u
-        WHERE u.id != ? AND (u.name LIKE ? OR u.nickname LIKE ? OR u.email LIKE ?)
-        LIMIT 20
-    """, (self.user_id, search_term, search_term, search_term))
-
     users = []
-    for row in cursor.fetchall():
+    for row in find_users(cursor, query, self.user_id):
         u = dict(row)
         users.append({
             'id': u['id'],
             'name': u.get('nickname') or u['name'],
-            'avatarBase64': u.get('avatar_base64'),
+            'avatarBase64': thumbnail_url(u.get('avatar_base64')),
         })
 
     conn.close()
@@ -1091,7 +1108,7 @@ def get_user_profile(self, user_id):
         shared_stores.append({
             'id': store['id'],
             'name': store['name'],
-            'logoBase64': store.get('logo_base64')
+            'logoBase64': thumbnail_url(store.get('logo_base64'))
         })
 
     conn.close()
@@ -1185,10 +1202,21 @@ def update_profile(self, body):
     updates = []
     params = []
 
+    # A new avatar's media row commits with the update that refers to it
+    cursor.execute("BEGIN")
     if nickname is not None:
         updates.append('nickname = ?')
         params.append(nickname)
     if avatar_base64 is not None:
+        try:
+            avatar_base64 = store_image(cursor, avatar_base64)
+        except ValueError as e:
+            conn.close()
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            return
         updates.append('avatar_base64 = ?')
         params.append(avatar_base64)
     if birthday_month is not None:
@@ -1209,7 +1237,7 @@ def update_profile(self, body):
         params.append(self.user_id)
         update_sql = "UPDATE users SET " + ", ".join(updates) + " WHERE id = ?"
         cursor.execute(update_sql, params)
-        conn.commit()
+    conn.commit()
 
     # Handle notification settings
     if 'notificationSettings' in body:
@@ -1260,6 +1288,10 @@ def update_profile(self, body):
 
     conn.close()
 
+    # Amigos see this user's name and avatar on their home feed
+    if nickname is not None or avatar_base64 is not None:
+        invalidate_home_with_amigos(self.user_id)
+
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -1268,6 +1300,19 @@ def update_profile(self, body):
 @require_user_auth
 def get_home(self):
     """GET /consumer/home - Get home feed with all stores."""
+    body = get_home_cache(self.user_id)
+    if body is None:
+        generation = get_home_generation()
+        body = json.dumps(build_home(self.user_id)).encode()
+        set_home_cache(self.user_id, body, generation)
+
+    self.send_response(200)
+    self.send_header('Content-Type', 'application/json')
+    self.end_headers()
+    self.wfile.write(body)
+
+def build_home(user_id):
+    """Build the home feed with a fixed number of queries, joined per store in memory."""
     conn = get_connection()
     cursor = conn.cursor()
 
@@ -1277,71 +1322,56 @@ def get_home(self):
         FROM stores s
         ORDER BY s.name
     """)
+    store_rows = cursor.fetchall()
 
-    stores = []
-    for store_row in cursor.fetchall():
-        store = dict(store_row)
+    # Count bottles per store for this user
+    cursor.execute("""
+        SELECT store_id, COUNT(*) as count FROM bottles
+        WHERE owner_user_id = ?
+        GROUP BY store_id
+    """, (user_id,))
+    bottle_counts = {row['store_id']: row['count'] for row in cursor.fetchall()}
 
-        # Count bottles at this store for this user
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM bottles
-            WHERE store_id = ? AND owner_user_id = ?
-        """, (store['id'], self.user_id))
-        bottle_count = cursor.fetchone()['count']
+    # Last checkin date and active checkin flag per store for this user
+    cursor.execute("""
+        SELECT store_id, MAX(created_at) as last_checkin, MAX(status = 'active') as checked_in
+        FROM check_ins
+        WHERE user_id = ?
+        GROUP BY store_id
+    """, (user_id,))
+    checkin_state = {row['store_id']: row for row in cursor.fetchall()}
 
-        # Get active checkins — only show users who are amigos at THIS store
-        # (i.e. have an active amigo relationship at this store)
-        cursor.execute("""
-            SELECT DISTINCT u.id, u.name, u.nickname, u.avatar_base64
-            FROM check_ins ci
-            JOIN users u ON u.id = ci.user_id
-            WHERE ci.store_id = ? AND ci.status = 'active'
-              AND u.id IN (
-                SELECT a.requester_user_id FROM amigos a
-                WHERE a.store_id = ? AND a.status = 'active'
-                  AND a.target_user_id = ?
-                UNION
-                SELECT a.target_user_id FROM amigos a
-                WHERE a.store_id = ? AND a.status = 'active'
-                  AND a.requester_user_id = ?
-              )
-        """, (store['id'], store['id'], self.user_id,
-              store['id'], self.user_id))
-        active_amigos = []
-        for row in cursor.fetchall():
-            amigo = dict(row)
-            active_amigos.append({
-                'name': amigo.get('nickname') or amigo['name'],
-                'avatarBase64': amigo.get('avatar_base64')
-            })
-
-        # Check if current user has active checkin at this store
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM check_ins
-            WHERE store_id = ? AND user_id = ? AND status = 'active'
-        """, (store['id'], self.user_id))
-        user_checked_in = cursor.fetchone()['count'] > 0
+    # Active checkins — only users who are amigos at THAT store
+    # (i.e. have an active amigo relationship at the store they are checked in to)
+    cursor.execute("""
+        SELECT DISTINCT ci.store_id, u.id, u.name, u.nickname, u.avatar_base64
+        FROM amigos a
+        JOIN check_ins ci ON ci.store_id = a.store_id AND ci.status = 'active'
+         AND ci.user_id = CASE WHEN a.requester_user_id = ? THEN a.target_user_id ELSE a.requester_user_id END
+        JOIN users u ON u.id = ci.user_id
+        WHERE a.status = 'active' AND (a.requester_user_id = ? OR a.target_user_id = ?)
+    """, (user_id, user_id, user_id))
+    active_amigos = {}
+    for row in cursor.fetchall():
+        amigo = dict(row)
+        active_amigos.setdefault(amigo['store_id'], []).append({
+            'name': amigo.get('nickname') or amigo['name'],
+            'avatarBase64': thumbnail_url(amigo.get('avatar_base64'))
+        })
 
-        # Get last checkin date for this user at this store
-        cursor.execute("""
-            SELECT created_at FROM check_ins
-            WHERE store_id = ? AND user_id = ?
-            ORDER BY created_at DESC LIMIT 1
-        """, (store['id'], self.user_id))
-        last_checkin_row = cursor.fetchone()
-        last_checkin_date = last_checkin_row['created_at'] if last_checkin_row else None
+    conn.close()
 
-        store['bottleCount'] = bottle_count
-        store['activeAmigos'] = active_amigos
-        store['userCheckedIn'] = user_checked_in
-        store['lastCheckinDate'] = last_checkin_date
-        store['logoBase64'] = store.pop('logo_base64', None)
+    stores = []
+    for store_row in store_rows:
+        store = dict(store_row)
+        state = checkin_state.get(store['id'])
 
-        stores.append(store)
+        store['bottleCount'] = bottle_counts.get(store['id'], 0)
+        store['activeAmigos'] = active_amigos.get(store['id'], [])
+        store['userCheckedIn'] = bool(state and state['checked_in'])
+        store['lastCheckinDate'] = state['last_checkin'] if state else None
+        store['logoBase64'] = thumbnail_url(store.pop('logo_base64', None))
 
-    conn.close()
+        stores.append(store)
 
-    self.send_response(200)
-    self.send_header('Content-Type', 'application/json')
-    self.end_headers()
-    self.wfile.write(json.dumps(stores).encode())
+    return stores
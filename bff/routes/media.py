@@ -0,0 +1,60 @@
+import json
+from bff.db import get_connection
+from bff.services.media import MEDIA_HASH, MEDIA_VARIANTS, load_media, load_variant
+
+def send_media(self, content_type, data, etag, immutable=True):
+    """Write image bytes, or 304 if the client already has this ETag."""
+    cache_control = 'public, max-age=31536000, immutable' if immutable else 'public, max-age=86400'
+    if self.headers.get('If-None-Match') == etag:
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.end_headers()
+        return
+
+    self.send_response(200)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(data)))
+    self.send_header('ETag', etag)
+    self.send_header('Cache-Control', cache_control)
+    self.send_header('X-Content-Type-Options', 'nosniff')
+    self.end_headers()
+    self.wfile.write(data)
+
+def send_not_found(self):
+    self.send_response(404)
+    self.send_header('Content-Type', 'application/json')
+    self.end_headers()
+    self.wfile.write(json.dumps({'error': 'Media not found'}).encode())
+
+def get_media(self, media_hash, variant=None):
+    """GET /media/<hash>[/<variant>] - Stored image bytes. Public (loaded by <img>)."""
+    if not MEDIA_HASH.match(media_hash) or (variant is not None and variant not in MEDIA_VARIANTS):
+        send_not_found(self)
+        return
+
+    etag = f'"{media_hash}"' if variant is None else f'"{media_hash}-{variant}"'
+
+    # An original never changes for its hash, so a matching ETag needs no lookup
+    if variant is None and self.headers.get('If-None-Match') == etag:
+        send_media(self, None, b'', etag)
+        return
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    if variant is None:
+        media = load_media(cursor, media_hash)
+        found = media and (media['content_type'], media['data'], True)
+    else:
+        found = load_variant(cursor, media_hash, variant)
+    conn.close()
+
+    if not found:
+        send_not_found(self)
+        return
+
+    content_type, data, final = found
+    if not final:
+        # The original stands in until a codec makes the variant; tag it apart
+        etag = f'"{media_hash}-{variant}-original"'
+    send_media(self, content_type, data, etag, immutable=final)
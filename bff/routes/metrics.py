@@ -0,0 +1,39 @@
+import hmac
+import ipaddress
+import json
+import os
+from bff.services.metrics import render
+
+# GET /metrics requires "Authorization: Bearer <token>"; without a token only
+# direct loopback callers (a scraper on the same host) are served
+METRICS_TOKEN = os.environ.get('BFF_METRICS_TOKEN', '')
+
+def is_local_caller(handler):
+    """True for a loopback peer that is not relaying a request from elsewhere."""
+    if handler.headers.get('X-Forwarded-For'):
+        return False
+    try:
+        return ipaddress.ip_address(handler.client_address[0]).is_loopback
+    except ValueError:
+        return False
+
+def get_metrics(self):
+    """GET /metrics - Request counters and latency histograms (Prometheus text format)."""
+    if METRICS_TOKEN:
+        allowed = hmac.compare_digest(self.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}')
+    else:
+        allowed = is_local_caller(self)
+    if not allowed:
+        self.send_response(401)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': 'Unauthorized'}).encode())
+        return
+
+    body = render().encode()
+    self.send_response(200)
+    self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+    self.send_header('Content-Length', str(len(body)))
+    self.send_header('Cache-Control', 'no-store')
+    self.end_headers()
+    self.wfile.write(body)
@@ -3,10 +3,37 @@ import json
 from datetime import datetime
 from bff.db import get_connection
 from bff.middleware.auth import require_staff_auth, require_mama_only
+from bff.services.media import store_image, thumbnail_url
 from bff.services.notification import (
-    create_store_post_notification,
+    queue_store_post_notification,
     create_bottle_gift_notification
 )
+from bff.services.home_cache import (
+    invalidate_home,
+    invalidate_home_with_amigos,
+    clear_home_cache
+)
+from bff.services.loaders import (
+    load_bottle_counts,
+    load_last_checkins,
+    load_active_checkin_users,
+    load_latest_memos
+)
+from bff.services.events import (
+    current_event_id,
+    acquire_stream_slot,
+    release_stream_slot,
+    stream_events,
+    streams_enabled
+)
+from bff.services.dashboard import (
+    store_channel,
+    build_checkin_cards,
+    publish_checkin,
+    publish_checkout,
+    publish_memo,
+    publish_bottle
+)
 
 @require_staff_auth
 def get_active_checkins(self, params):
@@ -28,6 +55,9 @@ def get_active_checkins(self, params):
         self.wfile.write(json.dumps({'error': 'Not authorized for this store'}).encode())
         return
 
+    # Read before querying so a stream resumed from here replays anything newer
+    event_id = current_event_id()
+
     conn = get_connection()
     cursor = conn.cursor()
 
@@ -38,78 +68,64 @@ def get_active_checkins(self, params):
         ORDER BY created_at DESC
     """, (store_id,))
 
-    checkins = []
-    for checkin_row in cursor.fetchall():
-        row = dict(checkin_row)
-
-        # Get user info with avatar
-        cursor.execute("SELECT id, name, nickname, avatar_base64 FROM users WHERE id = ?", (row['user_id'],))
-        user_row = cursor.fetchone()
-        user = dict(user_row) if user_row else {'id': row['user_id'], 'name': '不明'}
-        if 'avatar_base64' in user:
-            user['avatarBase64'] = user.pop('avatar_base64', None)
-
-        # Get previous checkin date (the one before current active)
-        cursor.execute("""
-            SELECT created_at FROM check_ins
-            WHERE store_id = ? AND user_id = ? AND id != ?
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (store_id, row['user_id'], row['id']))
-        prev_row = cursor.fetchone()
-        prev_checkin_date = prev_row['created_at'] if prev_row else None
-
-        # Get user's bottles at this store
-        cursor.execute("""
-            SELECT id, type, remaining_pct, capacity_ml, remaining_ml
-            FROM bottles
-            WHERE store_id = ? AND owner_user_id = ?
-        """, (store_id, row['user_id']))
-        bottles = [dict(r) for r in cursor.fetchall()]
-        for b in bottles:
-            b['remainingPct'] = b.pop('remaining_pct', 0)
-            b['capacityMl'] = b.pop('capacity_ml', 750)
-            b['remainingMl'] = b.pop('remaining_ml', 750)
-
-        # Get latest memo for this customer
-        cursor.execute("""
-            SELECT cm.body, cm.created_at, sa.name as staff_name
-            FROM customer_memos cm
-            LEFT JOIN staff_accounts sa ON cm.author_staff_id = sa.id
-            WHERE cm.store_id = ? AND cm.user_id = ?
-            ORDER BY cm.created_at DESC
-            LIMIT 1
-        """, (store_id, row['user_id']))
-        memo_row = cursor.fetchone()
-        latest_memo = None
-        if memo_row:
-            latest_memo = {
-                'body': memo_row['body'],
-                'createdAt': memo_row['created_at'],
-                'staffName': memo_row['staff_name'],
-            }
-
-        # Build camelCase checkin object for frontend
-        checkin = {
-            'id': row['id'],
-            'userId': row['user_id'],
-            'userName': user.get('nickname') or user['name'],
-            'userAvatar': user.get('avatarBase64'),
-            'checkinTime': row['created_at'],
-            'previousCheckinDate': prev_checkin_date,
-            'status': row['status'],
-            'bottles': bottles,
-            'user': user,
-            'latestMemo': latest_memo,
-        }
-        checkins.append(checkin)
+    checkins = build_checkin_cards(cursor, store_id, [dict(r) for r in cursor.fetchall()])
 
     conn.close()
 
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
-    self.wfile.write(json.dumps({'checkins': checkins}).encode())
+    self.wfile.write(json.dumps({'checkins': checkins, 'eventId': event_id}).encode())
+
+@require_staff_auth
+def stream_checkins(self, params):
+    """GET /store/checkins/stream?storeId=&lastEventId= - Server-Sent Events for the dashboard."""
+    store_id = params.get('storeId', '')
+
+    if not store_id:
+        self.send_response(400)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': 'storeId required'}).encode())
+        return
+
+    # Verify staff works at this store
+    if store_id != self.store_id:
+        self.send_response(403)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': 'Not authorized for this store'}).encode())
+        return
+
+    # A prefork worker would only relay its own events; the client polls instead
+    if not streams_enabled():
+        self.send_response(501)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': 'Live updates are not available'}).encode())
+        return
+
+    # Each stream holds a worker thread; past the cap the client keeps polling
+    if not acquire_stream_slot():
+        self.send_response(503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Retry-After', '30')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': 'Too many streams'}).encode())
+        return
+
+    try:
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.end_headers()
+        last_event_id = self.headers.get('Last-Event-ID') or params.get('lastEventId')
+        stream_events(self, store_channel(store_id), last_event_id)
+    finally:
+        release_stream_slot()
 
 @require_staff_auth
 def get_customer_summary(self, user_id, params):
@@ -210,7 +226,7 @@ def update_bottle_remaining_pct(self, bottle_id, body):
 
     # Get bottle
     cursor.execute("""
-        SELECT id, store_id, remaining_pct, capacity_ml, remaining_ml FROM bottles WHERE id = ?
+        SELECT id, store_id, owner_user_id, type, remaining_pct, capacity_ml, remaining_ml FROM bottles WHERE id = ?
     """, (bottle_id,))
     bottle_row = cursor.fetchone()
 
@@ -271,6 +287,9 @@ def update_bottle_remaining_pct(self, bottle_id, body):
 
     conn.close()
 
+    publish_bottle(bottle['store_id'], bottle['owner_user_id'],
+                   dict(bottle, remaining_pct=new_pct, remaining_ml=new_ml))
+
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -285,7 +304,7 @@ def refill_bottle_to_full(self, bottle_id):
 
     # Get bottle
     cursor.execute("""
-        SELECT id, store_id, remaining_pct, capacity_ml, remaining_ml FROM bottles WHERE id = ?
+        SELECT id, store_id, owner_user_id, type, remaining_pct, capacity_ml, remaining_ml FROM bottles WHERE id = ?
     """, (bottle_id,))
     bottle_row = cursor.fetchone()
 
@@ -337,6 +356,9 @@ def refill_bottle_to_full(self, bottle_id):
 
     conn.close()
 
+    publish_bottle(bottle['store_id'], bottle['owner_user_id'],
+                   dict(bottle, remaining_pct=100, remaining_ml=capacity_ml))
+
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -419,6 +441,9 @@ def add_new_bottle(self, body):
 
     conn.close()
 
+    invalidate_home(owner_user_id)
+    publish_bottle(store_id, owner_user_id, dict(bottle_row))
+
     self.send_response(201)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -485,6 +510,8 @@ def create_memo(self, body):
     """, (memo_id,)).fetchone()
     memo = dict(memo_row)
 
+    publish_memo(cursor, store_id, user_id)
+
     conn.close()
 
     self.send_response(201)
@@ -536,12 +563,14 @@ def create_post(self, body):
         self.wfile.write(json.dumps({'error': 'Store not found'}).encode())
         return
 
-    # Create post
+    # Create post and queue notifications to bottle holders in one transaction
     post_id = str(uuid.uuid4())
+    cursor.execute("BEGIN")
     cursor.execute("""
         INSERT INTO store_posts (id, store_id, type, title, body)
         VALUES (?, ?, ?, ?, ?)
     """, (post_id, store_id, post_type, title, post_body))
+    queue_store_post_notification(cursor, store_id, post_id, post_type)
 
     conn.commit()
 
@@ -554,9 +583,6 @@ def create_post(self, body):
 
     conn.close()
 
-    # Create notifications
-    create_store_post_notification(store_id, post_id, post_type)
-
     self.send_response(201)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -842,6 +868,9 @@ def end_checkin(self, checkin_id):
 
     conn.close()
 
+    invalidate_home_with_amigos(user_id)
+    publish_checkout(self.store_id, checkin_id, user_id)
+
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -886,9 +915,20 @@ def update_store_settings(self, body):
     updates = []
     params = []
 
+    # A new logo's media row commits with the update that refers to it
+    cursor.execute("BEGIN")
     if 'logoBase64' in body:
+        try:
+            logo = store_image(cursor, body['logoBase64'])
+        except ValueError as e:
+            conn.close()
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            return
         updates.append('logo_base64 = ?')
-        params.append(body['logoBase64'])
+        params.append(logo)
     if 'address' in body:
         updates.append('address = ?')
         params.append(body['address'])
@@ -898,7 +938,7 @@ def update_store_settings(self, body):
         params.append(store_id)
         update_sql = "UPDATE stores SET " + ", ".join(updates) + " WHERE id = ?"
         cursor.execute(update_sql, params)
-        conn.commit()
+    conn.commit()
 
     # Fetch updated store
     cursor.execute("""
@@ -912,6 +952,10 @@ def update_store_settings(self, body):
 
     conn.close()
 
+    # Every user's home feed shows the store logo
+    if updates:
+        clear_home_cache()
+
     self.send_response(200)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
@@ -998,44 +1042,18 @@ def get_customer_list(self, params):
         ORDER BY u.name
     """, (store_id, store_id))
 
-    customers = []
-    for user_row in cursor.fetchall():
-        customer = dict(user_row)
+    customer_rows = [dict(r) for r in cursor.fetchall()]
+    user_ids = [c['id'] for c in customer_rows]
 
-        # Count bottles
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM bottles
-            WHERE store_id = ? AND owner_user_id = ?
-        """, (store_id, customer['id']))
-        bottle_count = cursor.fetchone()['count']
+    # Bottle counts, last checkin, current checkin and latest memo in one query each
+    bottle_counts = load_bottle_counts(cursor, store_id, user_ids)
+    last_checkins = load_last_checkins(cursor, store_id, user_ids)
+    active_users = load_active_checkin_users(cursor, store_id, user_ids)
+    memos = load_latest_memos(cursor, store_id, user_ids)
 
-        # Get last checkin date
-        cursor.execute("""
-            SELECT created_at FROM check_ins
-            WHERE store_id = ? AND user_id = ?
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (store_id, customer['id']))
-        checkin_row = cursor.fetchone()
-        last_checkin = checkin_row['created_at'] if checkin_row else None
-
-        # Check if currently checked in
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM check_ins
-            WHERE store_id = ? AND user_id = ? AND status = 'active'
-        """, (store_id, customer['id']))
-        is_active = cursor.fetchone()['count'] > 0
-
-        # Get latest memo
-        cursor.execute("""
-            SELECT cm.body, sa.name as staff_name, cm.created_at
-            FROM customer_memos cm
-            LEFT JOIN staff_accounts sa ON cm.author_staff_id = sa.id
-            WHERE cm.store_id = ? AND cm.user_id = ?
-            ORDER BY cm.created_at DESC
-            LIMIT 1
-        """, (store_id, customer['id']))
-        memo_row = cursor.fetchone()
+    customers = []
+    for customer in customer_rows:
+        memo_row = memos.get(customer['id'])
         latest_memo = None
         if memo_row:
             latest_memo = {
@@ -1044,10 +1062,10 @@ def get_customer_list(self, params):
                 'createdAt': memo_row['created_at'],
             }
 
-        customer['bottleCount'] = bottle_count
-        customer['lastCheckinDate'] = last_checkin
-        customer['isCheckedIn'] = is_active
-        customer['avatarBase64'] = customer.pop('avatar_base64', None)
+        customer['bottleCount'] = bottle_counts[customer['id']]
+        customer['lastCheckinDate'] = last_checkins.get(customer['id'])
+        customer['isCheckedIn'] = customer['id'] in active_users
+        customer['avatarBase64'] = thumbnail_url(customer.pop('avatar_base64', None))
         customer['latestMemo'] = latest_memo
         customer['birthdayMonth'] = customer.pop('birthday_month', None)
         customer['birthdayDay'] = customer.pop('birthday_day', None)
@@ -1336,7 +1354,7 @@ def get_bottle_masters(self, params):
             'brand': m['brand'],
             'variety': m['variety'],
             'capacityMl': m['capacity_ml'],
-            'imageBase64': m['image_base64'],
+            'imageBase64': thumbnail_url(m['image_base64']),
             'createdAt': m['created_at'],
         })
 
@@ -1379,6 +1397,18 @@ def create_bottle_master(self, body):
     conn = get_connection()
     cursor = conn.cursor()
 
+    # The image's media row commits with the master that refers to it
+    cursor.execute("BEGIN")
+    try:
+        image_base64 = store_image(cursor, image_base64)
+    except ValueError as e:
+        conn.close()
+        self.send_response(400)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(json.dumps({'error': str(e)}).encode())
+        return
+
     master_id = str(uuid.uuid4())
     cursor.execute("""
         INSERT INTO bottle_masters (id, store_id, name, brand, variety, capacity_ml, image_base64)
@@ -1432,6 +1462,8 @@ def update_bottle_master(self, master_id, body):
         self.wfile.write(json.dumps({'error': 'Bottle master not found'}).encode())
         return
 
+    # A new image's media row commits with the update that refers to it
+    cursor.execute("BEGIN")
     updates = []
     params = []
     for field, col in [('name', 'name'), ('brand', 'brand'), ('variety', 'variety')]:
@@ -1445,13 +1477,22 @@ def update_bottle_master(self, master_id, body):
             updates.append('capacity_ml = ?')
             params.append(cap)
     if 'imageBase64' in body:
+        try:
+            image = store_image(cursor, body['imageBase64'])
+        except ValueError as e:
+            conn.close()
+            self.send_response(400)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({'error': str(e)}).encode())
+            return
         updates.append('image_base64 = ?')
-        params.append(body['imageBase64'])
+        params.append(image)
 
     if updates:
         params.append(master_id)
         cursor.execute(f"UPDATE bottle_masters SET {', '.join(updates)} WHERE id = ?", params)
-        conn.commit()
+    conn.commit()
 
     # Return updated record
     cursor.execute("""
@@ -1610,7 +1651,7 @@ def get_bottle_keeps(self, params):
             'createdAt': bottle['created_at'],
             'ownerId': bottle['owner_id'],
             'ownerName': bottle['owner_nickname'] or bottle['owner_name'],
-            'ownerAvatar': bottle['owner_avatar'],
+            'ownerAvatar': thumbnail_url(bottle['owner_avatar']),
             'activeShares': active_shares,
             'shareHistory': share_history,
             'consumption': consumption,
@@ -1678,8 +1719,13 @@ def store_checkin(self, body):
         VALUES (?, ?, ?, 'active')
     """, (checkin_id, store_id, user_id))
     conn.commit()
+
+    publish_checkin(cursor, store_id, checkin_id)
+
     conn.close()
 
+    invalidate_home_with_amigos(user_id)
+
     self.send_response(201)
     self.send_header('Content-Type', 'application/json')
     self.end_headers()
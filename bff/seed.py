@@ -1,15 +1,8 @@
 import uuid
 import json
 from datetime import datetime
-import hashlib
-import os
 from bff.db import get_connection, init_db
-
-def hash_password(password):
-    """Hash a password using hashlib with salt."""
-    salt = os.urandom(16).hex()
-    hashed = hashlib.sha256((salt + password).encode()).hexdigest()
-    return f"{salt}:{hashed}"
+from bff.services.passwords import make_hash as hash_password
 
 def seed_data():
     """Seed the database with demo data."""
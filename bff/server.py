@@ -1,20 +1,114 @@
 #!/usr/bin/env python3
+import gzip
+import hashlib
+import io
 import json
 import sys
 import os
 import mimetypes
+import shutil
+import signal
+import stat
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
 # Add parent directory to path to allow bff imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from bff.routes import auth, consumer, store
-from bff.db import init_db, migrate_db, DB_PATH
+from bff.routes import admin, auth, consumer, store, media, metrics
+from bff.db import init_db, migrate_db, DB_PATH, begin_query_trace, end_query_trace
+from bff.router import Router
+from bff.services.events import disable_streams
+from bff.services.outbox import start_outbox_worker
+from bff.middleware.compression import GZIP_LEVEL, choose_encoding, compress_response
+from bff.services.metrics import observe
 
 # Project root (parent of bff/)
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Serving mode: 'single' (one accept loop), 'thread' (bounded worker pool),
+# 'prefork' (several processes sharing the listening socket, each with its own pool),
+# or 'async' (asyncio front end, see bff/async_server.py)
+SERVER_MODE = os.environ.get('BFF_SERVER_MODE', 'thread')
+SERVER_WORKERS = int(os.environ.get('BFF_WORKERS', 16))
+SERVER_PROCESSES = int(os.environ.get('BFF_PROCESSES', os.cpu_count() or 1))
+
+# API routes. Handlers are called as handler(request, *path params), followed
+# by the query params dict and/or the JSON body when listed after the handler.
+ROUTES = Router()
+
+# Auth routes
+ROUTES.add('POST', '/auth/user/register', auth.user_register, 'body')
+ROUTES.add('POST', '/auth/user/login', auth.user_login, 'body')
+ROUTES.add('POST', '/auth/staff/login', auth.staff_login, 'body')
+
+# Consumer routes
+ROUTES.add('GET', '/consumer/bottles', consumer.get_bottles)
+ROUTES.add('GET', '/consumer/bottles/{bottle_id}', consumer.get_bottle_detail)
+ROUTES.add('GET', '/consumer/stores/{store_id}', consumer.get_store_detail)
+ROUTES.add('POST', '/consumer/checkins', consumer.create_checkin, 'body')
+ROUTES.add('GET', '/consumer/checkins/active', consumer.get_active_checkin)
+ROUTES.add('GET', '/consumer/amigos', consumer.get_amigos, 'query')
+ROUTES.add('GET', '/consumer/amigos/myqr', consumer.get_amigo_qr_token)
+ROUTES.add('POST', '/consumer/amigos/request', consumer.request_amigo, 'body')
+ROUTES.add('POST', '/consumer/amigos/scan', consumer.amigo_scan_qr, 'body')
+ROUTES.add('POST', '/consumer/amigos/{amigo_id}/accept', consumer.accept_amigo)
+ROUTES.add('GET', '/consumer/notifications', consumer.get_notifications)
+ROUTES.add('GET', '/consumer/notifications/poll', consumer.poll_notifications, 'query')
+ROUTES.add('POST', '/consumer/notifications/read', consumer.read_notifications)
+ROUTES.add('GET', '/consumer/profile', consumer.get_profile)
+ROUTES.add('POST', '/consumer/profile', consumer.update_profile, 'body')
+ROUTES.add('GET', '/consumer/home', consumer.get_home)
+ROUTES.add('GET', '/consumer/users/search', consumer.search_users, 'query')
+ROUTES.add('GET', '/consumer/users/{user_id}', consumer.get_user_profile)
+ROUTES.add('POST', '/consumer/shares', consumer.create_bottle_share, 'body')
+ROUTES.add('POST', '/consumer/shares/{share_id}/end', consumer.end_bottle_share)
+
+# Store routes
+ROUTES.add('GET', '/store/checkins/active', store.get_active_checkins, 'query')
+ROUTES.add('GET', '/store/checkins/stream', store.stream_checkins, 'query')
+ROUTES.add('POST', '/store/checkins/create', store.store_checkin, 'body')
+ROUTES.add('POST', '/store/checkins/{checkin_id}/end', store.end_checkin)
+ROUTES.add('GET', '/store/customers', store.get_customer_list, 'query')
+ROUTES.add('GET', '/store/customers/{user_id}/summary', store.get_customer_summary, 'query')
+ROUTES.add('GET', '/store/customers/{user_id}/detail', store.get_customer_detail, 'query')
+ROUTES.add('GET', '/store/posts', store.get_posts, 'query')
+ROUTES.add('POST', '/store/posts', store.create_post, 'body')
+ROUTES.add('POST', '/store/posts/{post_id}/update', store.update_post, 'body')
+ROUTES.add('POST', '/store/posts/{post_id}/delete', store.delete_post, 'body')
+ROUTES.add('GET', '/store/settings', store.get_store_settings, 'query')
+ROUTES.add('POST', '/store/settings', store.update_store_settings, 'body')
+ROUTES.add('POST', '/store/bottles/addNew', store.add_new_bottle, 'body')
+ROUTES.add('POST', '/store/bottles/{bottle_id}/updateRemainingPct', store.update_bottle_remaining_pct, 'body')
+ROUTES.add('POST', '/store/bottles/{bottle_id}/refillToFull', store.refill_bottle_to_full)
+ROUTES.add('POST', '/store/memos', store.create_memo, 'body')
+ROUTES.add('POST', '/store/gifts', store.create_gift, 'body')
+ROUTES.add('GET', '/store/bottle-masters', store.get_bottle_masters, 'query')
+ROUTES.add('POST', '/store/bottle-masters', store.create_bottle_master, 'body')
+ROUTES.add('POST', '/store/bottle-masters/{master_id}/update', store.update_bottle_master, 'body')
+ROUTES.add('POST', '/store/bottle-masters/{master_id}/delete', store.delete_bottle_master, 'body')
+ROUTES.add('GET', '/store/bottle-keeps', store.get_bottle_keeps, 'query')
+ROUTES.add('GET', '/store/staff-accounts', store.get_staff_accounts, 'query')
+ROUTES.add('POST', '/store/staff-accounts', store.create_staff_account, 'body')
+ROUTES.add('POST', '/store/staff-accounts/{account_id}/update', store.update_staff_account, 'body')
+ROUTES.add('POST', '/store/staff-accounts/{account_id}/delete', store.delete_staff_account, 'body')
+ROUTES.add('POST', '/store/staff-accounts/{account_id}/toggle-active', store.toggle_staff_account_active, 'body')
+
+# Images (content-addressed)
+ROUTES.add('GET', '/media/{media_hash:hex}', media.get_media)
+ROUTES.add('GET', '/media/{media_hash:hex}/{variant}', media.get_media)
+
+# Operations
+ROUTES.add('GET', '/metrics', metrics.get_metrics)
+
+# Admin
+ROUTES.add('GET', '/admin/slow-queries', admin.get_slow_queries)
+ROUTES.add('GET', '/admin/profile', admin.get_profile, 'query')
+
 # MIME type mappings
 MIME_TYPES = {
     '.html': 'text/html; charset=utf-8',
@@ -32,51 +126,232 @@ MIME_TYPES = {
     '.ttf': 'font/ttf',
 }
 
+# Static assets served gzipped to clients that accept it
+STATIC_GZIP_EXTENSIONS = {'.html', '.css', '.js', '.json', '.svg'}
+# Files up to STATIC_CACHE_MAX_FILE are kept in memory (up to STATIC_CACHE_MAX_BYTES
+# in all); larger ones are sent from disk with sendfile(2)
+STATIC_CACHE_MAX_FILE = int(os.environ.get('BFF_STATIC_CACHE_MAX_FILE', 1024 * 1024))
+STATIC_CACHE_MAX_BYTES = int(os.environ.get('BFF_STATIC_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+class StaticAsset:
+    """One version of a static file held in memory, with its ETag and gzipped copy."""
+
+    def __init__(self, st, content):
+        self.mtime_ns = st.st_mtime_ns
+        self.size = st.st_size
+        self.content = content
+        self.etag = f'"{hashlib.sha256(content).hexdigest()[:32]}"'
+        self.gzipped = None
+
+    def gzip(self):
+        if self.gzipped is None:
+            self.gzipped = gzip.compress(self.content, GZIP_LEVEL, mtime=0)
+        return self.gzipped
+
+_static_cache = OrderedDict()  # file path -> StaticAsset, least recently used first
+_static_cache_bytes = 0
+_static_cache_lock = threading.Lock()
+
+def cached_asset(file_path, st):
+    """Return the StaticAsset for file_path as of stat st, or None if it is too large to cache."""
+    global _static_cache_bytes
+    with _static_cache_lock:
+        asset = _static_cache.get(file_path)
+        if asset and asset.mtime_ns == st.st_mtime_ns and asset.size == st.st_size:
+            _static_cache.move_to_end(file_path)
+            return asset
+    if st.st_size > STATIC_CACHE_MAX_FILE:
+        return None
+
+    with open(file_path, 'rb') as f:
+        asset = StaticAsset(st, f.read())
+    with _static_cache_lock:
+        old = _static_cache.pop(file_path, None)
+        if old:
+            _static_cache_bytes -= old.size
+        _static_cache[file_path] = asset
+        _static_cache_bytes += asset.size
+        while _static_cache_bytes > STATIC_CACHE_MAX_BYTES and len(_static_cache) > 1:
+            _, evicted = _static_cache.popitem(last=False)
+            _static_cache_bytes -= evicted.size
+    return asset
+
+def stat_file(path):
+    """os.stat() result for path, or None if it does not exist."""
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+def etag_matches(if_none_match, etag):
+    """True if an If-None-Match header lists etag (weak comparison) or is '*'."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    bare = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith('W/') else tag) == bare:
+            return True
+    return False
+
+class ResponseBuffer(io.BytesIO):
+    """wfile for the socket server modes: holds the response until the route is done.
+
+    BFFHandler.finish() then sends it in one write, compressed if the client
+    allows. A Server-Sent Events response never finishes, so once one is
+    flushed it is sent through as written.
+    """
+
+    def __init__(self, sock_file):
+        super().__init__()
+        self.sock_file = sock_file
+        self.streaming = False
+        self.sent = 0  # bytes written to the socket so far
+
+    def flush(self):
+        if not self.streaming:
+            head = self.getvalue().partition(b'\r\n\r\n')[0].lower()
+            if b'content-type: text/event-stream' not in head:
+                return
+            self.streaming = True
+        self.send_pending()
+
+    def send_pending(self):
+        """Write out what is buffered so far, uncompressed."""
+        data = self.getvalue()
+        self.seek(0)
+        self.truncate()
+        self.sock_file.write(data)
+        self.sent += len(data)
+
 class BFFHandler(BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         """Override to log with custom format."""
         print(f"[{self.client_address[0]}] {format % args}", file=sys.stderr)
 
-    def serve_static_file(self, file_path, fallback_index=None):
-        """Serve a static file from the filesystem."""
+    # Set per request by the front end, dispatch() and send_response(); read when recording metrics
+    route_name = None
+    status_code = None
+    request_started = None
+    # db.QueryTrace of the statements the handler ran, set by dispatch()
+    query_trace = None
+
+    def setup(self):
+        super().setup()
+        self.wfile = ResponseBuffer(self.wfile)
+        self.request_started = time.perf_counter()
+
+    def finish(self):
+        """Send the buffered response before the connection closes."""
+        buffer = self.wfile
+        self.wfile = buffer.sock_file
+        raw = buffer.getvalue()
+        headers = getattr(self, 'headers', None)
+        if raw:
+            accept_encoding = headers.get('Accept-Encoding') if headers else None
+            raw = raw if buffer.streaming else self.finalize_response(raw, accept_encoding)
+            try:
+                self.wfile.write(raw)
+            except OSError:
+                pass
+        if self.status_code is not None:
+            self.record_metrics(headers, buffer.sent + len(raw))
+        super().finish()
+
+    def finalize_response(self, raw, accept_encoding):
+        """Add the Server-Timing header for the handler's queries, then compress."""
+        trace = self.query_trace
+        if trace is not None and trace.count:
+            head, sep, body = raw.partition(b'\r\n\r\n')
+            if sep:
+                timing = 'Server-Timing: db;dur=%.2f;desc="%d queries"' % (trace.seconds * 1000, trace.count)
+                raw = head + b'\r\n' + timing.encode() + sep + body
+        return compress_response(raw, accept_encoding)
+
+    def record_metrics(self, headers, bytes_out):
+        """Count this response under its route (a fixed label when no route matched)."""
+        try:
+            bytes_in = int(headers.get('Content-Length', 0)) if headers else 0
+        except ValueError:
+            bytes_in = 0
+        route = self.route_name or f'{self.command or "-"} other'
+        observe(route, self.status_code, time.perf_counter() - self.request_started, bytes_in, bytes_out)
+
+    def send_file_body(self, f, size):
+        """Write size bytes of open file f as the body: sendfile(2) on a socket, else a copy."""
+        if isinstance(self.wfile, ResponseBuffer):
+            self.wfile.send_pending()
+            self.wfile.sent += self.connection.sendfile(f, 0, size)
+        else:
+            shutil.copyfileobj(f, self.wfile)
+
+    def send_static(self, file_path, st, content_type):
+        """Answer with a static file: from memory when cached, 304 when the client has it."""
+        asset = cached_asset(file_path, st)
+        if asset is None:
+            # Too large to keep: validator from mtime and size, body straight from disk
+            etag = f'W/"{st.st_mtime_ns:x}-{st.st_size:x}"'
+            encoding = None
+        else:
+            compressible = os.path.splitext(file_path)[1].lower() in STATIC_GZIP_EXTENSIONS
+            accepts_gzip = choose_encoding(self.headers.get('Accept-Encoding')) == 'gzip'
+            encoding = 'gzip' if compressible and accepts_gzip else None
+            etag = asset.etag[:-1] + '-gzip"' if encoding else asset.etag
+
+        not_modified = etag_matches(self.headers.get('If-None-Match'), etag)
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        if asset is not None and os.path.splitext(file_path)[1].lower() in STATIC_GZIP_EXTENSIONS:
+            self.send_header('Vary', 'Accept-Encoding')
+        if not_modified:
+            self.end_headers()
+            return
+
+        if asset is None:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(st.st_size))
+            self.end_headers()
+            with open(file_path, 'rb') as f:
+                self.send_file_body(f, st.st_size)
+            return
+
+        body = asset.gzip() if encoding else asset.content
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_static_file(self, file_path, fallback_index=None, root=PROJECT_ROOT):
+        """Serve a static file under root, or fallback_index if there is none."""
         # Security: prevent directory traversal
         file_path = os.path.normpath(file_path)
-        if not file_path.startswith(PROJECT_ROOT):
+        if file_path != root and not file_path.startswith(root + os.sep):
             self.send_response(403)
             self.send_header('Content-Type', 'text/plain')
             self.end_headers()
             self.wfile.write(b'Forbidden')
             return
 
+        st = stat_file(file_path)
         # If path is a directory, try index.html
-        if os.path.isdir(file_path):
+        if st and stat.S_ISDIR(st.st_mode):
             file_path = os.path.join(file_path, 'index.html')
+            st = stat_file(file_path)
 
-        if os.path.isfile(file_path):
+        if st and stat.S_ISREG(st.st_mode):
             ext = os.path.splitext(file_path)[1].lower()
-            content_type = MIME_TYPES.get(ext, 'application/octet-stream')
-            try:
-                with open(file_path, 'rb') as f:
-                    content = f.read()
-                self.send_response(200)
-                self.send_header('Content-Type', content_type)
-                self.send_header('Content-Length', str(len(content)))
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(content)
-            except Exception:
-                self.send_response(500)
-                self.end_headers()
-        elif fallback_index and os.path.isfile(fallback_index):
-            # SPA fallback: serve index.html for client-side routing
-            with open(fallback_index, 'rb') as f:
-                content = f.read()
-            self.send_response(200)
-            self.send_header('Content-Type', 'text/html; charset=utf-8')
-            self.send_header('Content-Length', str(len(content)))
-            self.send_header('Cache-Control', 'no-cache')
-            self.end_headers()
-            self.wfile.write(content)
+            self.send_static(file_path, st, MIME_TYPES.get(ext, 'application/octet-stream'))
+            return
+
+        # SPA fallback: serve index.html for client-side routing
+        fallback_st = stat_file(fallback_index) if fallback_index else None
+        if fallback_st and stat.S_ISREG(fallback_st.st_mode):
+            self.send_static(fallback_index, fallback_st, 'text/html; charset=utf-8')
         else:
             self.send_response(404)
             self.send_header('Content-Type', 'text/plain')
@@ -85,17 +360,26 @@ class BFFHandler(BaseHTTPRequestHandler):
 
     def is_api_route(self, path):
         """Check if path is an API route (not static file)."""
-        api_prefixes = ('/auth/', '/consumer/', '/store/')
+        api_prefixes = ('/auth/', '/consumer/', '/store/', '/media/', '/admin/')
         return any(path.startswith(p) for p in api_prefixes)
 
     def do_OPTIONS(self):
         """Handle CORS preflight requests."""
+        self.route_name = 'OPTIONS *'
         self.send_response(200)
         # CORS headers are already added by send_response override
         self.end_headers()
 
     def do_GET(self):
         """Handle GET requests."""
+        self.dispatch('GET')
+
+    def do_POST(self):
+        """Handle POST requests."""
+        self.dispatch('POST')
+
+    def dispatch(self, method):
+        """Look the path up in ROUTES and call its handler; unknown GETs serve static files."""
         parsed_url = urlparse(self.path)
         path = parsed_url.path
         query_params = parse_qs(parsed_url.query)
@@ -103,118 +387,68 @@ class BFFHandler(BaseHTTPRequestHandler):
         # Convert query params from lists to single values
         params = {k: v[0] if v else '' for k, v in query_params.items()}
 
-        # Add CORS headers
-        self.send_header_cors = True
-
-        print(f"[DEBUG GET] path='{path}' full='{self.path}'", file=sys.stderr)
+        route, args, allowed = ROUTES.match(method, path)
+        if route is not None:
+            self.route_name = route.name
+        elif allowed:
+            self.route_name = f'{method} method-not-allowed'
+        elif method == 'GET' and not self.is_api_route(path):
+            self.route_name = 'GET static'
+        else:
+            self.route_name = f'{method} not-found'
 
+        begin_query_trace(self.route_name)
         try:
-            # Auth routes
-            if path == '/auth/user/register':
-                self.send_response(405)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Method not allowed'}).encode())
-
-            elif path == '/auth/user/login':
-                self.send_response(405)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Method not allowed'}).encode())
-
-            elif path == '/auth/staff/login':
-                self.send_response(405)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Method not allowed'}).encode())
-
-            # Consumer routes
-            elif path == '/consumer/bottles':
-                consumer.get_bottles(self)
-
-            elif path.startswith('/consumer/bottles/') and path.count('/') == 3:
-                bottle_id = path.split('/')[-1]
-                consumer.get_bottle_detail(self, bottle_id)
-
-            elif path.startswith('/consumer/stores/') and path.count('/') == 3:
-                store_id = path.split('/')[-1]
-                consumer.get_store_detail(self, store_id)
+            self.handle_route(method, route, args, allowed, path, params)
+        finally:
+            self.query_trace = end_query_trace()
+            if self.query_trace is not None:
+                self.query_trace.report()
+
+    def handle_route(self, method, route, args, allowed, path, params):
+        """Read the body and answer with the matched route, a 405/404, or a static file."""
+        # Read body
+        body = {}
+        if method == 'POST':
+            content_length = int(self.headers.get('Content-Length', 0))
+            body_bytes = self.rfile.read(content_length)
+            if body_bytes:
+                try:
+                    body = json.loads(body_bytes.decode('utf-8'))
+                except json.JSONDecodeError:
+                    self.send_response(400)
+                    self.send_header('Content-Type', 'application/json')
+                    self.end_headers()
+                    self.wfile.write(json.dumps({'error': 'Invalid JSON'}).encode())
+                    return
 
-            elif path == '/consumer/checkins':
+        try:
+            if route is not None:
+                if 'query' in route.extra:
+                    args.append(params)
+                if 'body' in route.extra:
+                    args.append(body)
+                route.handler(self, *args)
+
+            elif allowed:
                 self.send_response(405)
+                self.send_header('Allow', ', '.join(allowed + ['OPTIONS']))
                 self.send_header('Content-Type', 'application/json')
                 self.end_headers()
                 self.wfile.write(json.dumps({'error': 'Method not allowed'}).encode())
 
-            elif path == '/consumer/amigos' or (path.startswith('/consumer/amigos') and '?' in self.path):
-                consumer.get_amigos(self, params)
-
-            elif path == '/consumer/notifications':
-                consumer.get_notifications(self)
-
-            elif path == '/consumer/profile':
-                consumer.get_profile(self)
-
-            elif path == '/consumer/home':
-                consumer.get_home(self)
-
-            elif path.startswith('/consumer/users/search'):
-                consumer.search_users(self, params)
-
-            elif path.startswith('/consumer/users/') and not path.endswith('/search'):
-                user_id = path.split('/')[-1]
-                consumer.get_user_profile(self, user_id)
-
-            elif path == '/consumer/checkins/active':
-                consumer.get_active_checkin(self)
-
-            elif path == '/consumer/amigos/myqr':
-                consumer.get_amigo_qr_token(self)
+            elif method == 'GET' and not self.is_api_route(path):
+                # Not an API route → serve static files
+                self.serve_static(path)
 
-            elif path == '/consumer/shares':
-                self.send_response(405)
+            else:
+                self.send_response(404)
                 self.send_header('Content-Type', 'application/json')
                 self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Method not allowed'}).encode())
-
-            # Store routes
-            elif path.startswith('/store/checkins/active'):
-                store.get_active_checkins(self, params)
-
-            elif path.startswith('/store/customers/') and '/summary' in path:
-                parts = path.split('/')
-                user_id = parts[3]
-                store.get_customer_summary(self, user_id, params)
-
-            elif path == '/store/customers' or (path == '/store/customers' and '?' in self.path):
-                store.get_customer_list(self, params)
-
-            elif path == '/store/posts':
-                store.get_posts(self, params)
-
-            elif path.startswith('/store/customers/') and '/detail' in path:
-                parts = path.split('/')
-                user_id = parts[3]
-                store.get_customer_detail(self, user_id, params)
-
-            elif path == '/store/settings':
-                store.get_store_settings(self, params)
-
-            elif path == '/store/bottle-masters':
-                store.get_bottle_masters(self, params)
-
-            elif path == '/store/bottle-keeps':
-                store.get_bottle_keeps(self, params)
-
-            elif path == '/store/staff-accounts':
-                store.get_staff_accounts(self, params)
-
-            else:
-                # Not an API route → serve static files
-                self.serve_static(path)
+                self.wfile.write(json.dumps({'error': 'Not found'}).encode())
 
         except Exception as e:
-            print(f"Error in GET handler: {str(e)}", file=sys.stderr)
+            print(f"Error in {method} handler: {str(e)}", file=sys.stderr)
             self.send_response(500)
             self.send_header('Content-Type', 'application/json')
             self.end_headers()
@@ -227,170 +461,145 @@ class BFFHandler(BaseHTTPRequestHandler):
             rel_path = path[len('/staff'):]
             if not rel_path or rel_path == '/':
                 rel_path = '/index.html'
-            file_path = os.path.join(PROJECT_ROOT, 'store', rel_path.lstrip('/'))
-            fallback = os.path.join(PROJECT_ROOT, 'store', 'index.html')
+            root = os.path.join(PROJECT_ROOT, 'store')
         else:
             # Consumer app: / → consumer/
             rel_path = path
             if not rel_path or rel_path == '/':
                 rel_path = '/index.html'
-            file_path = os.path.join(PROJECT_ROOT, 'consumer', rel_path.lstrip('/'))
-            fallback = os.path.join(PROJECT_ROOT, 'consumer', 'index.html')
-
-        self.serve_static_file(file_path, fallback_index=fallback)
-
-    def do_POST(self):
-        """Handle POST requests."""
-        parsed_url = urlparse(self.path)
-        path = parsed_url.path
-        query_params = parse_qs(parsed_url.query)
-
-        # Convert query params from lists to single values
-        params = {k: v[0] if v else '' for k, v in query_params.items()}
-
-        # Read body
-        content_length = int(self.headers.get('Content-Length', 0))
-        body_bytes = self.rfile.read(content_length)
-        body = {}
-        if body_bytes:
-            try:
-                body = json.loads(body_bytes.decode('utf-8'))
-            except json.JSONDecodeError:
-                self.send_response(400)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Invalid JSON'}).encode())
-                return
-
-        try:
-            # Auth routes
-            if path == '/auth/user/register':
-                auth.user_register(self, body)
-
-            elif path == '/auth/user/login':
-                auth.user_login(self, body)
-
-            elif path == '/auth/staff/login':
-                auth.staff_login(self, body)
-
-            # Consumer routes
-            elif path == '/consumer/checkins':
-                consumer.create_checkin(self, body)
-
-            elif path == '/consumer/amigos/request':
-                consumer.request_amigo(self, body)
-
-            elif path == '/consumer/amigos/scan':
-                consumer.amigo_scan_qr(self, body)
-
-            elif path.startswith('/consumer/amigos/') and path.endswith('/accept'):
-                amigo_id = path.split('/')[-2]
-                consumer.accept_amigo(self, amigo_id)
-
-            elif path == '/consumer/profile':
-                consumer.update_profile(self, body)
-
-            elif path == '/consumer/shares':
-                consumer.create_bottle_share(self, body)
-
-            elif path.startswith('/consumer/shares/') and path.endswith('/end'):
-                share_id = path.split('/')[-2]
-                consumer.end_bottle_share(self, share_id)
-
-            # Store routes
-            elif path == '/store/settings':
-                store.update_store_settings(self, body)
-            elif path.startswith('/store/bottles/') and path.endswith('/updateRemainingPct'):
-                bottle_id = path.split('/')[-2]
-                store.update_bottle_remaining_pct(self, bottle_id, body)
-
-            elif path.startswith('/store/bottles/') and path.endswith('/refillToFull'):
-                bottle_id = path.split('/')[-2]
-                store.refill_bottle_to_full(self, bottle_id)
-
-            elif path == '/store/bottles/addNew':
-                store.add_new_bottle(self, body)
-
-            elif path == '/store/memos':
-                store.create_memo(self, body)
+            root = os.path.join(PROJECT_ROOT, 'consumer')
 
-            elif path == '/store/posts':
-                store.create_post(self, body)
-
-            elif path.startswith('/store/posts/') and path.endswith('/update'):
-                post_id = path.split('/')[-2]
-                store.update_post(self, post_id, body)
-
-            elif path.startswith('/store/posts/') and path.endswith('/delete'):
-                post_id = path.split('/')[-2]
-                store.delete_post(self, post_id, body)
-
-            elif path == '/store/gifts':
-                store.create_gift(self, body)
-
-            elif path == '/store/bottle-masters':
-                store.create_bottle_master(self, body)
-
-            elif path.startswith('/store/bottle-masters/') and path.endswith('/update'):
-                master_id = path.split('/')[-2]
-                store.update_bottle_master(self, master_id, body)
-
-            elif path.startswith('/store/bottle-masters/') and path.endswith('/delete'):
-                master_id = path.split('/')[-2]
-                store.delete_bottle_master(self, master_id, body)
-
-            elif path == '/store/checkins/create':
-                store.store_checkin(self, body)
-
-            elif path.startswith('/store/checkins/') and path.endswith('/end'):
-                checkin_id = path.split('/')[-2]
-                store.end_checkin(self, checkin_id)
-
-            elif path == '/store/staff-accounts':
-                store.create_staff_account(self, body)
-
-            elif path.startswith('/store/staff-accounts/') and path.endswith('/update'):
-                account_id = path.split('/')[-2]
-                store.update_staff_account(self, account_id, body)
-
-            elif path.startswith('/store/staff-accounts/') and path.endswith('/delete'):
-                account_id = path.split('/')[-2]
-                store.delete_staff_account(self, account_id, body)
-
-            elif path.startswith('/store/staff-accounts/') and path.endswith('/toggle-active'):
-                account_id = path.split('/')[-2]
-                store.toggle_staff_account_active(self, account_id, body)
-
-            else:
-                self.send_response(404)
-                self.send_header('Content-Type', 'application/json')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': 'Not found'}).encode())
-
-        except Exception as e:
-            print(f"Error in POST handler: {str(e)}", file=sys.stderr)
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': 'Internal server error'}).encode())
+        file_path = os.path.join(root, rel_path.lstrip('/'))
+        self.serve_static_file(file_path, fallback_index=os.path.join(root, 'index.html'), root=root)
 
     def send_response(self, code, message=None):
         """Override to add CORS headers."""
+        self.status_code = code
         super().send_response(code, message)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, PUT, DELETE, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
 
-def run_server(port=3001):
-    """Run the HTTP server."""
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer that hands each accepted connection to a bounded worker pool."""
+
+    def __init__(self, server_address, handler_class, workers=SERVER_WORKERS, bind_and_activate=True):
+        self.workers = workers
+        # Threads are started lazily on first submit, so the pool survives a fork
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bff-worker')
+        # Cap in-flight connections: once every worker is busy and a second batch
+        # is queued, stop accepting and let new clients wait in the listen backlog
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request(self, request, client_address):
+        """Queue the connection on the worker pool."""
+        self.slots.acquire()
+        try:
+            self.pool.submit(self.process_request_worker, request, client_address)
+        except RuntimeError:
+            # Pool already shut down
+            self.slots.release()
+            self.shutdown_request(request)
+
+    def process_request_worker(self, request, client_address):
+        """Run one request on a worker thread."""
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+def serve_prefork(httpd, processes):
+    """Fork worker processes that all accept on httpd's listening socket."""
+    children = set()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            disable_streams()
+            start_outbox_worker()
+            try:
+                httpd.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def on_sigterm(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    for _ in range(processes):
+        spawn()
+
+    try:
+        while children:
+            pid, status = os.wait()
+            children.discard(pid)
+            print(f"[PREFORK] worker {pid} exited with status {status}, restarting", file=sys.stderr)
+            time.sleep(1)
+            spawn()
+    except KeyboardInterrupt:
+        print("\nShutting down workers...")
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        httpd.server_close()
+
+def run_server(port=3001, mode=None, workers=None, processes=None):
+    """Run the HTTP server in the selected concurrency mode."""
+    mode = mode or SERVER_MODE
+    workers = workers or SERVER_WORKERS
+    processes = processes or SERVER_PROCESSES
     server_address = ('', port)
-    httpd = HTTPServer(server_address, BFFHandler)
-    print(f"Bottle Amigo BFF Server running on port {port}")
+
+    if mode == 'prefork' and not hasattr(os, 'fork'):
+        print("[STARTUP] prefork is not supported on this platform, using thread mode", file=sys.stderr)
+        mode = 'thread'
+
+    if mode == 'single':
+        httpd = HTTPServer(server_address, BFFHandler)
+        print(f"Bottle Amigo BFF Server running on port {port} (single)")
+    elif mode == 'thread':
+        httpd = ThreadPoolHTTPServer(server_address, BFFHandler, workers=workers)
+        print(f"Bottle Amigo BFF Server running on port {port} (thread, {workers} workers)")
+    elif mode == 'prefork':
+        httpd = ThreadPoolHTTPServer(server_address, BFFHandler, workers=workers)
+        print(f"Bottle Amigo BFF Server running on port {port} "
+              f"(prefork, {processes} processes x {workers} workers)")
+        serve_prefork(httpd, processes)
+        return
+    elif mode == 'async':
+        from bff.async_server import run_async_server
+        start_outbox_worker()
+        run_async_server(BFFHandler, port, workers)
+        return
+    else:
+        raise ValueError(f"Unknown server mode: {mode}")
+
+    start_outbox_worker()
+
     try:
         httpd.serve_forever()
     except KeyboardInterrupt:
         print("\nShutting down server...")
-        httpd.shutdown()
+        httpd.server_close()
 
 if __name__ == '__main__':
     # Clear __pycache__ to avoid stale .pyc issues
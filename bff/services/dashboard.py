@@ -0,0 +1,98 @@
+"""Staff dashboard check-in cards and their live-update events.
+
+build_checkin_cards() is shared by GET /store/checkins/active and the
+'checkin' event so both send the same card shape. The publish_* helpers are
+called by routes after their change is committed.
+"""
+from bff.services.events import publish
+from bff.services.media import thumbnail_url
+from bff.services.loaders import (
+    load_users,
+    load_bottles_by_owner,
+    load_recent_checkins,
+    load_latest_memos
+)
+
+def store_channel(store_id):
+    """Event channel watched by /store/checkins/stream for store_id."""
+    return f'store:{store_id}'
+
+def bottle_card(bottle):
+    """camelCase bottle as shown on a check-in card."""
+    return {
+        'id': bottle['id'],
+        'type': bottle['type'],
+        'remainingPct': bottle.get('remaining_pct', 0),
+        'capacityMl': bottle.get('capacity_ml', 750),
+        'remainingMl': bottle.get('remaining_ml', 750),
+    }
+
+def memo_card(memo_row):
+    """camelCase latest memo, or None."""
+    if not memo_row:
+        return None
+    return {
+        'body': memo_row['body'],
+        'createdAt': memo_row['created_at'],
+        'staffName': memo_row['staff_name'],
+    }
+
+def build_checkin_cards(cursor, store_id, checkin_rows):
+    """Turn check_ins rows (id, user_id, status, created_at) into dashboard cards."""
+    user_ids = [row['user_id'] for row in checkin_rows]
+
+    # Load users, recent checkins, bottles and latest memos in one query each
+    users = load_users(cursor, user_ids)
+    # The two newest checkins per user: the current one and the one before it
+    recent_checkins = load_recent_checkins(cursor, store_id, user_ids)
+    bottles_by_user = load_bottles_by_owner(cursor, store_id, user_ids)
+    memos = load_latest_memos(cursor, store_id, user_ids)
+
+    checkins = []
+    for row in checkin_rows:
+        # User info with avatar
+        user = dict(users[row['user_id']]) if row['user_id'] in users else {'id': row['user_id'], 'name': '不明'}
+        if 'avatar_base64' in user:
+            user['avatarBase64'] = thumbnail_url(user.pop('avatar_base64', None))
+
+        # Previous checkin date (the one before current active)
+        previous_checkin = next(
+            (c['created_at'] for c in recent_checkins[row['user_id']] if c['id'] != row['id']), None
+        )
+
+        checkins.append({
+            'id': row['id'],
+            'userId': row['user_id'],
+            'userName': user.get('nickname') or user['name'],
+            'userAvatar': user.get('avatarBase64'),
+            'checkinTime': row['created_at'],
+            'previousCheckinDate': previous_checkin,
+            'status': row['status'],
+            'bottles': [bottle_card(b) for b in bottles_by_user[row['user_id']]],
+            'user': user,
+            'latestMemo': memo_card(memos.get(row['user_id'])),
+        })
+    return checkins
+
+def publish_checkin(cursor, store_id, checkin_id):
+    """Send the new check-in's card to the store's dashboards."""
+    cursor.execute("""
+        SELECT id, user_id, status, created_at FROM check_ins WHERE id = ?
+    """, (checkin_id,))
+    row = cursor.fetchone()
+    if row:
+        card = build_checkin_cards(cursor, store_id, [dict(row)])[0]
+        publish(store_channel(store_id), 'checkin', {'checkin': card})
+
+def publish_checkout(store_id, checkin_id, user_id):
+    """Tell the store's dashboards a check-in has ended."""
+    publish(store_channel(store_id), 'checkout', {'checkinId': checkin_id, 'userId': user_id})
+
+def publish_memo(cursor, store_id, user_id):
+    """Send the customer's latest memo to the store's dashboards."""
+    memo = memo_card(load_latest_memos(cursor, store_id, [user_id]).get(user_id))
+    publish(store_channel(store_id), 'memo', {'userId': user_id, 'latestMemo': memo})
+
+def publish_bottle(store_id, user_id, bottle):
+    """Send a changed or added bottle (bottles row dict) to the store's dashboards."""
+    publish(store_channel(store_id), 'bottle', {'userId': user_id, 'bottle': bottle_card(bottle)})
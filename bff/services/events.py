@@ -0,0 +1,217 @@
+"""In-process event bus for live updates over Server-Sent Events.
+
+Routes publish small JSON events to a channel (e.g. 'store:<id>'); stream
+handlers wait on the channel and write them out. Each channel keeps a short
+replay backlog so a client that reconnects with Last-Event-ID picks up what it
+missed. Memory is bounded by EVENT_BACKLOG per channel and EVENT_MAX_CHANNELS.
+
+Long-poll routes use wait_then(); behind the async front end the request is
+parked on the event loop instead of holding a worker thread while it waits.
+The thread front ends answer long-polls at once and the client polls again
+after POLL_INTERVAL, so SSE_MAX_STREAMS only limits real streams.
+
+Event IDs are '<epoch>-<seq>' strings. The epoch is drawn at random when the
+process starts (and again in a forked child), so an ID from before a restart
+or from another prefork worker is never mistaken for a position in this
+process's backlog: waiting from it reports complete=False and the client
+reloads.
+
+The bus lives in one process: in prefork mode a worker only sees events
+published by requests it served itself, so prefork workers call
+disable_streams() and dashboards poll instead.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+EVENT_BACKLOG = int(os.environ.get('BFF_EVENT_BACKLOG', 200))
+EVENT_MAX_CHANNELS = int(os.environ.get('BFF_EVENT_MAX_CHANNELS', 10000))
+SSE_HEARTBEAT = float(os.environ.get('BFF_SSE_HEARTBEAT', 15))
+SSE_MAX_SECONDS = float(os.environ.get('BFF_SSE_MAX_SECONDS', 300))
+SSE_MAX_STREAMS = int(os.environ.get('BFF_SSE_MAX_STREAMS', 8))
+LONG_POLL_TIMEOUT = float(os.environ.get('BFF_LONG_POLL_TIMEOUT', 25))
+# Seconds a long-poll client should wait before asking again when the server could not hold the request
+POLL_INTERVAL = float(os.environ.get('BFF_POLL_INTERVAL', 30))
+
+_cond = threading.Condition()
+_channels = OrderedDict()  # channel -> deque of (seq, event type, data json)
+_waiters = {}  # channel -> set of callbacks to run on the next publish
+_epoch = os.urandom(4).hex()
+_seq = 0
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+_streams_enabled = True
+
+def _new_epoch():
+    """Start a fresh bus (a forked worker must not share the parent's IDs)."""
+    global _epoch, _seq
+    _epoch = os.urandom(4).hex()
+    _seq = 0
+    _channels.clear()
+    _waiters.clear()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_new_epoch)
+
+def format_event_id(seq):
+    return f'{_epoch}-{seq}'
+
+def parse_event_id(event_id):
+    """Sequence number of an ID issued by this process, or None for any other value."""
+    epoch, sep, seq = str(event_id).partition('-')
+    if not sep or epoch != _epoch or not seq.isdigit():
+        return None
+    seq = int(seq)
+    return seq if seq <= _seq else None
+
+def current_event_id():
+    """ID of the newest event so far; pass to a stream to resume from this point."""
+    return format_event_id(_seq)
+
+def _backlog(channel):
+    """Get or create channel's backlog, evicting the least recently used channel."""
+    backlog = _channels.get(channel)
+    if backlog is None:
+        backlog = _channels[channel] = deque(maxlen=EVENT_BACKLOG)
+        while len(_channels) > EVENT_MAX_CHANNELS:
+            _channels.popitem(last=False)
+    else:
+        _channels.move_to_end(channel)
+    return backlog
+
+def publish(channel, event_type, data, watched_only=False):
+    """Append an event to channel and wake its streams.
+
+    With watched_only, skip channels nobody has waited on recently (bulk
+    fan-out to users who are not online).
+    """
+    global _seq
+    payload = json.dumps(data)
+    with _cond:
+        if watched_only and channel not in _channels:
+            return
+        _seq += 1
+        _backlog(channel).append((_seq, event_type, payload))
+        _cond.notify_all()
+        for wake in _waiters.pop(channel, ()):
+            wake()
+
+def watch(channel):
+    """Start keeping channel's events (watched_only publishes skip unknown channels).
+
+    Returns the current event ID: a client that waits from it sees every
+    event published to channel after this call.
+    """
+    with _cond:
+        _backlog(channel)
+        return format_event_id(_seq)
+
+def _latest_id(channel):
+    backlog = _channels.get(channel)
+    return backlog[-1][0] if backlog else 0
+
+def wait_events(channel, after_id, timeout):
+    """Return (events newer than after_id, complete) waiting up to timeout for one.
+
+    Events are (event ID, type, data json). complete is False when after_id is
+    older than the backlog reaches or was not issued by this process (a
+    restart, another prefork worker), so the client must reload instead of
+    replaying.
+    """
+    with _cond:
+        after_seq = parse_event_id(after_id)
+        if after_seq is None:
+            return [], False
+        _backlog(channel)
+        _cond.wait_for(lambda: _latest_id(channel) > after_seq, timeout)
+        backlog = _channels.get(channel)
+        if not backlog:
+            return [], True
+        complete = len(backlog) < backlog.maxlen or backlog[0][0] <= after_seq
+        events = [(format_event_id(seq), event_type, payload)
+                  for seq, event_type, payload in backlog if seq > after_seq]
+        return events, complete
+
+def add_waiter(channel, after_id, wake):
+    """Register wake() for the next event on channel.
+
+    Returns False without registering if an event newer than after_id is
+    already there (or after_id is unknown), so the caller should not wait.
+    wake() runs with the bus lock held and must only schedule work.
+    """
+    with _cond:
+        after_seq = parse_event_id(after_id)
+        if after_seq is None or _latest_id(channel) > after_seq:
+            return False
+        _backlog(channel)
+        _waiters.setdefault(channel, set()).add(wake)
+        return True
+
+def remove_waiter(channel, wake):
+    with _cond:
+        waiters = _waiters.get(channel)
+        if waiters:
+            waiters.discard(wake)
+            if not waiters:
+                del _waiters[channel]
+
+def can_park(handler):
+    """True when handler's front end can hold a request open without a thread (async mode)."""
+    return getattr(handler, 'park_until_event', None) is not None
+
+def wait_then(handler, channel, after_id, timeout, respond):
+    """Call respond(events, complete) once channel has events after after_id or timeout passes.
+
+    Only handlers that can park a request (the async front end) wait. On the
+    thread front ends a wait would hold a worker, so the current state is
+    returned at once and the client should come back after POLL_INTERVAL.
+    """
+    if can_park(handler):
+        handler.park_until_event(channel, after_id, timeout, lambda: respond(*wait_events(channel, after_id, 0)))
+        return
+    respond(*wait_events(channel, after_id, 0))
+
+def disable_streams():
+    """Refuse SSE in this process: it is one of several workers, each with its own bus."""
+    global _streams_enabled
+    _streams_enabled = False
+
+def streams_enabled():
+    return _streams_enabled
+
+def acquire_stream_slot():
+    """Reserve one of SSE_MAX_STREAMS long-lived SSE streams; False if all are taken."""
+    return _stream_slots.acquire(blocking=False)
+
+def release_stream_slot():
+    _stream_slots.release()
+
+def stream_events(handler, channel, last_event_id=None):
+    """Write events for channel to handler.wfile until the client goes away.
+
+    Headers must already be sent. The stream ends after SSE_MAX_SECONDS so the
+    client reconnects (re-checking its token) and resumes from Last-Event-ID.
+    """
+    after_id = last_event_id or current_event_id()
+
+    deadline = time.monotonic() + SSE_MAX_SECONDS
+    try:
+        handler.wfile.write(b'retry: 3000\n\n')
+        handler.wfile.flush()
+        while time.monotonic() < deadline:
+            events, complete = wait_events(channel, after_id, SSE_HEARTBEAT)
+            if not complete:
+                after_id = current_event_id()
+                handler.wfile.write(f"id: {after_id}\nevent: reset\ndata: {{}}\n\n".encode())
+            elif events:
+                chunks = []
+                for event_id, event_type, payload in events:
+                    chunks.append(f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n")
+                after_id = events[-1][0]
+                handler.wfile.write(''.join(chunks).encode())
+            else:
+                handler.wfile.write(b': ping\n\n')
+            handler.wfile.flush()
+    except (BrokenPipeError, ConnectionError, OSError):
+        pass
@@ -0,0 +1,78 @@
+"""Per-user cache for the GET /consumer/home response.
+
+Entries are dropped when the user's check-ins, bottles or amigos change, and
+for all of a user's amigos when that user checks in or out (home lists which
+amigos are in each store). The TTL bounds staleness between prefork workers,
+which do not share this memory.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from bff.db import get_connection
+
+HOME_CACHE_TTL = float(os.environ.get('BFF_HOME_CACHE_TTL', 15))
+HOME_CACHE_MAX_USERS = int(os.environ.get('BFF_HOME_CACHE_MAX_USERS', 5000))
+
+_cache = OrderedDict()  # user_id -> (expires_at, body bytes)
+_lock = threading.Lock()
+_generation = 0
+
+def get_home_generation():
+    """Token to pass to set_home_cache; any invalidation in between voids the write."""
+    return _generation
+
+def get_home_cache(user_id):
+    """Return the cached home body for user_id, or None."""
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry is None:
+            return None
+        expires_at, body = entry
+        if expires_at < time.monotonic():
+            del _cache[user_id]
+            return None
+        _cache.move_to_end(user_id)
+        return body
+
+def set_home_cache(user_id, body, generation):
+    """Cache body unless something was invalidated since generation was read."""
+    if HOME_CACHE_TTL <= 0:
+        return
+    with _lock:
+        if generation != _generation:
+            return
+        _cache[user_id] = (time.monotonic() + HOME_CACHE_TTL, body)
+        _cache.move_to_end(user_id)
+        while len(_cache) > HOME_CACHE_MAX_USERS:
+            _cache.popitem(last=False)
+
+def invalidate_home(*user_ids):
+    """Drop cached home for the given users."""
+    global _generation
+    with _lock:
+        _generation += 1
+        for user_id in user_ids:
+            _cache.pop(user_id, None)
+
+def invalidate_home_with_amigos(user_id):
+    """Drop cached home for user_id and everyone with an active amigo link to them."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT requester_user_id, target_user_id FROM amigos
+        WHERE status = 'active' AND (requester_user_id = ? OR target_user_id = ?)
+    """, (user_id, user_id))
+    user_ids = {user_id}
+    for row in cursor.fetchall():
+        user_ids.add(row['requester_user_id'])
+        user_ids.add(row['target_user_id'])
+    conn.close()
+    invalidate_home(*user_ids)
+
+def clear_home_cache():
+    """Drop every cached home (store name or logo changed)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.clear()
@@ -0,0 +1,119 @@
+"""Batched loaders for list endpoints.
+
+Collect the IDs a page needs first, then call one of these to fetch each
+entity type with a single IN (...) query (chunked for SQLite's bound-parameter
+limit) instead of one query per row. Each loader takes the caller's cursor and
+returns a dict keyed by the ID that was asked for.
+"""
+
+# Stay well under SQLITE_MAX_VARIABLE_NUMBER (999 on older builds)
+IN_CHUNK_SIZE = 500
+
+def chunked(ids, size=IN_CHUNK_SIZE):
+    """Split ids (deduplicated, order kept) into lists of at most size items."""
+    unique = list(dict.fromkeys(ids))
+    for i in range(0, len(unique), size):
+        yield unique[i:i + size]
+
+def placeholders(items):
+    """Return '?, ?, ...' with one placeholder per item."""
+    return ', '.join('?' * len(items))
+
+def load_users(cursor, user_ids):
+    """{user_id: {id, name, nickname, avatar_base64}}"""
+    users = {}
+    for chunk in chunked(user_ids):
+        cursor.execute(f"""
+            SELECT id, name, nickname, avatar_base64 FROM users
+            WHERE id IN ({placeholders(chunk)})
+        """, chunk)
+        for row in cursor.fetchall():
+            users[row['id']] = dict(row)
+    return users
+
+def load_bottles_by_owner(cursor, store_id, user_ids):
+    """{user_id: [{id, type, remaining_pct, capacity_ml, remaining_ml}, ...]} for bottles at store_id."""
+    bottles = {user_id: [] for user_id in user_ids}
+    for chunk in chunked(user_ids):
+        cursor.execute(f"""
+            SELECT owner_user_id, id, type, remaining_pct, capacity_ml, remaining_ml
+            FROM bottles
+            WHERE store_id = ? AND owner_user_id IN ({placeholders(chunk)})
+        """, [store_id] + chunk)
+        for row in cursor.fetchall():
+            bottle = dict(row)
+            bottles[bottle.pop('owner_user_id')].append(bottle)
+    return bottles
+
+def load_bottle_counts(cursor, store_id, user_ids):
+    """{user_id: number of bottles at store_id}"""
+    counts = {user_id: 0 for user_id in user_ids}
+    for chunk in chunked(user_ids):
+        cursor.execute(f"""
+            SELECT owner_user_id, COUNT(*) as count FROM bottles
+            WHERE store_id = ? AND owner_user_id IN ({placeholders(chunk)})
+            GROUP BY owner_user_id
+        """, [store_id] + chunk)
+        for row in cursor.fetchall():
+            counts[row['owner_user_id']] = row['count']
+    return counts
+
+def load_last_checkins(cursor, store_id, user_ids):
+    """{user_id: latest check-in created_at at store_id}"""
+    last = {}
+    for chunk in chunked(user_ids):
+        cursor.execute(f"""
+            SELECT user_id, MAX(created_at) as created_at FROM check_ins
+            WHERE store_id = ? AND user_id IN ({placeholders(chunk)})
+            GROUP BY user_id
+        """, [store_id] + chunk)
+        for row in cursor.fetchall():
+            last[row['user_id']] = row['created_at']
+    return last
+
+def load_recent_checkins(cursor, store_id, user_ids, limit=2):
+    """{user_id: [{id, created_at}, ...]} with each user's newest check-ins at store_id, newest first."""
+    recent = {user_id: [] for user_id in user_ids}
+    for chunk in chunked(user_ids):
+        cursor.execute(f"""
+            SELECT user_id, id, created_at FROM (
+                SELECT user_id, id, created_at,
+                       ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at DESC) as rn
+                FROM check_ins
+                WHERE store_id = ? AND user_id IN ({placeholders(chunk)})
+            )
+            WHERE rn <= ?
+            ORDER BY user_id, rn
+        """, [store_id] + chunk + [limit])
+        for row in cursor.fetchall():
+            recent[row['user_id']].append({'id': row['id'], 'created_at': row['created_at']})
+    return recent
+
+def load_active_checkin_users(cursor, store_id, user_ids):
+    """Subset of user_ids with an active check-in at store_id."""
+    active = set()
+    for chunk in chunked(user_ids):
+        cursor.execute(f"""
+            SELECT DISTINCT user_id FROM check_ins
+            WHERE store_id = ? AND status = 'active' AND user_id IN ({placeholders(chunk)})
+        """, [store_id] + chunk)
+        active.update(row['user_id'] for row in cursor.fetchall())
+    return active
+
+def load_latest_memos(cursor, store_id, user_ids):
+    """{user_id: {body, created_at, staff_name}} for each user's newest memo at store_id."""
+    memos = {}
+    for chunk in chunked(user_ids):
+        cursor.execute(f"""
+            SELECT user_id, body, created_at, staff_name FROM (
+                SELECT cm.user_id, cm.body, cm.created_at, sa.name as staff_name,
+                       ROW_NUMBER() OVER (PARTITION BY cm.user_id ORDER BY cm.created_at DESC) as rn
+                FROM customer_memos cm
+                LEFT JOIN staff_accounts sa ON cm.author_staff_id = sa.id
+                WHERE cm.store_id = ? AND cm.user_id IN ({placeholders(chunk)})
+            )
+            WHERE rn = 1
+        """, [store_id] + chunk)
+        for row in cursor.fetchall():
+            memos[row['user_id']] = dict(row)
+    return memos
@@ -0,0 +1,237 @@
+"""Content-addressed image store.
+
+The apps upload avatars, store logos and bottle images as data: URIs.
+store_image() keeps the bytes once in the media table under their SHA-256
+and returns the '/media/<hash>' URL, which is what the avatar_base64,
+logo_base64 and image_base64 columns hold from schema version 6 on. The URL
+never changes meaning, so GET /media/<hash> is cached by clients for good.
+
+When an image codec is installed (Pillow if importable, or whatever
+set_image_codec() installs), list views link to '/media/<hash>/thumb' and
+thumbnails are made on upload. The Docker image is stdlib only and has no
+codec, so there thumbnail_url() returns the original URL and list views
+load full images.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import struct
+import sys
+
+try:
+    from PIL import Image
+except ImportError:  # stdlib-only deployments (the Docker image) have no codec
+    Image = None
+
+MEDIA_PREFIX = '/media/'
+MEDIA_MAX_BYTES = int(os.environ.get('BFF_MEDIA_MAX_BYTES', 5 * 1024 * 1024))
+# Refuse images whose header claims more pixels than this (decompression bombs)
+MEDIA_MAX_PIXELS = int(os.environ.get('BFF_MEDIA_MAX_PIXELS', 25_000_000))
+MEDIA_THUMB_SIZE = int(os.environ.get('BFF_MEDIA_THUMB_SIZE', 128))
+
+# Variant name -> longest side in pixels
+MEDIA_VARIANTS = {'thumb': MEDIA_THUMB_SIZE}
+
+MEDIA_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+# Leading bytes of the image formats we accept -> Content-Type.
+# SVG is left out on purpose: it can carry script and is served from our origin.
+IMAGE_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+
+def media_url(media_hash):
+    return MEDIA_PREFIX + media_hash
+
+def thumbnail_url(url):
+    """List-view URL for an image column value (the original without a codec; other values pass through)."""
+    if _codec is not None and media_hash_from_url(url):
+        return url + '/thumb'
+    return url
+
+def media_hash_from_url(url):
+    """Return the hash in a '/media/<hash>' URL, or None."""
+    if not isinstance(url, str) or not url.startswith(MEDIA_PREFIX):
+        return None
+    media_hash = url[len(MEDIA_PREFIX):]
+    return media_hash if MEDIA_HASH.match(media_hash) else None
+
+def sniff_content_type(data):
+    """Content-Type of an accepted image, or None."""
+    for signature, content_type in IMAGE_SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def image_size(data):
+    """(width, height) read from an accepted image's header, or None."""
+    if data.startswith(b'\x89PNG') and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+    if data.startswith(b'GIF') and len(data) >= 10:
+        return struct.unpack('<HH', data[6:10])
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        chunk = data[12:16]
+        if chunk == b'VP8 ' and len(data) >= 30:
+            width, height = struct.unpack('<HH', data[26:30])
+            return width & 0x3fff, height & 0x3fff
+        if chunk == b'VP8L' and len(data) >= 25:
+            bits = int.from_bytes(data[21:25], 'little')
+            return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+        if chunk == b'VP8X' and len(data) >= 30:
+            return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+        return None
+    if data.startswith(b'\xff\xd8'):
+        # Walk the JPEG segments up to the start-of-frame marker
+        i = 2
+        while i + 9 <= len(data):
+            if data[i] != 0xFF:
+                return None
+            marker = data[i + 1]
+            if marker == 0xFF:
+                i += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                i += 2
+                continue
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack('>HH', data[i + 5:i + 9])
+                return width, height
+            i += 2 + struct.unpack('>H', data[i + 2:i + 4])[0]
+    return None
+
+def decode_image(value):
+    """Decode a data: URI (or bare base64) into (content_type, bytes).
+
+    The type is taken from the bytes, not the URI. Raises ValueError for
+    anything that is not an accepted image or is over MEDIA_MAX_BYTES.
+    """
+    encoded = value.split(',', 1)[1] if value.startswith('data:') and ',' in value else value
+    # base64 grows data by 4/3; refuse before decoding something huge
+    if len(encoded) > MEDIA_MAX_BYTES * 4 // 3 + 4:
+        raise ValueError('Image is too large')
+    try:
+        data = base64.b64decode(encoded, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError('Image is not valid base64')
+    if len(data) > MEDIA_MAX_BYTES:
+        raise ValueError('Image is too large')
+    content_type = sniff_content_type(data)
+    if content_type is None:
+        raise ValueError('Unsupported image type')
+    size = image_size(data)
+    if not size or not all(size):
+        raise ValueError('Unreadable image')
+    if size[0] * size[1] > MEDIA_MAX_PIXELS:
+        raise ValueError('Image is too large')
+    return content_type, data
+
+def pillow_thumbnail(data, max_side):
+    """Codec using Pillow: shrink to fit max_side, JPEG (PNG if transparent)."""
+    with Image.open(io.BytesIO(data)) as img:
+        img.thumbnail((max_side, max_side))
+        out = io.BytesIO()
+        if img.mode in ('RGBA', 'LA', 'P'):
+            img.save(out, 'PNG', optimize=True)
+            return 'image/png', out.getvalue()
+        img.convert('RGB').save(out, 'JPEG', quality=80)
+        return 'image/jpeg', out.getvalue()
+
+_codec = pillow_thumbnail if Image is not None else None
+
+def set_image_codec(codec):
+    """Install codec(data, max_side) -> (content_type, bytes) for thumbnails (None disables)."""
+    global _codec
+    _codec = codec
+
+def put_media(cursor, content_type, data):
+    """Store bytes under their hash (once) and return the hash."""
+    media_hash = hashlib.sha256(data).hexdigest()
+    cursor.execute("""
+        INSERT OR IGNORE INTO media (hash, content_type, size, data) VALUES (?, ?, ?, ?)
+    """, (media_hash, content_type, len(data), data))
+    return media_hash
+
+def store_image(cursor, value):
+    """Turn an uploaded image field into the value to save in its column.
+
+    None and '' (no image / remove image) pass through, as does a media URL
+    the client sent back unchanged. Anything else is decoded, stored and
+    replaced by its media URL. Raises ValueError for an invalid image.
+    """
+    if not value:
+        return value
+    if not isinstance(value, str):
+        raise ValueError('Image must be a string')
+    media_hash = media_hash_from_url(value)
+    if media_hash:
+        cursor.execute("SELECT 1 FROM media WHERE hash = ?", (media_hash,))
+        if not cursor.fetchone():
+            raise ValueError('Unknown media')
+        return value
+    content_type, data = decode_image(value)
+    media_hash = put_media(cursor, content_type, data)
+    for variant in MEDIA_VARIANTS:
+        make_variant(cursor, media_hash, data, variant)
+    return media_url(media_hash)
+
+def make_variant(cursor, media_hash, data, variant):
+    """Store the variant of media_hash's image and return (content_type, bytes).
+
+    Returns None when there is nothing to store: the image already fits (the
+    original serves as the variant) or no codec is installed.
+    """
+    max_side = MEDIA_VARIANTS[variant]
+    size = image_size(data)
+    if _codec is None or (size and max(size) <= max_side):
+        return None
+    try:
+        content_type, variant_data = _codec(data, max_side)
+    except Exception as e:
+        print(f"[MEDIA] {variant} of {media_hash} failed: {e}", file=sys.stderr)
+        return None
+    cursor.execute("""
+        INSERT OR REPLACE INTO media_variants (hash, variant, variant_hash) VALUES (?, ?, ?)
+    """, (media_hash, variant, put_media(cursor, content_type, variant_data)))
+    return content_type, variant_data
+
+def load_media(cursor, media_hash):
+    """Return the media row (content_type, size, data) for media_hash, or None."""
+    cursor.execute("""
+        SELECT content_type, size, data FROM media WHERE hash = ?
+    """, (media_hash,))
+    return cursor.fetchone()
+
+def load_variant(cursor, media_hash, variant):
+    """Return (content_type, data, final) for a variant of media_hash, or None.
+
+    final is False when the original stands in for a variant that a codec
+    could still produce, so the response must not be cached as immutable.
+    Variants missing from images stored before a codec was installed are
+    made here on first request.
+    """
+    cursor.execute("""
+        SELECT m.content_type, m.data FROM media_variants v
+        JOIN media m ON m.hash = v.variant_hash
+        WHERE v.hash = ? AND v.variant = ?
+    """, (media_hash, variant))
+    row = cursor.fetchone()
+    if row:
+        return row['content_type'], row['data'], True
+
+    original = load_media(cursor, media_hash)
+    if not original:
+        return None
+    made = make_variant(cursor, media_hash, original['data'], variant)
+    if made:
+        return made[0], made[1], True
+    size = image_size(original['data'])
+    fits = bool(size) and max(size) <= MEDIA_VARIANTS[variant]
+    return original['content_type'], original['data'], fits
@@ -0,0 +1,96 @@
+"""In-process request metrics, served as Prometheus text at GET /metrics.
+
+The server front ends call observe() once per response with the route name
+from the router (or a fixed label such as 'GET static' for everything else,
+so raw paths never become labels). Each call is a dict lookup and a few
+additions under one lock, cheap enough to leave on.
+
+Counters are per process: in prefork mode each scrape sees one worker.
+"""
+import bisect
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in seconds (+Inf is implied)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_lock = threading.Lock()
+_routes = {}  # route name -> RouteStats
+_started = time.time()
+
+class RouteStats:
+    __slots__ = ('statuses', 'buckets', 'latency_sum', 'count', 'bytes_in', 'bytes_out')
+
+    def __init__(self):
+        self.statuses = {}  # '2xx' etc. -> count
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # non-cumulative; last is +Inf
+        self.latency_sum = 0.0
+        self.count = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+def observe(route, status, seconds, bytes_in, bytes_out):
+    """Record one finished response."""
+    status_class = f'{status // 100}xx' if status else 'none'
+    bucket = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = RouteStats()
+        stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+        stats.buckets[bucket] += 1
+        stats.latency_sum += seconds
+        stats.count += 1
+        stats.bytes_in += bytes_in
+        stats.bytes_out += bytes_out
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def render():
+    """Everything observed in this process, in the Prometheus text format."""
+    with _lock:
+        snapshot = [
+            (route, dict(s.statuses), list(s.buckets), s.latency_sum, s.count, s.bytes_in, s.bytes_out)
+            for route, s in sorted(_routes.items())
+        ]
+
+    lines = [
+        '# HELP bff_process_start_time_seconds Start time of this server process.',
+        '# TYPE bff_process_start_time_seconds gauge',
+        f'bff_process_start_time_seconds {_started:.3f}',
+        '# HELP bff_requests_total Responses by route and status class.',
+        '# TYPE bff_requests_total counter',
+    ]
+    for route, statuses, *_ in snapshot:
+        for status_class, count in sorted(statuses.items()):
+            lines.append(f'bff_requests_total{{route="{_label(route)}",status="{status_class}"}} {count}')
+
+    lines += [
+        '# HELP bff_request_duration_seconds Time from taking the request to sending its response.',
+        '# TYPE bff_request_duration_seconds histogram',
+    ]
+    for route, _, buckets, latency_sum, count, _, _ in snapshot:
+        label = _label(route)
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+            cumulative += n
+            lines.append(f'bff_request_duration_seconds_bucket{{route="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'bff_request_duration_seconds_sum{{route="{label}"}} {latency_sum:.6f}')
+        lines.append(f'bff_request_duration_seconds_count{{route="{label}"}} {count}')
+
+    lines += [
+        '# HELP bff_request_bytes_total Request body bytes received.',
+        '# TYPE bff_request_bytes_total counter',
+    ]
+    for route, _, _, _, _, bytes_in, _ in snapshot:
+        lines.append(f'bff_request_bytes_total{{route="{_label(route)}"}} {bytes_in}')
+
+    lines += [
+        '# HELP bff_response_bytes_total Response bytes sent, after compression.',
+        '# TYPE bff_response_bytes_total counter',
+    ]
+    for route, _, _, _, _, _, bytes_out in snapshot:
+        lines.append(f'bff_response_bytes_total{{route="{_label(route)}"}} {bytes_out}')
+
+    return '\n'.join(lines) + '\n'
@@ -1,6 +1,157 @@
+import os
 import uuid
 import json
+from datetime import datetime, timezone
 from bff.db import get_connection
+from bff.services.events import publish
+from bff.services.outbox import enqueue, register_job
+
+# Rows per executemany batch when fanning out to many recipients
+FAN_OUT_CHUNK_SIZE = 500
+
+# 'write': a store post adds a notification row per bottle holder.
+# 'read': posts are stored once and merged into each holder's timeline on read.
+STORE_POST_FANOUT = os.environ.get('BFF_STORE_POST_FANOUT', 'write')
+
+NOTIFICATION_LIMIT = 100
+
+def notification_channel(user_id):
+    """Event channel polled by /consumer/notifications/poll for user_id."""
+    return f'user:{user_id}'
+
+def now_sql():
+    """Current UTC time in the format SQLite's datetime('now') stores."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def resolve_payload(cursor, data):
+    """Fill in store_id, storeName and userName so reading a notification needs no lookups."""
+    # store_id for navigation
+    if 'store_id' not in data and 'bottle_id' in data:
+        bottle_row = cursor.execute(
+            "SELECT store_id FROM bottles WHERE id = ?",
+            (data['bottle_id'],)
+        ).fetchone()
+        if bottle_row:
+            data['store_id'] = bottle_row['store_id']
+
+    # storeName for display
+    if 'storeName' not in data and 'store_id' in data:
+        store_row = cursor.execute(
+            "SELECT name FROM stores WHERE id = ?",
+            (data['store_id'],)
+        ).fetchone()
+        if store_row:
+            data['storeName'] = store_row['name']
+
+    # userName for checkin/share notifications
+    if 'userName' not in data and 'user_id' in data:
+        user_row = cursor.execute(
+            "SELECT name, nickname FROM users WHERE id = ?",
+            (data['user_id'],)
+        ).fetchone()
+        if user_row:
+            data['userName'] = user_row['nickname'] or user_row['name']
+
+    return data
+
+def format_notification(row):
+    """notifications row (id, type, payload_json, created_at, read_at) -> API shape."""
+    notification = dict(row)
+    notification['data'] = json.loads(notification.pop('payload_json'))
+    notification['createdAt'] = notification.pop('created_at', '')
+    notification['readAt'] = notification.pop('read_at', None)
+    return notification
+
+def store_post_notification_id(post_id):
+    """Notification id for a post merged into timelines in 'read' fan-out mode."""
+    return f'store_post:{post_id}'
+
+def load_store_post_feed(cursor, user_id, read_at, limit=NOTIFICATION_LIMIT):
+    """Store posts for user_id's timeline, shaped like store_post notifications.
+
+    A user follows the stores where they hold a bottle, from the first bottle's
+    creation on, matching who 'write' mode would have notified.
+    """
+    cursor.execute("""
+        SELECT sp.id, sp.store_id, sp.type, sp.title, sp.body, sp.created_at, s.name as store_name
+        FROM (
+            SELECT store_id, MIN(created_at) as since FROM bottles
+            WHERE owner_user_id = ?
+            GROUP BY store_id
+        ) f
+        JOIN store_posts sp ON sp.store_id = f.store_id AND sp.created_at >= f.since
+        LEFT JOIN stores s ON s.id = sp.store_id
+        ORDER BY sp.created_at DESC
+        LIMIT ?
+    """, (user_id, limit))
+    posts = []
+    for row in cursor.fetchall():
+        posts.append({
+            'id': store_post_notification_id(row['id']),
+            'type': 'store_post',
+            'data': {
+                'store_id': row['store_id'],
+                'post_id': row['id'],
+                'post_type': row['type'],
+                'storeName': row['store_name'] or '',
+                'content': row['title'] or row['body'] or '',
+            },
+            'createdAt': row['created_at'],
+            'readAt': read_at if read_at and row['created_at'] <= read_at else None,
+        })
+    return posts
+
+def load_notifications(cursor, user_id, limit=NOTIFICATION_LIMIT):
+    """user_id's notification timeline, newest first, in the API shape."""
+    cursor.execute("""
+        SELECT id, type, payload_json, created_at, read_at
+        FROM notifications
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+    """, (user_id, limit))
+    notifications = [format_notification(row) for row in cursor.fetchall()]
+    if STORE_POST_FANOUT != 'read':
+        return notifications
+
+    cursor.execute("SELECT read_at FROM notification_read_cursors WHERE user_id = ?", (user_id,))
+    cursor_row = cursor.fetchone()
+    read_at = cursor_row['read_at'] if cursor_row else None
+
+    # Rows written before switching to 'read' mode already cover their posts
+    stored_posts = {n['data'].get('post_id') for n in notifications if n['type'] == 'store_post'}
+    posts = [p for p in load_store_post_feed(cursor, user_id, read_at, limit)
+             if p['data']['post_id'] not in stored_posts]
+    merged = sorted(notifications + posts, key=lambda n: n['createdAt'], reverse=True)
+    return merged[:limit]
+
+def mark_notifications_read(cursor, user_id):
+    """Mark everything in user_id's timeline read as of now; returns the timestamp."""
+    read_at = now_sql()
+    cursor.execute("""
+        UPDATE notifications SET read_at = ?
+        WHERE user_id = ? AND read_at IS NULL
+    """, (read_at, user_id))
+    cursor.execute("""
+        INSERT INTO notification_read_cursors (user_id, read_at) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET read_at = excluded.read_at
+    """, (user_id, read_at))
+    return read_at
+
+def publish_notifications(notification_type, payload, created_at, recipients):
+    """Push committed notifications sharing one payload to recipients who are listening.
+
+    recipients is a list of (notification_id, user_id).
+    """
+    if not recipients:
+        return
+    template = format_notification({
+        'id': None, 'type': notification_type, 'payload_json': payload,
+        'created_at': created_at, 'read_at': None,
+    })
+    for notification_id, user_id in recipients:
+        publish(notification_channel(user_id), 'notification', dict(template, id=notification_id),
+                watched_only=True)
 
 def create_amigo_checkin_notification(user_id, store_id, checkin_id):
     """Create amigo checkin notifications for selected users."""
@@ -17,25 +168,43 @@ def create_amigo_checkin_notification(user_id, store_id, checkin_id):
     notify_to_user_ids = json.loads(checkin_row['notify_to_user_ids'])
 
     # Create notification for each user
+    created_at = now_sql()
+    payload = json.dumps(resolve_payload(cursor, {
+        'user_id': user_id,
+        'store_id': store_id,
+        'checkin_id': checkin_id
+    }))
+    recipients = []
     for target_user_id in notify_to_user_ids:
         notification_id = str(uuid.uuid4())
-        payload = json.dumps({
-            'user_id': user_id,
-            'store_id': store_id,
-            'checkin_id': checkin_id
-        })
         cursor.execute("""
-            INSERT INTO notifications (id, user_id, type, payload_json)
-            VALUES (?, ?, ?, ?)
-        """, (notification_id, target_user_id, 'amigo_checkin', payload))
+            INSERT INTO notifications (id, user_id, type, payload_json, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        """, (notification_id, target_user_id, 'amigo_checkin', payload, created_at))
+        recipients.append((notification_id, target_user_id))
 
     conn.commit()
+    publish_notifications('amigo_checkin', payload, created_at, recipients)
     conn.close()
 
-def create_store_post_notification(store_id, post_id, post_type):
-    """Create notifications for all bottle holders at the store."""
-    conn = get_connection()
-    cursor = conn.cursor()
+def queue_store_post_notification(cursor, store_id, post_id, post_type):
+    """Queue notifications to all bottle holders at the store (sent by the outbox worker)."""
+    enqueue(cursor, 'store_post_notification', {
+        'store_id': store_id,
+        'post_id': post_id,
+        'post_type': post_type,
+    })
+
+def fan_out_store_post_notification(cursor, args):
+    """Outbox job: notify every bottle holder at the store about a new post.
+
+    In 'write' mode this inserts one row per holder, sharing one serialized
+    payload, with executemany in FAN_OUT_CHUNK_SIZE batches inside the job's
+    transaction. In 'read' mode nothing is stored; listening holders are only
+    pushed the post as it will appear in their merged timeline.
+    """
+    store_id = args['store_id']
+    post_id = args['post_id']
 
     # Get store name
     cursor.execute("SELECT name FROM stores WHERE id = ?", (store_id,))
@@ -43,36 +212,44 @@ def create_store_post_notification(store_id, post_id, post_type):
     store_name = store_row['name'] if store_row else ''
 
     # Get post content
-    cursor.execute("SELECT title, body FROM store_posts WHERE id = ?", (post_id,))
+    cursor.execute("SELECT title, body, created_at FROM store_posts WHERE id = ?", (post_id,))
     post_row = cursor.fetchone()
-    post_content = ''
-    if post_row:
-        post_content = post_row['title'] or post_row['body'] or ''
+    if not post_row:
+        return None
+    post_content = post_row['title'] or post_row['body'] or ''
 
     # Get all users with bottles at this store
     cursor.execute("""
         SELECT DISTINCT owner_user_id FROM bottles WHERE store_id = ?
     """, (store_id,))
-    rows = cursor.fetchall()
-    user_ids = [row['owner_user_id'] for row in rows]
+    user_ids = [row['owner_user_id'] for row in cursor.fetchall()]
 
-    # Create notification for each user
-    for user_id in user_ids:
-        notification_id = str(uuid.uuid4())
-        payload = json.dumps({
-            'store_id': store_id,
-            'post_id': post_id,
-            'post_type': post_type,
-            'storeName': store_name,
-            'content': post_content
-        })
-        cursor.execute("""
-            INSERT INTO notifications (id, user_id, type, payload_json)
-            VALUES (?, ?, ?, ?)
-        """, (notification_id, user_id, 'store_post', payload))
+    payload = json.dumps({
+        'store_id': store_id,
+        'post_id': post_id,
+        'post_type': args['post_type'],
+        'storeName': store_name,
+        'content': post_content
+    })
 
-    conn.commit()
-    conn.close()
+    if STORE_POST_FANOUT == 'read':
+        notification_id = store_post_notification_id(post_id)
+        created_at = post_row['created_at']
+        recipients = [(notification_id, user_id) for user_id in user_ids]
+        return lambda: publish_notifications('store_post', payload, created_at, recipients)
+
+    created_at = now_sql()
+    recipients = [(str(uuid.uuid4()), user_id) for user_id in user_ids]
+    for i in range(0, len(recipients), FAN_OUT_CHUNK_SIZE):
+        cursor.executemany("""
+            INSERT INTO notifications (id, user_id, type, payload_json, created_at)
+            VALUES (?, ?, 'store_post', ?, ?)
+        """, [(notification_id, user_id, payload, created_at)
+              for notification_id, user_id in recipients[i:i + FAN_OUT_CHUNK_SIZE]])
+
+    return lambda: publish_notifications('store_post', payload, created_at, recipients)
+
+register_job('store_post_notification', fan_out_store_post_notification)
 
 def create_bottle_share_notification(shared_to_user_id, bottle_id, share_id):
     """Create notification for bottle share recipient."""
@@ -80,16 +257,18 @@ def create_bottle_share_notification(shared_to_user_id, bottle_id, share_id):
     cursor = conn.cursor()
 
     notification_id = str(uuid.uuid4())
-    payload = json.dumps({
+    created_at = now_sql()
+    payload = json.dumps(resolve_payload(cursor, {
         'bottle_id': bottle_id,
         'share_id': share_id
-    })
+    }))
     cursor.execute("""
-        INSERT INTO notifications (id, user_id, type, payload_json)
-        VALUES (?, ?, ?, ?)
-    """, (notification_id, shared_to_user_id, 'bottle_share', payload))
+        INSERT INTO notifications (id, user_id, type, payload_json, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (notification_id, shared_to_user_id, 'bottle_share', payload, created_at))
 
     conn.commit()
+    publish_notifications('bottle_share', payload, created_at, [(notification_id, shared_to_user_id)])
     conn.close()
 
 def create_bottle_gift_notification(target_user_id, bottle_id, gift_id):
@@ -98,14 +277,16 @@ def create_bottle_gift_notification(target_user_id, bottle_id, gift_id):
     cursor = conn.cursor()
 
     notification_id = str(uuid.uuid4())
-    payload = json.dumps({
+    created_at = now_sql()
+    payload = json.dumps(resolve_payload(cursor, {
         'bottle_id': bottle_id,
         'gift_id': gift_id
-    })
+    }))
     cursor.execute("""
-        INSERT INTO notifications (id, user_id, type, payload_json)
-        VALUES (?, ?, ?, ?)
-    """, (notification_id, target_user_id, 'bottle_gift', payload))
+        INSERT INTO notifications (id, user_id, type, payload_json, created_at)
+        VALUES (?, ?, ?, ?, ?)
+    """, (notification_id, target_user_id, 'bottle_gift', payload, created_at))
 
     conn.commit()
+    publish_notifications('bottle_gift', payload, created_at, [(notification_id, target_user_id)])
     conn.close()
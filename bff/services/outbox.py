@@ -0,0 +1,88 @@
+"""Durable outbox for work that should not hold up a request.
+
+A route calls enqueue() in the same transaction as the change that caused the
+work; a background thread in each server process runs queued jobs. A job's
+writes and the removal of its outbox row commit together, so a crash midway
+leaves the job queued to run again in full.
+"""
+import json
+import os
+import sys
+import threading
+from bff.db import get_connection
+
+OUTBOX_POLL_SECONDS = float(os.environ.get('BFF_OUTBOX_POLL', 2))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('BFF_OUTBOX_MAX_ATTEMPTS', 5))
+
+_handlers = {}  # kind -> handler(cursor, args), may return a callable to run after commit
+_wakeup = threading.Event()
+_worker_pid = None
+
+def register_job(kind, handler):
+    """Run handler(cursor, args) inside the job's transaction for each queued job of kind."""
+    _handlers[kind] = handler
+
+def enqueue(cursor, kind, args):
+    """Queue a job on cursor's connection; it becomes visible when that transaction commits."""
+    cursor.execute("""
+        INSERT INTO outbox (kind, args_json) VALUES (?, ?)
+    """, (kind, json.dumps(args)))
+    _wakeup.set()
+
+def run_pending():
+    """Run queued jobs until none are due. Returns the number completed."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    completed = 0
+    try:
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("""
+                SELECT id, kind, args_json, attempts FROM outbox
+                WHERE available_at <= datetime('now') AND attempts < ?
+                ORDER BY id
+                LIMIT 1
+            """, (OUTBOX_MAX_ATTEMPTS,))
+            job = cursor.fetchone()
+            if not job:
+                cursor.execute("ROLLBACK")
+                return completed
+
+            try:
+                after_commit = _handlers[job['kind']](cursor, json.loads(job['args_json']))
+                cursor.execute("DELETE FROM outbox WHERE id = ?", (job['id'],))
+                cursor.execute("COMMIT")
+            except Exception as e:
+                cursor.execute("ROLLBACK")
+                # Back off 2^attempts seconds; after OUTBOX_MAX_ATTEMPTS the row stays for inspection
+                print(f"[OUTBOX] job {job['id']} ({job['kind']}) failed: {e}", file=sys.stderr)
+                cursor.execute("""
+                    UPDATE outbox
+                    SET attempts = attempts + 1, last_error = ?,
+                        available_at = datetime('now', '+' || (1 << attempts) || ' seconds')
+                    WHERE id = ?
+                """, (str(e), job['id']))
+                continue
+
+            completed += 1
+            if after_commit:
+                after_commit()
+    finally:
+        conn.close()
+
+def _worker_loop():
+    while True:
+        try:
+            run_pending()
+        except Exception as e:
+            print(f"[OUTBOX] worker error: {e}", file=sys.stderr)
+        _wakeup.wait(OUTBOX_POLL_SECONDS)
+        _wakeup.clear()
+
+def start_outbox_worker():
+    """Start this process's outbox thread (once per process, so call again after fork)."""
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    _worker_pid = os.getpid()
+    threading.Thread(target=_worker_loop, name='bff-outbox', daemon=True).start()
@@ -0,0 +1,100 @@
+"""Password hashing with PBKDF2-SHA256 on a small process pool.
+
+Stored format: 'pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>'. Records
+in the original '<salt>:<sha256 hex>' format still verify; needs_rehash()
+tells the login route to upgrade them once the password is known.
+
+Each PBKDF2 run costs a few hundred milliseconds of CPU by design, so it runs
+in worker processes: at most PASSWORD_WORKERS at once, and at most
+PASSWORD_QUEUE_MAX admitted in total. Beyond that, PasswordQueueFull is
+raised so a login burst is turned away instead of tying up request workers.
+"""
+import hashlib
+import hmac
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+ALGORITHM = 'pbkdf2_sha256'
+
+PASSWORD_ITERATIONS = int(os.environ.get('BFF_PASSWORD_ITERATIONS', 600000))
+# Hashing processes per server process; 0 hashes on the request thread
+PASSWORD_WORKERS = int(os.environ.get('BFF_PASSWORD_WORKERS', 2))
+# Hash jobs running or waiting before new ones are refused
+PASSWORD_QUEUE_MAX = int(os.environ.get('BFF_PASSWORD_QUEUE_MAX', 16))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PASSWORD_QUEUE_MAX)
+
+class PasswordQueueFull(RuntimeError):
+    """Raised when PASSWORD_QUEUE_MAX hash jobs are already admitted."""
+
+def pbkdf2_hex(password, salt, iterations):
+    """Hex PBKDF2-SHA256 of password with a hex salt."""
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), iterations).hex()
+
+def make_hash(password, iterations=PASSWORD_ITERATIONS):
+    """Hash password in this process (scripts such as seed.py; routes use hash_password)."""
+    salt = os.urandom(16).hex()
+    return f'{ALGORITHM}${iterations}${salt}${pbkdf2_hex(password, salt, iterations)}'
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A prefork worker must not reuse the pool of the process it was forked from
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn, since forking a process that is already running request threads is unsafe
+            _pool = ProcessPoolExecutor(PASSWORD_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+def _run(fn, *args):
+    """Run fn(*args) on the hashing pool and wait for it."""
+    if not _slots.acquire(blocking=False):
+        raise PasswordQueueFull('Too many password checks in progress')
+    try:
+        if not PASSWORD_WORKERS:
+            return fn(*args)
+        pool = _get_pool()
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            global _pool
+            with _pool_lock:
+                if _pool is pool:
+                    _pool = None
+            raise
+    finally:
+        _slots.release()
+
+def hash_password(password):
+    """Hash a new password on the pool."""
+    return _run(make_hash, password)
+
+def verify_password(password, stored):
+    """Check password against a stored hash (None for an unknown account)."""
+    try:
+        if stored is None:
+            # Take as long as a real check so response times do not reveal which accounts exist
+            _run(pbkdf2_hex, password, '00' * 16, PASSWORD_ITERATIONS)
+            return False
+        if stored.startswith(ALGORITHM + '$'):
+            _, iterations, salt, hashed = stored.split('$')
+            return hmac.compare_digest(_run(pbkdf2_hex, password, salt, int(iterations)), hashed)
+        salt, hashed = stored.split(':')
+        return hmac.compare_digest(hashlib.sha256((salt + password).encode()).hexdigest(), hashed)
+    except (ValueError, AttributeError):
+        return False
+
+def needs_rehash(stored):
+    """True when stored uses the legacy format or fewer iterations than configured."""
+    if not stored or not stored.startswith(ALGORITHM + '$'):
+        return True
+    try:
+        return int(stored.split('$')[1]) < PASSWORD_ITERATIONS
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,80 @@
+"""Sampling profiler for a running server (GET /admin/profile).
+
+sample() wakes every PROFILE_INTERVAL, reads every other thread's current
+Python stack with sys._current_frames(), and counts identical stacks. Nothing
+is installed into the worker threads themselves, so requests run at full
+speed between samples and the live traffic pattern is what gets measured.
+
+Results are in the collapsed format read by flamegraph.pl and speedscope:
+one "thread;outer frame;...;leaf frame <count>" line per distinct stack.
+"""
+import os
+import sys
+import threading
+import time
+
+PROFILE_INTERVAL = float(os.environ.get('BFF_PROFILE_INTERVAL_MS', 10)) / 1000
+PROFILE_MAX_SECONDS = float(os.environ.get('BFF_PROFILE_MAX_SECONDS', 60))
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BFF_DIR = os.path.join(PROJECT_ROOT, 'bff') + os.sep
+
+# A stack whose innermost frame is in one of these is parked, not working
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py', 'socketserver.py', 'socket.py')
+
+_running = threading.Lock()
+
+class ProfilerBusy(RuntimeError):
+    """Raised when another profile is already being taken."""
+
+def _frame_label(code):
+    path = code.co_filename
+    if path.startswith(PROJECT_ROOT + os.sep):
+        path = os.path.relpath(path, PROJECT_ROOT)
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def _is_idle(codes):
+    """True for a thread waiting for work rather than serving a request."""
+    if os.path.basename(codes[0].co_filename) in IDLE_MODULES:
+        return True
+    return not any(code.co_filename.startswith(BFF_DIR) for code in codes)
+
+def sample(seconds, interval=PROFILE_INTERVAL, include_idle=False):
+    """Sample every other thread for seconds; returns {collapsed stack: samples}."""
+    if not _running.acquire(blocking=False):
+        raise ProfilerBusy('A profile is already running')
+    try:
+        me = threading.get_ident()
+        labels = {}  # code object -> frame label
+        stacks = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            # Pool threads share one root ('bff-worker_3' -> 'bff-worker')
+            names = {thread.ident: thread.name.rstrip('0123456789_') for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                codes = []  # innermost first
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    frame = frame.f_back
+                if not include_idle and _is_idle(codes):
+                    continue
+                parts = [names.get(ident, str(ident))]
+                for code in reversed(codes):
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = _frame_label(code)
+                    parts.append(label)
+                key = ';'.join(parts)
+                stacks[key] = stacks.get(key, 0) + 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _running.release()
+
+def collapsed(stacks):
+    """Render sample() output as collapsed-stack text."""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(stacks.items()))
@@ -0,0 +1,73 @@
+"""User search over an FTS5 trigram index.
+
+Searchable text is folded before it is indexed and before it is matched:
+NFKC maps full-width letters and digits and half-width kana to their usual
+forms, case is folded, katakana becomes hiragana, and whitespace is dropped,
+so 'ﾀﾅｶ', 'タナカ' and 'たなか' all find the same user. Kanji are matched as
+written; mapping them to readings would need a dictionary.
+
+Queries of TRIGRAM_MIN_CHARS or more go through the trigram index. Shorter
+ones, such as a two-kanji given name, fall back to LIKE over the folded keys.
+
+db._connect() registers fold_search_text as bff_search_fold(), which the
+triggers from migration 8 use to keep user_search_keys and users_search in
+step with users.
+"""
+import re
+import unicodedata
+
+# Shortest query the trigram index can match; shorter ones are matched with LIKE
+TRIGRAM_MIN_CHARS = 3
+
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+_SPACE = re.compile(r'\s+')
+_LIKE_SPECIAL = re.compile(r'[\\%_]')
+
+def fold_search_text(value):
+    """Normalize text for indexing and matching (None stays None)."""
+    if value is None:
+        return None
+    value = unicodedata.normalize('NFKC', str(value)).casefold()
+    return _SPACE.sub('', value.translate(_KATAKANA_TO_HIRAGANA))
+
+def _fts_phrase(text):
+    """text as one FTS5 string, so quotes and operators in it are literal."""
+    return '"' + text.replace('"', '""') + '"'
+
+def find_users(cursor, query, exclude_user_id, limit=20):
+    """Users whose name, nickname or email contains query; name prefixes rank first."""
+    folded = fold_search_text(query)
+    if not folded:
+        return []
+    prefix_end = folded + '\U0010ffff'
+
+    if len(folded) < TRIGRAM_MIN_CHARS:
+        # Too short for trigrams: LIKE reads every row of user_search_keys, which
+        # holds only the short folded keys
+        pattern = '%' + _LIKE_SPECIAL.sub(r'\\\g<0>', folded) + '%'
+        cursor.execute("""
+            SELECT u.id, u.name, u.nickname, u.avatar_base64
+            FROM user_search_keys k
+            JOIN users u ON u.id = k.user_id
+            WHERE (k.name_key LIKE ? ESCAPE '\\' OR k.nickname_key LIKE ? ESCAPE '\\'
+                   OR k.email_key LIKE ? ESCAPE '\\')
+              AND u.id != ?
+            ORDER BY
+                (k.nickname_key >= ? AND k.nickname_key < ?) OR (k.name_key >= ? AND k.name_key < ?) DESC,
+                COALESCE(u.nickname, u.name)
+            LIMIT ?
+        """, (pattern, pattern, pattern, exclude_user_id, folded, prefix_end, folded, prefix_end, limit))
+        return cursor.fetchall()
+
+    cursor.execute("""
+        SELECT u.id, u.name, u.nickname, u.avatar_base64
+        FROM users_search s
+        JOIN user_search_keys k ON k.search_id = s.rowid
+        JOIN users u ON u.id = k.user_id
+        WHERE users_search MATCH ? AND u.id != ?
+        ORDER BY
+            (k.nickname_key >= ? AND k.nickname_key < ?) OR (k.name_key >= ? AND k.name_key < ?) DESC,
+            bm25(users_search, 4.0, 4.0, 1.0)
+        LIMIT ?
+    """, (_fts_phrase(folded), exclude_user_id, folded, prefix_end, folded, prefix_end, limit))
+    return cursor.fetchall()
@@ -251,7 +251,7 @@ export async function loadAmigos() {
 function renderAmigoCard(amigo, type) {
     const initial = (amigo.name || '?').charAt(0);
     const avatarHtml = amigo.avatarBase64
-        ? `<img src="${amigo.avatarBase64}" style="width:44px;height:44px;border-radius:50%;object-fit:cover;">`
+        ? `<img src="${API.mediaSrc(amigo.avatarBase64)}" style="width:44px;height:44px;border-radius:50%;object-fit:cover;">`
         : `<div style="width:44px;height:44px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;color:white;font-size:16px;font-weight:600;">${initial}</div>`;
 
     let actionHtml = '';
@@ -337,7 +337,7 @@ async function processQrToken(token) {
         const result = await API.scanAmigoQr(token);
         const initial = (result.name || '?').charAt(0);
         const avatarHtml = result.avatarBase64
-            ? `<img src="${result.avatarBase64}" style="width:56px;height:56px;border-radius:50%;object-fit:cover;margin:0 auto 8px;">`
+            ? `<img src="${API.mediaSrc(result.avatarBase64)}" style="width:56px;height:56px;border-radius:50%;object-fit:cover;margin:0 auto 8px;">`
             : `<div style="width:56px;height:56px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;color:white;font-size:20px;font-weight:600;margin:0 auto 8px;">${initial}</div>`;
 
         scanResult.innerHTML = `
@@ -418,7 +418,7 @@ export async function searchUsers() {
         resultsContainer.innerHTML = results.map(user => {
             const initial = (user.name || '?').charAt(0);
             const avatarHtml = user.avatarBase64
-                ? `<img src="${user.avatarBase64}" style="width:36px;height:36px;border-radius:50%;object-fit:cover;">`
+                ? `<img src="${API.mediaSrc(user.avatarBase64)}" style="width:36px;height:36px;border-radius:50%;object-fit:cover;">`
                 : `<div style="width:36px;height:36px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;color:white;font-size:13px;font-weight:600;">${initial}</div>`;
 
             return `
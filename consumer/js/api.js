@@ -3,6 +3,11 @@
 // Use same origin when deployed, localhost:3001 for local dev
 const API_BASE_URL = (location.port === '3000') ? 'http://localhost:3001' : '';
 
+// Image fields hold '/media/<hash>' URLs served by the BFF, not by the static server
+export function mediaSrc(url) {
+    return typeof url === 'string' && url.startsWith('/media/') ? API_BASE_URL + url : url;
+}
+
 // Get token from localStorage
 function getToken() {
     return localStorage.getItem('bottle_amigo_token');
@@ -19,7 +24,7 @@ function clearToken() {
 }
 
 // Get user from localStorage
-function getUser() {
+export function getUser() {
     const user = localStorage.getItem('bottle_amigo_user');
     return user ? JSON.parse(user) : null;
 }
@@ -220,6 +225,24 @@ export async function getNotifications() {
     return apiCall('/consumer/notifications', { method: 'GET' });
 }
 
+export async function markNotificationsRead() {
+    return apiCall('/consumer/notifications/read', { method: 'POST' });
+}
+
+// Long-poll for notifications newer than `since` (no spinner or toast: runs in the background)
+export async function pollNotifications(since, timeout = 25) {
+    const params = new URLSearchParams({ timeout });
+    if (since !== null && since !== undefined) params.set('since', since);
+    const response = await fetch(`${API_BASE_URL}/consumer/notifications/poll?${params}`, {
+        headers: { 'Authorization': `Bearer ${getToken()}` },
+        cache: 'no-store',
+    });
+    if (!response.ok) {
+        throw new Error(`Notification poll failed: ${response.status}`);
+    }
+    return response.json();
+}
+
 export async function searchUsers(query) {
     const params = new URLSearchParams();
     if (query) params.append('q', query);
@@ -25,6 +25,11 @@ class BottleAmigoApp {
         this.selectedShareAmigoId = null;
         this.selectedShareAmigoName = null;
 
+        // Notifications kept up to date by the long-poll loop
+        this.notifications = null;
+        this.notificationsUserId = null;
+        this.notificationPolling = false;
+
         this.init();
     }
 
@@ -194,7 +199,10 @@ class BottleAmigoApp {
             } else if (page === 'amigos') {
                 await Amigos.loadAmigos();
             } else if (page === 'notifications') {
-                await Notifications.attachNotificationHandlers();
+                const readAt = await Notifications.attachNotificationHandlers();
+                if (readAt && this.notifications) {
+                    this.notifications.forEach((n) => { if (!n.readAt) n.readAt = readAt; });
+                }
             }
 
             // Update bottom nav active state
@@ -269,11 +277,63 @@ class BottleAmigoApp {
     }
 
     async updateNotificationBadge() {
+        if (!API.isAuthenticated()) return;
+        // The poll loop keeps this.notifications current; it renders the badge itself once loaded
+        this.startNotificationPolling();
+        this.renderNotificationBadge();
+    }
+
+    // Wait for new notifications on the server and merge them into this.notifications
+    async startNotificationPolling() {
+        if (this.notificationPolling) return;
+        this.notificationPolling = true;
+        const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+        const userId = API.getUser()?.id || null;
+        let cursor = null;
+
         try {
-            if (!API.isAuthenticated()) return;
+            while (API.isAuthenticated() && (API.getUser()?.id || null) === userId) {
+                const started = Date.now();
+                let pollAfter = null;
+                try {
+                    // The first call only returns a cursor; the list loaded after it misses nothing
+                    const result = await API.pollNotifications(cursor, cursor === null ? 0 : 25);
+                    const first = cursor === null;
+                    cursor = result.cursor;
+                    pollAfter = result.pollAfter ?? null;
+                    if (first || result.reset) {
+                        this.notifications = await API.getNotifications();
+                    } else if (result.notifications.length > 0) {
+                        const known = new Set((this.notifications || []).map((n) => n.id));
+                        const fresh = result.notifications.filter((n) => !known.has(n.id));
+                        this.notifications = [...fresh, ...(this.notifications || [])];
+                        if (fresh.length > 0 && this.currentPage === 'notifications') {
+                            this.renderPage('notifications', null);
+                        }
+                    }
+                    this.renderNotificationBadge();
+                } catch (error) {
+                    await sleep(10000);
+                }
+                // The server answers at once when it cannot hold the request open and says when to come back
+                if (pollAfter !== null) {
+                    await sleep(pollAfter * 1000);
+                } else if (cursor !== null && Date.now() - started < 1000) {
+                    await sleep(5000);
+                }
+            }
+        } finally {
+            this.notificationPolling = false;
+            this.notifications = null;
+        }
 
-            const notifications = await API.getNotifications();
-            const unreadCount = Notifications.getUnreadCount(notifications);
+        // Logged in again as someone else while the last poll was in flight
+        if (API.isAuthenticated()) this.startNotificationPolling();
+    }
+
+    renderNotificationBadge() {
+        try {
+            const unreadCount = Notifications.getUnreadCount(this.notifications);
 
             const bell = document.getElementById('notificationBell');
             if (bell) {
@@ -292,7 +352,7 @@ class BottleAmigoApp {
                 }
             }
         } catch (error) {
-            // Silently ignore notification loading errors
+            // Badge is cosmetic; ignore rendering errors
         }
     }
 
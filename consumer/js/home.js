@@ -19,7 +19,7 @@ export async function renderHomePage() {
 
         const storeCards = homeData.map(store => {
             const logoHtml = store.logoBase64
-                ? '<img src="' + store.logoBase64 + '" style="width:100%;height:100%;object-fit:cover;">'
+                ? '<img src="' + API.mediaSrc(store.logoBase64) + '" style="width:100%;height:100%;object-fit:cover;">'
                 : '<svg width="32" height="32" viewBox="0 0 24 24" fill="none" stroke="#F2B36B" stroke-width="1.5" opacity="0.6"><path d="M3 12l9-9 9 9"/><path d="M5 10v10h14V10"/></svg>';
 
             // Create active amigos display
@@ -35,7 +35,7 @@ export async function renderHomePage() {
                     const zi = 10 - i;
                     const baseStyle = 'width:28px;height:28px;border-radius:50%;border:2px solid #1a2235;margin-left:' + ml + ';position:relative;z-index:' + zi + ';';
                     if (amigo.avatarBase64) {
-                        activeAmigosHtml += '<img src="' + amigo.avatarBase64 + '" style="' + baseStyle + 'object-fit:cover;" title="' + amigo.name + '">';
+                        activeAmigosHtml += '<img src="' + API.mediaSrc(amigo.avatarBase64) + '" style="' + baseStyle + 'object-fit:cover;" title="' + amigo.name + '">';
                     } else {
                         const initial = (amigo.name || '?').charAt(0);
                         activeAmigosHtml += '<div style="' + baseStyle + 'background:#9FB5A5;display:flex;align-items:center;justify-content:center;color:white;font-size:11px;font-weight:500;" title="' + amigo.name + '">' + initial + '</div>';
@@ -142,7 +142,7 @@ window.homeCheckin = async function(storeId, btn) {
         let amigosListHtml = amigos.map(a => {
             const initial = (a.name || '?').charAt(0);
             const avatarHtml = a.avatarBase64
-                ? '<img src="' + a.avatarBase64 + '" style="width:40px;height:40px;border-radius:50%;object-fit:cover;">'
+                ? '<img src="' + API.mediaSrc(a.avatarBase64) + '" style="width:40px;height:40px;border-radius:50%;object-fit:cover;">'
                 : '<div style="width:40px;height:40px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;color:white;font-size:14px;font-weight:600;">' + initial + '</div>';
             const checkedInBadge = a.isCheckedIn
                 ? '<span style="font-size:10px;background:#9FB5A5;color:#111827;padding:1px 6px;border-radius:8px;margin-left:6px;">来店中</span>'
@@ -76,12 +76,13 @@ export async function renderNotificationsPage() {
 }
 
 export async function attachNotificationHandlers() {
-    // Mark notifications as read when page loads
+    // Mark notifications as read when page loads; returns the read timestamp
     try {
-        const notifications = await API.getNotifications();
-        // API will handle marking as read on fetch
+        const result = await API.markNotificationsRead();
+        return result.readAt;
     } catch (error) {
         // Silently ignore
+        return null;
     }
 }
 
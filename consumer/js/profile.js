@@ -11,7 +11,7 @@ export async function renderProfilePage() {
         currentProfileData = profile;
 
         const avatarHtml = profile.avatarBase64
-            ? '<img src="' + profile.avatarBase64 + '" style="width:100%;height:100%;object-fit:cover;">'
+            ? '<img src="' + API.mediaSrc(profile.avatarBase64) + '" style="width:100%;height:100%;object-fit:cover;">'
             : '<span style="color:#8896A8;font-size:32px;">ロ</span>';
 
         const birthdayDisplay = profile.birthdayMonth && profile.birthdayDay
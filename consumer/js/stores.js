@@ -10,7 +10,7 @@ export async function renderStoreDetailPage(storeId) {
         // Store header with logo, name, address, maps link
         let storeHeaderHtml = '';
         const logoHtml = store.logoBase64
-            ? '<img src="' + store.logoBase64 + '" style="width:100%;height:100%;object-fit:cover;">'
+            ? '<img src="' + API.mediaSrc(store.logoBase64) + '" style="width:100%;height:100%;object-fit:cover;">'
             : '<svg width="32" height="32" viewBox="0 0 24 24" fill="none" stroke="#F2B36B" stroke-width="1.5" opacity="0.6"><path d="M3 12l9-9 9 9"/><path d="M5 10v10h14V10"/></svg>';
 
         let mapsLink = '';
@@ -7,7 +7,7 @@ export async function renderUserProfilePage(userId) {
         const user = await API.getUserProfile(userId);
 
         const avatarHtml = user.avatarBase64
-            ? `<img src="${user.avatarBase64}" style="width:80px;height:80px;border-radius:50%;object-fit:cover;border:3px solid #9FB5A5;">`
+            ? `<img src="${API.mediaSrc(user.avatarBase64)}" style="width:80px;height:80px;border-radius:50%;object-fit:cover;border:3px solid #9FB5A5;">`
             : `<div style="width:80px;height:80px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;color:white;font-size:28px;font-weight:700;border:3px solid #9FB5A5;">${(user.name || '?').charAt(0)}</div>`;
 
         // Birthday display (only if public)
@@ -32,7 +32,7 @@ export async function renderUserProfilePage(userId) {
         if (user.sharedStores && user.sharedStores.length > 0) {
             const storeItems = user.sharedStores.map(store => {
                 const logoHtml = store.logoBase64
-                    ? `<img src="${store.logoBase64}" style="width:36px;height:36px;border-radius:6px;object-fit:cover;">`
+                    ? `<img src="${API.mediaSrc(store.logoBase64)}" style="width:36px;height:36px;border-radius:6px;object-fit:cover;">`
                     : `<div style="width:36px;height:36px;border-radius:6px;background:#1e293b;display:flex;align-items:center;justify-content:center;">
                         <svg width="18" height="18" viewBox="0 0 24 24" fill="none" stroke="#F2B36B" stroke-width="1.5" opacity="0.6"><path d="M3 12l9-9 9 9"/><path d="M5 10v10h14V10"/></svg>
                        </div>`;
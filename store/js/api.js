@@ -6,6 +6,11 @@
 // Use same origin when deployed, localhost:3001 for local dev
 const API_BASE_URL = (location.port === '3002') ? 'http://localhost:3001' : '';
 
+// Image fields hold '/media/<hash>' URLs served by the BFF, not by the static server
+function mediaSrc(url) {
+    return typeof url === 'string' && url.startsWith('/media/') ? API_BASE_URL + url : url;
+}
+
 class ApiClient {
     constructor() {
         this.baseUrl = API_BASE_URL;
@@ -115,6 +120,20 @@ class ApiClient {
         );
     }
 
+    /**
+     * Open the live check-in event stream (Server-Sent Events).
+     * Returns the raw fetch Response; the caller reads response.body.
+     */
+    async openCheckinStream(storeId, lastEventId, signal) {
+        const params = new URLSearchParams({ storeId });
+        if (lastEventId) params.set('lastEventId', lastEventId);
+        return fetch(`${this.baseUrl}/store/checkins/stream?${params}`, {
+            headers: { 'Authorization': `Bearer ${this.token}` },
+            cache: 'no-store',
+            signal,
+        });
+    }
+
     async getCustomerSummary(userId, storeId) {
         return this.request(
             'GET',
@@ -97,7 +97,7 @@ class BottleMastersModule {
 
     renderMasterCard(master) {
         const imgHtml = master.imageBase64
-            ? `<img src="${master.imageBase64}" style="width:100%;height:100%;object-fit:cover;border-radius:6px;">`
+            ? `<img src="${mediaSrc(master.imageBase64)}" style="width:100%;height:100%;object-fit:cover;border-radius:6px;">`
             : `<div style="width:100%;height:100%;display:flex;align-items:center;justify-content:center;background:#F9FAFB;border-radius:6px;">
                  <svg width="24" height="24" viewBox="0 0 24 24" fill="none" stroke="#9FB5A5" stroke-width="1.5"><path d="M8 2h8l2 4H6l2-4z"/><rect x="6" y="6" width="12" height="14" rx="1"/></svg>
                </div>`;
@@ -111,7 +111,7 @@ class BottlesModule {
         const pct = capMl > 0 ? Math.round(remMl / capMl * 100) : 0;
 
         const avatarHtml = bottle.ownerAvatar
-            ? `<img src="${bottle.ownerAvatar}" style="width:36px;height:36px;border-radius:50%;object-fit:cover;flex-shrink:0;">`
+            ? `<img src="${mediaSrc(bottle.ownerAvatar)}" style="width:36px;height:36px;border-radius:50%;object-fit:cover;flex-shrink:0;">`
             : `<div style="width:36px;height:36px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;font-weight:600;color:#111827;font-size:13px;flex-shrink:0;">${(bottle.ownerName || '?').charAt(0)}</div>`;
 
         // Share badges
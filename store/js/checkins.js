@@ -8,6 +8,10 @@ class CheckinsModule {
     constructor() {
         this.checkins = [];
         this.refreshInterval = null;
+        this.lastEventId = null;
+        this.streamAbort = null;
+        this.streamRetry = null;
+        this.streamConnected = false;
     }
 
     async loadCheckins() {
@@ -17,6 +21,7 @@ class CheckinsModule {
         try {
             const data = await apiClient.getActiveCheckins(staff.storeId);
             this.checkins = data.checkins || [];
+            if (!this.streamConnected) this.lastEventId = data.eventId;
             this.renderCheckins();
         } catch (error) {
             showToast('来店情報の読み込みに失敗しました', 'error');
@@ -81,7 +86,7 @@ class CheckinsModule {
         }
 
         const avatarHtml = checkin.userAvatar
-            ? `<img src="${checkin.userAvatar}" alt="" style="width:44px;height:44px;border-radius:50%;object-fit:cover;flex-shrink:0;">`
+            ? `<img src="${mediaSrc(checkin.userAvatar)}" alt="" style="width:44px;height:44px;border-radius:50%;object-fit:cover;flex-shrink:0;">`
             : `<div style="width:44px;height:44px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;font-weight:600;color:#111827;font-size:16px;flex-shrink:0;">${(checkin.userName || '?').charAt(0)}</div>`;
 
         const bottlesHtml = (checkin.bottles || [])
@@ -463,9 +468,10 @@ class CheckinsModule {
     }
 
     startAutoRefresh() {
-        this.loadCheckins();
+        this.loadCheckins().then(() => this.openStream());
+        // Polling is only a fallback for when the live stream is down
         this.refreshInterval = setInterval(() => {
-            this.loadCheckins();
+            if (!this.streamConnected) this.loadCheckins();
         }, 30000);
     }
 
@@ -474,6 +480,106 @@ class CheckinsModule {
             clearInterval(this.refreshInterval);
             this.refreshInterval = null;
         }
+        if (this.streamRetry) {
+            clearTimeout(this.streamRetry);
+            this.streamRetry = null;
+        }
+        if (this.streamAbort) {
+            this.streamAbort.abort();
+            this.streamAbort = null;
+        }
+    }
+
+    // ═══════════════════════════════════════════
+    //  LIVE UPDATES (Server-Sent Events)
+    // ═══════════════════════════════════════════
+    // Read with fetch() rather than EventSource so the token stays in the
+    // Authorization header instead of the URL.
+
+    async openStream() {
+        const staff = authModule.getStaffInfo();
+        if (!staff || this.streamAbort) return;
+
+        const controller = new AbortController();
+        this.streamAbort = controller;
+        let retryMs = 3000;
+
+        try {
+            const response = await apiClient.openCheckinStream(staff.storeId, this.lastEventId, controller.signal);
+            // 501: the server cannot stream (prefork); stay on polling
+            if (response.status === 401 || response.status === 501) return;
+            if (!response.ok || !response.body) {
+                if (response.status === 503) retryMs = 30000;
+                throw new Error(`stream status ${response.status}`);
+            }
+
+            this.streamConnected = true;
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let sep;
+                while ((sep = buffer.indexOf('\n\n')) !== -1) {
+                    this.handleStreamMessage(buffer.slice(0, sep));
+                    buffer = buffer.slice(sep + 2);
+                }
+            }
+        } catch (error) {
+            if (!controller.signal.aborted) console.warn('Checkin stream disconnected:', error);
+        } finally {
+            this.streamConnected = false;
+            if (this.streamAbort === controller) this.streamAbort = null;
+        }
+
+        // The server ends streams periodically; reconnect and resume from lastEventId
+        if (!controller.signal.aborted) {
+            this.streamRetry = setTimeout(() => this.openStream(), retryMs);
+        }
+    }
+
+    handleStreamMessage(block) {
+        let event = 'message';
+        let data = '';
+        block.split('\n').forEach((line) => {
+            if (line.startsWith('id:')) this.lastEventId = line.slice(3).trim();
+            else if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) data += line.slice(5).trim();
+        });
+        if (!data) return;
+        const payload = JSON.parse(data);
+
+        switch (event) {
+            case 'checkin':
+                this.checkins = [payload.checkin, ...this.checkins.filter((c) => c.id !== payload.checkin.id)];
+                break;
+            case 'checkout':
+                this.checkins = this.checkins.filter((c) => c.id !== payload.checkinId);
+                break;
+            case 'memo':
+                this.checkins.forEach((c) => {
+                    if (c.userId === payload.userId) c.latestMemo = payload.latestMemo;
+                });
+                break;
+            case 'bottle':
+                this.checkins.forEach((c) => {
+                    if (c.userId !== payload.userId) return;
+                    const bottles = (c.bottles || []).filter((b) => b.id !== payload.bottle.id);
+                    const index = (c.bottles || []).findIndex((b) => b.id === payload.bottle.id);
+                    bottles.splice(index >= 0 ? index : bottles.length, 0, payload.bottle);
+                    c.bottles = bottles;
+                });
+                break;
+            case 'reset':
+                // Missed events (backlog overflow or server restart): reload the full list
+                this.loadCheckins();
+                return;
+            default:
+                return;
+        }
+        this.renderCheckins();
     }
 
     esc(text) {
@@ -88,7 +88,7 @@ class CustomerModule {
 
     renderProfile(d) {
         const avatar = d.avatarBase64
-            ? `<img src="${d.avatarBase64}" alt="" style="width:64px;height:64px;border-radius:50%;object-fit:cover;">`
+            ? `<img src="${mediaSrc(d.avatarBase64)}" alt="" style="width:64px;height:64px;border-radius:50%;object-fit:cover;">`
             : `<div style="width:64px;height:64px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;font-size:24px;font-weight:700;color:#111827;">${(d.nickname || d.name || '?').charAt(0)}</div>`;
 
         let infoLines = [];
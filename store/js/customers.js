@@ -106,7 +106,7 @@ class CustomersModule {
         filtered.forEach(customer => {
             const avatarSrc = customer.avatarBase64 || customer.avatar;
             const avatar = avatarSrc
-                ? `<img src="${avatarSrc}" alt="" style="width:56px;height:56px;border-radius:50%;object-fit:cover;flex-shrink:0;">`
+                ? `<img src="${mediaSrc(avatarSrc)}" alt="" style="width:56px;height:56px;border-radius:50%;object-fit:cover;flex-shrink:0;">`
                 : `<div style="width:56px;height:56px;border-radius:50%;background:#9FB5A5;display:flex;align-items:center;justify-content:center;font-weight:700;color:#111827;font-size:20px;flex-shrink:0;">${(customer.nickname || customer.name || '?').charAt(0)}</div>`;
 
             const lastCheckin = (customer.lastCheckinDate || customer.lastCheckin)
@@ -50,7 +50,7 @@ class SettingsModule {
         const currentAddress = this.storeData ? (this.storeData.address || '') : '';
 
         const logoPreviewHtml = currentLogo
-            ? `<img src="${currentLogo}" alt="Store logo" class="w-full h-full object-cover rounded-lg">`
+            ? `<img src="${mediaSrc(currentLogo)}" alt="Store logo" class="w-full h-full object-cover rounded-lg">`
             : '<svg width="40" height="40" viewBox="0 0 24 24" fill="none" stroke="#9FB5A5" stroke-width="1.5"><rect x="3" y="3" width="18" height="18" rx="2"/><circle cx="8.5" cy="8.5" r="1.5"/><path d="M21 15l-5-5L5 21"/></svg>';
 
         content.innerHTML = `
@@ -0,0 +1,63 @@
+"""Shared setup for the tests: a scratch copy of the demo database and an in-process server.
+
+    python3 -m unittest discover tests
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+# Hash inline: the spawn-based pool would re-import the test runner
+os.environ.setdefault('BFF_PASSWORD_WORKERS', '0')
+
+import bff.db
+from bff.middleware.auth import generate_token
+
+def use_scratch_db():
+    """Point bff.db at a migrated copy of bottle_amigo.db and return its path."""
+    path = os.path.join(tempfile.mkdtemp(), 'bottle_amigo.db')
+    shutil.copy(os.path.join(PROJECT_ROOT, 'bottle_amigo.db'), path)
+    bff.db.DB_PATH = path
+    bff.db.init_db()
+    bff.db.migrate_db()
+    return path
+
+def start_server():
+    """Serve BFFHandler from a worker pool on a free port; returns (base URL, server)."""
+    from bff.server import BFFHandler, ThreadPoolHTTPServer
+    httpd = ThreadPoolHTTPServer(('127.0.0.1', 0), BFFHandler, workers=4)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{httpd.server_address[1]}', httpd
+
+def user_token(email):
+    """Token for the demo user with email, without going through login."""
+    conn = bff.db.get_connection()
+    row = conn.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
+    conn.close()
+    return row['id'], generate_token({'userId': row['id'], 'type': 'user'})
+
+def call(base, method, path, body=None, token=None, headers=None):
+    """Make a request and return (status, decoded JSON body or raw bytes, response headers)."""
+    data = json.dumps(body).encode() if body is not None else None
+    request = urllib.request.Request(base + path, data=data, method=method)
+    request.add_header('Content-Type', 'application/json')
+    if token:
+        request.add_header('Authorization', f'Bearer {token}')
+    for name, value in (headers or {}).items():
+        request.add_header(name, value)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            status, raw, response_headers = response.status, response.read(), response.headers
+    except urllib.error.HTTPError as e:
+        status, raw, response_headers = e.code, e.read(), e.headers
+    try:
+        return status, json.loads(raw), response_headers
+    except ValueError:
+        return status, raw, response_headers
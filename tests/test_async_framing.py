@@ -0,0 +1,77 @@
+"""Request framing in the asyncio front end: only Content-Length bodies are accepted."""
+import asyncio
+import socket
+import threading
+import unittest
+
+from tests.support import use_scratch_db
+
+from bff.async_server import AsyncBFFServer
+from bff.server import BFFHandler
+
+class AsyncFramingTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        use_scratch_db()
+        cls.server = AsyncBFFServer(BFFHandler, workers=2)
+        cls.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        async def serve():
+            cls.listener = await asyncio.start_server(cls.server.handle_connection, '127.0.0.1', 0)
+            cls.port = cls.listener.sockets[0].getsockname()[1]
+            started.set()
+
+        threading.Thread(target=cls.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(serve(), cls.loop)
+        started.wait(5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.loop.call_soon_threadsafe(cls.listener.close)
+        cls.loop.call_soon_threadsafe(cls.loop.stop)
+        cls.server.executor.shutdown(wait=False)
+
+    def exchange(self, request):
+        """Send raw request bytes and read until the server closes (or 5 s pass)."""
+        with socket.create_connection(('127.0.0.1', self.port), timeout=5) as sock:
+            sock.sendall(request)
+            received = b''
+            try:
+                while chunk := sock.recv(65536):
+                    received += chunk
+            except socket.timeout:
+                pass
+        return received
+
+    def test_request_without_a_body_is_served(self):
+        received = self.exchange(b'GET /auth/nowhere HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+        self.assertTrue(received.startswith(b'HTTP/1.1 404 '), received[:60])
+
+    def test_chunked_body_is_refused_and_not_read_as_a_request(self):
+        smuggled = b'GET /api/health HTTP/1.1\r\nHost: x\r\n\r\n'
+        body = f'{len(smuggled):x}\r\n'.encode() + smuggled + b'\r\n0\r\n\r\n'
+        received = self.exchange(
+            b'POST /api/auth/login HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n\r\n' + body
+        )
+        self.assertTrue(received.startswith(b'HTTP/1.1 501 '), received[:60])
+        self.assertEqual(received.count(b'HTTP/1.1 '), 1)
+
+    def test_content_length_with_transfer_encoding_is_refused(self):
+        received = self.exchange(
+            b'POST /api/auth/login HTTP/1.1\r\nHost: x\r\nContent-Length: 4\r\n'
+            b'Transfer-Encoding: chunked\r\n\r\n0\r\n\r\n'
+        )
+        self.assertTrue(received.startswith(b'HTTP/1.1 400 '), received[:60])
+        self.assertEqual(received.count(b'HTTP/1.1 '), 1)
+
+    def test_repeated_content_length_is_refused(self):
+        received = self.exchange(
+            b'POST /api/auth/login HTTP/1.1\r\nHost: x\r\nContent-Length: 2\r\n'
+            b'Content-Length: 40\r\n\r\n{}'
+        )
+        self.assertTrue(received.startswith(b'HTTP/1.1 400 '), received[:60])
+
+if __name__ == '__main__':
+    unittest.main()
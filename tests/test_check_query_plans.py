@@ -0,0 +1,52 @@
+"""The query-plan check sees every execute() call, and the tree passes it."""
+import ast
+import contextlib
+import io
+import unittest
+
+import tests.support  # puts the project on sys.path
+
+import bff.db
+from bff import check_query_plans
+
+def collect(source):
+    collector = check_query_plans.StatementCollector('example.py')
+    collector.visit(ast.parse(source))
+    return [(line, sql, problem is not None) for _, line, _, sql, problem in collector.statements]
+
+class CollectorTest(unittest.TestCase):
+
+    def test_variables_and_concatenation_are_rendered(self):
+        found = collect('''
+def f(cursor, updates):
+    update_sql = "UPDATE users SET " + ", ".join(updates) + " WHERE id = ?"
+    cursor.execute(update_sql, [])
+''')
+        self.assertEqual(found, [(4, 'UPDATE users SET name = ? WHERE id = ?', False)])
+
+    def test_sql_that_cannot_be_rendered_is_reported(self):
+        found = collect('''
+def f(cursor, cond, q):
+    sql = "SELECT 1"
+    if cond:
+        sql = "SELECT 2"
+    cursor.execute(sql)
+    cursor.execute(q)
+    cursor.execute(f"SELECT * FROM {table}")
+cursor.execute(MODULE_SQL)
+''')
+        self.assertEqual(found, [(6, None, True), (7, None, True), (8, None, True), (9, None, True)])
+
+class TreeTest(unittest.TestCase):
+
+    def test_every_statement_is_checked_and_none_scans(self):
+        saved_path = bff.db.DB_PATH
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as out:
+                status = check_query_plans.main()
+        finally:
+            bff.db.DB_PATH = saved_path
+        self.assertEqual(status, 0, out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
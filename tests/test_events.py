@@ -0,0 +1,67 @@
+"""Event IDs are scoped to one process boot, and prefork workers do not stream."""
+import unittest
+
+from tests.support import call, start_server, use_scratch_db
+
+import bff.db
+from bff.middleware.auth import generate_token
+from bff.services import events
+
+class EventIdTest(unittest.TestCase):
+
+    def test_id_from_an_earlier_boot_is_incomplete(self):
+        channel = 'test:earlier-boot'
+        before_restart = events.current_event_id()
+        events.publish(channel, 'checkin', {'n': 1})
+        events._new_epoch()  # what a restart (or a forked worker) does
+        events.publish(channel, 'checkin', {'n': 2})
+
+        self.assertEqual(events.wait_events(channel, before_restart, 0), ([], False))
+        self.assertFalse(events.add_waiter(channel, before_restart, lambda: None))
+
+    def test_id_from_a_newer_boot_with_a_higher_seq_is_incomplete(self):
+        for _ in range(3):
+            events.publish('test:other', 'x', {})
+        other_worker = events.current_event_id()
+        events._new_epoch()
+        self.assertEqual(events.wait_events('test:other', other_worker, 0), ([], False))
+
+    def test_malformed_ids_are_incomplete(self):
+        for value in ('', '123', 'abc', f'{events._epoch}-x', f'{events._epoch}-999999'):
+            self.assertEqual(events.wait_events('test:malformed', value, 0), ([], False), value)
+
+    def test_current_id_resumes_with_the_events_after_it(self):
+        channel = 'test:resume'
+        cursor = events.watch(channel)
+        events.publish(channel, 'checkin', {'n': 1})
+        found, complete = events.wait_events(channel, cursor, 0)
+        self.assertTrue(complete)
+        self.assertEqual([payload for _, _, payload in found], ['{"n": 1}'])
+        self.assertEqual(events.wait_events(channel, found[-1][0], 0), ([], True))
+
+class PreforkStreamTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        use_scratch_db()
+        cls.base, cls.httpd = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+
+    def tearDown(self):
+        events._streams_enabled = True
+
+    def test_prefork_worker_refuses_streams(self):
+        conn = bff.db.get_connection()
+        staff = conn.execute("SELECT id, store_id, role FROM staff_accounts LIMIT 1").fetchone()
+        conn.close()
+        token = generate_token({'staffId': staff['id'], 'storeId': staff['store_id'],
+                                'role': staff['role'], 'type': 'staff'})
+        events.disable_streams()
+        status, _, _ = call(self.base, 'GET', f"/store/checkins/stream?storeId={staff['store_id']}", token=token)
+        self.assertEqual(status, 501)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import ipaddress
+import unittest
+
+from tests import support  # noqa: F401 (puts the project on sys.path)
+from bff.middleware import throttle
+
+class FakeRequest:
+    def __init__(self, peer, forwarded=None):
+        self.client_address = (peer, 50000)
+        self.headers = {'X-Forwarded-For': forwarded} if forwarded else {}
+
+class LoginThrottleTest(unittest.TestCase):
+    def setUp(self):
+        self.saved_proxies = throttle.TRUSTED_PROXIES
+        throttle.TRUSTED_PROXIES = [ipaddress.ip_network('10.0.0.0/8')]
+        throttle._buckets.clear()
+
+    def tearDown(self):
+        throttle.TRUSTED_PROXIES = self.saved_proxies
+        throttle._buckets.clear()
+
+    def test_client_ip_comes_from_trusted_proxy_header(self):
+        self.assertEqual(throttle.client_ip(FakeRequest('10.1.2.3', '203.0.113.9, 10.4.5.6')), '203.0.113.9')
+        # A client cannot pick its address by sending the header directly
+        self.assertEqual(throttle.client_ip(FakeRequest('198.51.100.7', '203.0.113.9')), '198.51.100.7')
+        self.assertIsNone(throttle.client_ip(FakeRequest('10.1.2.3')))
+
+    def test_clients_behind_the_proxy_are_throttled_separately(self):
+        attacker = throttle.user_login_keys(FakeRequest('10.0.0.1', '203.0.113.9'), 'x@example.com')
+        for _ in range(throttle.LOGIN_IP_BURST):
+            throttle.record_failure(attacker)
+        self.assertGreater(throttle.retry_after(attacker), 0)
+
+        other = throttle.user_login_keys(FakeRequest('10.0.0.1', '198.51.100.7'), 'y@example.com')
+        self.assertEqual(throttle.retry_after(other), 0)
+
+    def test_unknown_client_has_no_address_bucket(self):
+        keys = throttle.user_login_keys(FakeRequest('10.0.0.1'), 'x@example.com')
+        self.assertEqual(keys, ['email:x@example.com'])
+
+    def test_failing_staff_caller_does_not_lock_out_the_store(self):
+        attacker = throttle.staff_login_keys(FakeRequest('10.0.0.1', '203.0.113.9'), 'bar-sakura-001')
+        for _ in range(throttle.LOGIN_BURST):
+            throttle.record_failure(attacker)
+        self.assertGreater(throttle.retry_after(attacker), 0)
+
+        tablet = throttle.staff_login_keys(FakeRequest('10.0.0.1', '198.51.100.7'), 'bar-sakura-001')
+        self.assertEqual(throttle.retry_after(tablet), 0)
+
+if __name__ == '__main__':
+    unittest.main()
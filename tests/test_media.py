@@ -0,0 +1,95 @@
+"""Media URLs, and media rows committing only with the record that uses them."""
+import base64
+import struct
+import unittest
+import zlib
+from unittest import mock
+
+from tests.support import call, start_server, use_scratch_db
+
+import bff.db
+from bff.routes import auth
+from bff.services import media
+from bff.services.passwords import PasswordQueueFull
+
+URL = media.MEDIA_PREFIX + 'ab' * 32
+
+class ThumbnailUrlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_codec = media._codec
+
+    def tearDown(self):
+        media.set_image_codec(self.saved_codec)
+
+    def test_no_codec_links_the_original(self):
+        media.set_image_codec(None)
+        self.assertEqual(media.thumbnail_url(URL), URL)
+
+    def test_codec_links_the_thumbnail(self):
+        media.set_image_codec(lambda data, max_side: ('image/png', data))
+        self.assertEqual(media.thumbnail_url(URL), URL + '/thumb')
+
+    def test_other_values_pass_through(self):
+        media.set_image_codec(lambda data, max_side: ('image/png', data))
+        self.assertEqual(media.thumbnail_url('data:image/png;base64,AAAA'), 'data:image/png;base64,AAAA')
+        self.assertIsNone(media.thumbnail_url(None))
+
+def png_data_uri():
+    """A 1x1 PNG as a data: URI, different on every call."""
+    png_data_uri.count = getattr(png_data_uri, 'count', 0) + 1
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    pixel = zlib.compress(b'\x00' + bytes([png_data_uri.count % 256, 0, 0]))
+    png = (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+           + chunk(b'IDAT', pixel) + chunk(b'IEND', b''))
+    return 'data:image/png;base64,' + base64.b64encode(png).decode()
+
+class MediaTransactionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        use_scratch_db()
+        cls.base, cls.httpd = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+
+    def media_count(self):
+        conn = bff.db.get_connection()
+        count = conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+        conn.close()
+        return count
+
+    def register(self, email):
+        return call(self.base, 'POST', '/auth/user/register',
+                    {'email': email, 'password': 'pw-12345', 'avatarBase64': png_data_uri()})
+
+    def test_refused_registration_leaves_no_media(self):
+        before = self.media_count()
+        with mock.patch.object(auth, 'hash_password', side_effect=PasswordQueueFull('busy')):
+            status, _, _ = self.register('busy@example.com')
+        self.assertEqual(status, 503)
+        self.assertEqual(self.media_count(), before)
+
+    def test_transaction_left_open_by_a_failed_request_is_rolled_back(self):
+        before = self.media_count()
+        conn = bff.db.get_connection()
+        conn.execute("BEGIN")
+        media.put_media(conn.cursor(), 'image/png', b'never committed')
+        # The request raised here, before conn.close()
+        conn = bff.db.get_connection()
+        self.assertFalse(conn.in_transaction)
+        conn.close()
+        self.assertEqual(self.media_count(), before)
+
+    def test_registration_stores_the_avatar(self):
+        before = self.media_count()
+        status, body, _ = self.register('avatar@example.com')
+        self.assertEqual(status, 201)
+        self.assertTrue(body['user']['avatarBase64'].startswith(media.MEDIA_PREFIX))
+        self.assertEqual(self.media_count(), before + 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+"""GET /metrics is refused to remote callers unless a token is configured."""
+import unittest
+from unittest import mock
+
+from tests.support import call, start_server, use_scratch_db
+
+from bff.routes import metrics
+
+class MetricsAccessTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        use_scratch_db()
+        cls.base, cls.httpd = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+
+    def test_loopback_caller_is_served_without_a_token(self):
+        status, body, _ = call(self.base, 'GET', '/metrics')
+        self.assertEqual(status, 200)
+        self.assertIn(b'# TYPE', body)
+
+    def test_proxied_caller_is_refused_without_a_token(self):
+        status, _, _ = call(self.base, 'GET', '/metrics', headers={'X-Forwarded-For': '203.0.113.9'})
+        self.assertEqual(status, 401)
+
+    def test_token_is_required_once_configured(self):
+        with mock.patch.object(metrics, 'METRICS_TOKEN', 'scrape-secret'):
+            self.assertEqual(call(self.base, 'GET', '/metrics')[0], 401)
+            self.assertEqual(call(self.base, 'GET', '/metrics', token='wrong')[0], 401)
+            self.assertEqual(call(self.base, 'GET', '/metrics', token='scrape-secret')[0], 200)
+
+if __name__ == '__main__':
+    unittest.main()
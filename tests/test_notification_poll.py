@@ -0,0 +1,99 @@
+import time
+import unittest
+
+import bff.db
+from tests.support import call, start_server, use_scratch_db, user_token
+
+class NotificationPollTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        use_scratch_db()
+        cls.base, cls.httpd = start_server()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+
+    def test_notification_between_cursor_and_first_poll_is_delivered(self):
+        from bff.services.notification import create_amigo_checkin_notification
+
+        user_id, token = user_token('suzuki@example.com')
+        sender_id, _ = user_token('tanaka@example.com')
+
+        status, body, _ = call(self.base, 'GET', '/consumer/notifications/poll?timeout=0', token=token)
+        self.assertEqual(status, 200)
+        cursor = body['cursor']
+
+        # The app waits before its first poll with the cursor; publish in that gap
+        conn = bff.db.get_connection()
+        checkin_id = 'test-checkin-poll'
+        conn.execute("""
+            INSERT INTO check_ins (id, store_id, user_id, notify_to_user_ids)
+            VALUES (?, 'bar-sakura-001', ?, ?)
+        """, (checkin_id, sender_id, f'["{user_id}"]'))
+        conn.close()
+        create_amigo_checkin_notification(sender_id, 'bar-sakura-001', checkin_id)
+
+        status, body, _ = call(self.base, 'GET', f'/consumer/notifications/poll?since={cursor}&timeout=0', token=token)
+        self.assertEqual(status, 200)
+        self.assertFalse(body['reset'])
+        self.assertEqual([n['type'] for n in body['notifications']], ['amigo_checkin'])
+
+        status, listed, _ = call(self.base, 'GET', '/consumer/notifications', token=token)
+        self.assertEqual(body['notifications'][0]['id'], listed[0]['id'])
+
+    def test_cursor_from_before_a_restart_resets_and_keeps_delivering(self):
+        from bff.services import events
+        from bff.services.notification import create_amigo_checkin_notification
+
+        user_id, token = user_token('suzuki@example.com')
+        sender_id, _ = user_token('sato@example.com')
+        status, body, _ = call(self.base, 'GET', '/consumer/notifications/poll?timeout=0', token=token)
+        stale = body['cursor']
+
+        events._new_epoch()  # what a restart (or landing on another worker) looks like
+
+        status, body, _ = call(self.base, 'GET', f'/consumer/notifications/poll?since={stale}&timeout=0', token=token)
+        self.assertEqual(status, 200)
+        self.assertTrue(body['reset'])
+        self.assertNotEqual(body['cursor'], stale)
+        cursor = body['cursor']
+
+        # Published before the next poll: the reset must have registered the channel again
+        conn = bff.db.get_connection()
+        checkin_id = 'test-checkin-restart'
+        conn.execute("""
+            INSERT INTO check_ins (id, store_id, user_id, notify_to_user_ids)
+            VALUES (?, 'bar-sakura-001', ?, ?)
+        """, (checkin_id, sender_id, f'["{user_id}"]'))
+        conn.close()
+        create_amigo_checkin_notification(sender_id, 'bar-sakura-001', checkin_id)
+
+        status, body, _ = call(self.base, 'GET', f'/consumer/notifications/poll?since={cursor}&timeout=0', token=token)
+        self.assertFalse(body['reset'])
+        self.assertEqual([n['type'] for n in body['notifications']], ['amigo_checkin'])
+
+    def test_thread_mode_poll_answers_at_once_without_taking_stream_slots(self):
+        from bff.services import events
+
+        _, token = user_token('sato@example.com')
+        status, body, _ = call(self.base, 'GET', '/consumer/notifications/poll?timeout=0', token=token)
+        cursor = body['cursor']
+
+        started = time.monotonic()
+        status, body, _ = call(self.base, 'GET', f'/consumer/notifications/poll?since={cursor}&timeout=25', token=token)
+        self.assertEqual(status, 200)
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(body['pollAfter'], events.POLL_INTERVAL)
+
+        # Every SSE slot is still free for staff dashboards
+        taken = 0
+        while events.acquire_stream_slot():
+            taken += 1
+        for _ in range(taken):
+            events.release_stream_slot()
+        self.assertEqual(taken, events.SSE_MAX_STREAMS)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""User search: trigram matches and the LIKE fallback for queries under three characters."""
+import unittest
+
+from tests.support import use_scratch_db
+
+import bff.db
+from bff.services.search import find_users
+
+class UserSearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        use_scratch_db()
+
+    def setUp(self):
+        self.conn = bff.db.get_connection()
+        self.cursor = self.conn.cursor()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def names(self, query, exclude_user_id=''):
+        return [row['name'] for row in find_users(self.cursor, query, exclude_user_id)]
+
+    def test_two_kanji_match_inside_a_name(self):
+        self.assertEqual(self.names('花子'), ['鈴木花子'])
+
+    def test_short_query_matches_email(self):
+        self.assertIn('佐藤健一', self.names('to'))
+
+    def test_short_query_ranks_prefix_first(self):
+        self.assertEqual(self.names('田')[0], '田中太郎')
+
+    def test_like_wildcards_are_literal(self):
+        self.assertEqual(self.names('%'), [])
+        self.assertEqual(self.names('_'), [])
+
+    def test_short_query_folds_kana_width(self):
+        self.assertEqual(self.names('ﾊﾞﾝ'), ['バン'])
+
+    def test_trigram_query_matches_inside_a_name(self):
+        self.assertEqual(self.names('木花子'), ['鈴木花子'])
+
+if __name__ == '__main__':
+    unittest.main()